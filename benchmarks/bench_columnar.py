@@ -0,0 +1,58 @@
+"""Memoria de ride_participations: lista de dicts (json.load) vs. ColumnarTable.
+
+Uso (desde la raiz del repo):
+    python -m benchmarks.bench_columnar
+"""
+import gc
+import json
+import time
+import tracemalloc
+
+from benchmarks.datagen import generate
+from src.utils.columnar import participation_table
+
+PARTICIPATIONS = 1000000
+SEED_USERS = 100000
+
+
+def participations_json(n):
+    # Participaciones de datagen repetidas (con ids nuevos) hasta n, como
+    # texto JSON: cargarlas con json.loads da registros como los de disco,
+    # sin cadenas compartidas.
+    base = generate(SEED_USERS)['ride_participations']
+    items = []
+    while len(items) < n:
+        for participation in base[:n - len(items)]:
+            items.append(dict(participation, id=len(items) + 1))
+    return json.dumps(items)
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    value = build()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, size, elapsed
+
+
+def main():
+    text = participations_json(PARTICIPATIONS)
+    dicts, dicts_bytes, dicts_s = measure(lambda: json.loads(text))
+    table, table_bytes, table_s = measure(lambda: participation_table(json.loads(text)))
+    del dicts
+    start = time.perf_counter()
+    table.to_dicts()
+    export_s = time.perf_counter() - start
+
+    print("%-22s %12s %14s %10s" % ("", "MB", "bytes/record", "build s"))
+    print("%-22s %12.1f %14.1f %10.2f" % ("list of dicts", dicts_bytes / 1e6, dicts_bytes / PARTICIPATIONS, dicts_s))
+    print("%-22s %12.1f %14.1f %10.2f" % ("ColumnarTable", table_bytes / 1e6, table_bytes / PARTICIPATIONS, table_s))
+    print("to_dicts (save): %.2f s" % export_s)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""CPU por poll de GET /usuarios/<alias>/rides/<id>: respuesta completa vs. 304.
+
+Uso (desde la raiz del repo):
+    python -m benchmarks.bench_etag
+"""
+import time
+from unittest.mock import patch
+
+from benchmarks.bench_indexes import build_handler
+from src import controller
+
+PARTICIPANTS = (3, 30, 300)
+POLLS = 500
+
+
+def cpu_per_poll_us(client, url, headers=None):
+    start = time.process_time()
+    for _ in range(POLLS):
+        response = client.get(url, headers=headers)
+    assert response.status_code in (200, 304), response.status_code
+    return (time.process_time() - start) / POLLS * 1e6
+
+
+def main():
+    print("%12s %14s %14s" % ("participants", "full body us", "304 us"))
+    for n in PARTICIPANTS:
+        handler = build_handler(max(1000, n * 4))
+        handler.rides[0]['participants'] = list(range(1, n + 1))
+        handler.rides = handler.rides
+        with patch.object(handler, 'load_users'), patch.object(handler, 'load_rides'), \
+                patch.object(handler, 'load_ride_participations'), \
+                patch.object(handler, 'load_user_stats'), \
+                patch.object(controller, 'data_handler', handler):
+            client = controller.app.test_client()
+            url = '/usuarios/user1/rides/1'
+            etag = client.get(url).headers['ETag']
+            full = cpu_per_poll_us(client, url)
+            cached = cpu_per_poll_us(client, url, {'If-None-Match': etag})
+        print("%12d %14.2f %14.2f" % (n, full, cached))
+
+
+if __name__ == '__main__':
+    main()
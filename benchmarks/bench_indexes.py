@@ -0,0 +1,73 @@
+"""Escalado de las busquedas de DataHandler: indice vs. recorrido lineal.
+
+Uso (desde la raiz del repo):
+    python -m benchmarks.bench_indexes
+"""
+import random
+import time
+from unittest.mock import patch
+
+from src.data_handler import DataHandler
+
+SIZES = (1000, 10000, 100000)
+LOOKUPS = 2000
+
+
+def build_handler(n_users, seed=0):
+    rng = random.Random(seed)
+    # Sin cache de detalles: se mide get_ride_details, no aciertos del LRU.
+    handler = DataHandler(detail_cache=0)
+    users = [{"id": i, "alias": "user%d" % i, "name": "User %d" % i,
+              "carPlate": "P-%d" % i, "rides": []} for i in range(1, n_users + 1)]
+    rides = []
+    participations = []
+    for ride_id in range(1, n_users // 4 + 1):
+        participants = rng.sample(range(1, n_users + 1), 3)
+        rides.append({"id": ride_id, "rideDateAndTime": "2025-07-20 08:00", "finalAddress": "UTEC",
+                      "allowedSpaces": 4, "rideDriver": rng.randint(1, n_users), "status": "Ready",
+                      "participants": participants})
+        for user_id in participants:
+            participation_id = len(participations) + 1
+            participations.append({"id": participation_id, "confirmation": "15-07-25",
+                                   "destination": "UTEC", "occupiedSpaces": 1,
+                                   "status": rng.choice(("Pendiente", "Aceptada", "Rechazada")),
+                                   "rideId": ride_id})
+            users[user_id - 1]["rides"].append(participation_id)
+    handler.users = users
+    handler.rides = rides
+    handler.ride_participations = participations
+    return handler
+
+
+def per_call_us(fn, args):
+    start = time.perf_counter()
+    for a in args:
+        fn(*a)
+    return (time.perf_counter() - start) / len(args) * 1e6
+
+
+def linear_scan(items, attribute, value):
+    for item in items:
+        if item.get(attribute) == value:
+            return item
+    return None
+
+
+def main():
+    rng = random.Random(1)
+    print("%8s %14s %14s %14s" % ("users", "scan alias us", "index alias us", "ride details us"))
+    for n in SIZES:
+        handler = build_handler(n)
+        aliases = [("alias", "user%d" % rng.randint(1, n)) for _ in range(LOOKUPS)]
+        ride_ids = [("x", rng.randint(1, n // 4)) for _ in range(LOOKUPS)]
+        with patch.object(handler, 'load_users'), patch.object(handler, 'load_rides'), \
+                patch.object(handler, 'load_ride_participations'), \
+                patch.object(handler, 'load_user_stats'):
+            scan = per_call_us(lambda a, v: linear_scan(handler.users, a, v), aliases[:200])
+            indexed = per_call_us(handler.get_user_by_attribute, aliases)
+            details = per_call_us(handler.get_ride_details, ride_ids)
+        print("%8d %14.2f %14.2f %14.2f" % (n, scan, indexed, details))
+
+
+if __name__ == '__main__':
+    main()
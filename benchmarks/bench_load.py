@@ -0,0 +1,123 @@
+"""Carga sobre los endpoints de Flask (test client, sin red): throughput y p50/p95/p99 por ruta.
+
+Uso (desde la raiz del repo):
+    python -m benchmarks.bench_load --scale 100k --requests 5000 --threads 8
+"""
+import argparse
+import random
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+
+from benchmarks.bench_methods import open_handler
+from benchmarks.datagen import ADDRESSES, SCALES, generate, write_dataset
+from benchmarks.results import print_table, summarize
+from src import controller
+
+DEFAULT_REQUESTS = 2000
+DEFAULT_THREADS = 4
+# (ruta, peso): mezcla de trafico dominada por lecturas, como en produccion.
+MIX = (
+    ('GET /usuarios?limit=100', 5),
+    ('GET /usuarios/<alias>', 20),
+    ('GET /usuarios/<alias>/rides', 20),
+    ('GET /usuarios/<alias>/rides/<ride_id>', 25),
+    ('GET /rides', 15),
+    ('POST /usuarios/<alias>/rides/<ride_id>/requestToJoin/<alias2>', 10),
+    ('POST /usuarios/<alias>/rides/<ride_id>/accept/<alias2>', 5),
+)
+
+
+def plan(dataset, n_requests, seed=0):
+    # Lista de (ruta, metodo, url) generada de antemano: el tiempo de armar
+    # los requests no entra en la medicion.
+    rng = random.Random(seed)
+    users = dataset['users']
+    rides = dataset['rides']
+    routes = [route for route, _ in MIX]
+    weights = [weight for _, weight in MIX]
+    requests = []
+    for route in rng.choices(routes, weights, k=n_requests):
+        user = rng.choice(users)
+        ride = rng.choice(rides)
+        driver = 'user%d' % ride['rideDriver']
+        if route == 'GET /usuarios?limit=100':
+            url = '/usuarios?limit=100&after=%d' % rng.randint(0, len(users))
+        elif route == 'GET /usuarios/<alias>':
+            url = '/usuarios/%s' % user['alias']
+        elif route == 'GET /usuarios/<alias>/rides':
+            url = '/usuarios/%s/rides' % user['alias']
+        elif route == 'GET /usuarios/<alias>/rides/<ride_id>':
+            url = '/usuarios/%s/rides/%d' % (driver, ride['id'])
+        elif route == 'GET /rides':
+            url = '/rides?from=%s&destination=%s&minSeats=1&limit=20' % (
+                ride['rideDateAndTime'].replace(' ', 'T'), rng.choice(ADDRESSES).split()[0])
+        elif route.startswith('POST /usuarios/<alias>/rides/<ride_id>/requestToJoin'):
+            url = '/usuarios/%s/rides/%d/requestToJoin/%s' % (driver, ride['id'], user['alias'])
+        else:
+            passenger = 'user%d' % ride['participants'][0] if ride['participants'] else user['alias']
+            url = '/usuarios/%s/rides/%d/accept/%s' % (driver, ride['id'], passenger)
+        requests.append((route, route.split()[0], url))
+    return requests
+
+
+def run(handler, requests, threads=DEFAULT_THREADS):
+    # Reparte los requests entre `threads` hilos, cada uno con su cliente.
+    # El throughput de cada ruta es su cantidad sobre el tiempo total de la
+    # corrida; los 5xx se cuentan aparte como errores.
+    samples = {route: [] for route, _ in MIX}
+    errors = {route: 0 for route, _ in MIX}
+    lock = threading.Lock()
+
+    def worker(chunk):
+        client = controller.app.test_client()
+        local = []
+        for route, method, url in chunk:
+            start = time.perf_counter()
+            # Cerrar la respuesta devuelve el lugar de admision de las que
+            # van en streaming (como hace el servidor WSGI al terminar).
+            with client.open(url, method=method) as response:
+                response.get_data()
+            local.append((route, time.perf_counter() - start, response.status_code))
+        with lock:
+            for route, elapsed, status in local:
+                samples[route].append(elapsed)
+                if status >= 500:
+                    errors[route] += 1
+
+    with patch.object(controller, 'data_handler', handler):
+        workers = [threading.Thread(target=worker, args=(requests[i::threads],)) for i in range(threads)]
+        start = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+    results = {}
+    for route, route_samples in samples.items():
+        if route_samples:
+            results[route] = dict(summarize(route_samples, elapsed), errors=errors[route])
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', default='1k', choices=SCALES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--requests', type=int, default=DEFAULT_REQUESTS)
+    parser.add_argument('--threads', type=int, default=DEFAULT_THREADS)
+    parser.add_argument('--persistence', default='journal', choices=('json', 'journal'))
+    args = parser.parse_args(argv)
+
+    dataset = generate(SCALES[args.scale], args.seed)
+    data_dir = tempfile.mkdtemp()
+    write_dataset(data_dir, dataset)
+    handler = open_handler(data_dir, args.persistence)
+    print_table(f"Endpoints ({args.scale}, {args.threads} hilos)",
+                run(handler, plan(dataset, args.requests, args.seed), args.threads))
+
+
+if __name__ == '__main__':
+    main()
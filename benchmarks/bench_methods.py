@@ -0,0 +1,124 @@
+"""Micro-benchmarks de cada metodo publico de DataHandler sobre datos sinteticos.
+
+Uso (desde la raiz del repo):
+    python -m benchmarks.bench_methods --scale 100k
+"""
+import argparse
+import random
+import tempfile
+import time
+
+from benchmarks.datagen import ADDRESSES, SCALES, generate, write_dataset
+from benchmarks.results import print_table, summarize
+from src.data_handler import DataHandler
+from src.utils.ride_search import parse_ride_time
+
+DEFAULT_ITERATIONS = 500
+
+
+def open_handler(data_dir, persistence='journal'):
+    # 'journal' por defecto: en modo 'json' cada mutacion reescribe la
+    # coleccion completa y a escala 1m eso domina cualquier otra medicion.
+    return DataHandler(data_dir=data_dir, persistence=persistence)
+
+
+def _owners(dataset):
+    return {participation_id: user['id']
+            for user in dataset['users'] for participation_id in user['rides']}
+
+
+def workloads(dataset, iterations, seed=0):
+    # (nombre, metodo, [args]) en el orden en que se ejecutan: primero las
+    # lecturas y despues las escrituras, cada escritura sobre participaciones
+    # distintas para que ninguna encuentre el trabajo ya hecho por otra.
+    rng = random.Random(seed)
+    users = dataset['users']
+    rides = dataset['rides']
+    participations = dataset['ride_participations']
+    owners = _owners(dataset)
+    alias = lambda user_id: 'user%d' % user_id
+
+    def pick(items, k):
+        return rng.sample(items, min(k, len(items)))
+
+    some_users = [rng.choice(users) for _ in range(iterations)]
+    some_rides = [rng.choice(rides) for _ in range(iterations)]
+    by_ride = {}
+    for participation in participations:
+        by_ride.setdefault(participation['rideId'], []).append(participation)
+    # Participaciones disjuntas para accept / reject / decide / unload.
+    shuffled = pick(participations, 4 * iterations)
+    quarter = len(shuffled) // 4
+    accepts, rejects, decides, unloads = (shuffled[i * quarter:(i + 1) * quarter] for i in range(4))
+
+    def decision_args(participation):
+        ride = rides[participation['rideId'] - 1]
+        decisions = [{'alias': alias(owners[p['id']]), 'decision': rng.choice(('accept', 'reject'))}
+                     for p in by_ride[ride['id']]]
+        return alias(ride['rideDriver']), ride['id'], decisions
+
+    def join_args(ride):
+        passenger = rng.randint(1, len(users))
+        while passenger == ride['rideDriver'] or passenger in ride['participants']:
+            passenger = rng.randint(1, len(users))
+        return alias(ride['rideDriver']), ride['id'], alias(passenger)
+
+    def owner_args(participation):
+        ride = rides[participation['rideId'] - 1]
+        return alias(ride['rideDriver']), ride['id'], alias(owners[participation['id']])
+
+    return [
+        ('get_user_by_attribute', [('alias', u['alias']) for u in some_users]),
+        ('get_ride_by_attribute', [('id', r['id']) for r in some_rides]),
+        ('get_ride_participation_by_attribute', [('id', p['id']) for p in pick(participations, iterations)]),
+        ('get_all_users', [()] * max(1, iterations // 50)),
+        ('get_users_page', [(100, rng.randint(0, len(users))) for _ in range(iterations)]),
+        ('get_rides_of_user', [(u['alias'],) for u in some_users]),
+        ('get_rides_of_user_page', [(u['alias'], 20) for u in some_users]),
+        ('get_ride_summaries_of_user_page', [(u['alias'], 20) for u in some_users]),
+        ('get_ride_details', [(alias(r['rideDriver']), r['id']) for r in some_rides]),
+        ('get_user_version', [(u['alias'],) for u in some_users]),
+        ('get_ride_version', [(r['id'],) for r in some_rides]),
+        ('search_rides', [(parse_ride_time(r['rideDateAndTime']), None, rng.choice(ADDRESSES), 1, 20) for r in some_rides]),
+        ('request_to_join_ride', [join_args(r) for r in some_rides]),
+        ('accept_ride_request', [owner_args(p) for p in accepts]),
+        ('reject_ride_request', [owner_args(p) for p in rejects]),
+        ('decide_ride_requests', [decision_args(p) for p in decides]),
+        ('start_ride', [(alias(r['rideDriver']), r['id']) for r in some_rides]),
+        ('end_ride', [(alias(r['rideDriver']), r['id']) for r in some_rides]),
+        ('unload_participant', [(alias(owners[p['id']]), p['rideId']) for p in unloads]),
+    ]
+
+
+def run(handler, dataset, iterations=DEFAULT_ITERATIONS, seed=0):
+    results = {}
+    for name, calls in workloads(dataset, iterations, seed):
+        method = getattr(handler, name)
+        samples = []
+        start = time.perf_counter()
+        for args in calls:
+            call_start = time.perf_counter()
+            method(*args)
+            samples.append(time.perf_counter() - call_start)
+        results[name] = summarize(samples, time.perf_counter() - start)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', default='1k', choices=SCALES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument('--persistence', default='journal', choices=('json', 'journal'))
+    args = parser.parse_args(argv)
+
+    dataset = generate(SCALES[args.scale], args.seed)
+    data_dir = tempfile.mkdtemp()
+    write_dataset(data_dir, dataset)
+    handler = open_handler(data_dir, args.persistence)
+    print_table(f"DataHandler ({args.scale}, {args.persistence})",
+                run(handler, dataset, args.iterations, args.seed))
+
+
+if __name__ == '__main__':
+    main()
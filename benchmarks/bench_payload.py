@@ -0,0 +1,77 @@
+"""Bytes y latencia de respuestas grandes: completas, con ?fields= y comprimidas.
+
+Uso (desde la raiz del repo):
+    python -m benchmarks.bench_payload --scale 100k
+"""
+import argparse
+import tempfile
+import time
+from unittest.mock import patch
+
+from benchmarks.datagen import SCALES, generate, write_dataset
+from benchmarks.results import summarize
+from src import controller
+from src.data_handler import DataHandler
+
+DEFAULT_ITERATIONS = 200
+
+# (nombre, url) de cada consulta; {alias} y {ride} se completan con el ride
+# con mas pasajeros del dataset.
+QUERIES = (
+    ('users page', '/usuarios?limit=1000'),
+    ('users page ?fields=alias', '/usuarios?limit=1000&fields=alias'),
+    ('ride details', '/usuarios/{alias}/rides/{ride}'),
+    ('ride details ?fields=status,participants.participant.alias',
+     '/usuarios/{alias}/rides/{ride}?fields=status,participants.participant.alias'),
+)
+ENCODINGS = ('identity', 'gzip')
+# El listado completo en streaming se mide aparte: una sola vez por variante.
+FULL_LIST = ('all users', '/usuarios')
+
+
+def measure(client, url, encoding, iterations):
+    # El primer request arma lo que se construye una sola vez (user_stats).
+    # Las respuestas se cierran: las que van en streaming devuelven ahi su
+    # lugar de admision.
+    with client.get(url):
+        pass
+    samples = []
+    size = 0
+    for _ in range(iterations):
+        start = time.perf_counter()
+        with client.get(url, headers={'Accept-Encoding': encoding}) as response:
+            size = len(response.get_data())
+        samples.append(time.perf_counter() - start)
+        assert response.status_code == 200, (url, response.status_code)
+    return size, summarize(samples)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', default='1k', choices=SCALES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS)
+    args = parser.parse_args(argv)
+
+    dataset = generate(SCALES[args.scale], args.seed)
+    data_dir = tempfile.mkdtemp()
+    write_dataset(data_dir, dataset)
+    # Sin cache de detalles: se mide lo que cuesta armar cada respuesta.
+    handler = DataHandler(data_dir=data_dir, persistence='journal', detail_cache=0)
+    ride = max(dataset['rides'], key=lambda ride: len(ride['participants']))
+    alias = 'user%d' % ride['rideDriver']
+
+    print(f"Payloads ({args.scale})")
+    print("  %-64s %-9s %12s %10s %10s" % ("", "encoding", "bytes", "p50 us", "p95 us"))
+    with patch.object(controller, 'data_handler', handler):
+        client = controller.app.test_client()
+        queries = [(name, url, args.iterations) for name, url in QUERIES] + [FULL_LIST + (3,)]
+        for name, url, iterations in queries:
+            url = url.format(alias=alias, ride=ride['id'])
+            for encoding in ENCODINGS:
+                size, row = measure(client, url, encoding, iterations)
+                print("  %-64s %-9s %12d %10.1f %10.1f" % (name, encoding, size, row['p50_us'], row['p95_us']))
+
+
+if __name__ == '__main__':
+    main()
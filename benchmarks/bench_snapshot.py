@@ -0,0 +1,62 @@
+"""Tiempo de arranque de DataHandler: archivos JSON vs. snapshots binarios.
+
+Uso (desde la raiz del repo):
+    python -m benchmarks.bench_snapshot
+"""
+import os
+import tempfile
+import time
+
+from benchmarks.bench_indexes import build_handler
+from src.data_handler import DataHandler
+from src.storage import COLLECTIONS, JsonBackend, SnapshotBackend
+from src.storage.base import materialize
+
+SIZES = (10000, 100000)
+RUNS = 3
+
+
+def write_dataset(n_users):
+    data_dir = tempfile.mkdtemp()
+    handler = build_handler(n_users)
+    handler.user_stats
+    json_backend = JsonBackend(data_dir)
+    snapshot_backend = SnapshotBackend(data_dir)
+    for collection in COLLECTIONS:
+        # Como DataHandler al escribir: las tablas columnares salen como dicts.
+        getattr(handler, collection)
+        items = materialize(handler._export(collection)[0])
+        json_backend.save(collection, items, {}, rewrite=True)
+        snapshot_backend.save(collection, items, {}, rewrite=True)
+    return data_dir
+
+
+def startup_ms(make_backend, lazy=False):
+    best = None
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        handler = DataHandler(backend=make_backend(), lazy=lazy)
+        handler.get_user_by_attribute('alias', 'user1')
+        elapsed = (time.perf_counter() - start) * 1e3
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def file_mb(data_dir, suffix):
+    return sum(os.path.getsize(os.path.join(data_dir, name))
+               for name in os.listdir(data_dir) if name.endswith(suffix)) / 1e6
+
+
+def main():
+    print("%8s %10s %12s %12s %14s" % ("users", "json ms", "snapshot ms", "lazy ms", "json/snap MB"))
+    for n in SIZES:
+        data_dir = write_dataset(n)
+        json_ms = startup_ms(lambda: JsonBackend(data_dir))
+        snapshot_ms = startup_ms(lambda: SnapshotBackend(data_dir))
+        lazy_ms = startup_ms(lambda: SnapshotBackend(data_dir), lazy=True)
+        sizes = "%.1f/%.1f" % (file_mb(data_dir, '.json'), file_mb(data_dir, '.snap'))
+        print("%8d %10.1f %12.1f %12.1f %14s" % (n, json_ms, snapshot_ms, lazy_ms, sizes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Generador determinista de datos sinteticos (usuarios, rides, participaciones).
+
+Uso (desde la raiz del repo):
+    python -m benchmarks.datagen --scale 100k --out /tmp/ef_is_100k
+"""
+import argparse
+import random
+from datetime import datetime, timedelta
+
+from src.storage import COLLECTIONS, JsonBackend
+
+SCALES = {'1k': 1000, '100k': 100000, '1m': 1000000}
+
+ADDRESSES = [
+    "Universidad Central - Campus Norte", "Universidad Central - Campus Sur", "UTEC - Barranco",
+    "Jockey Plaza", "Miraflores - Parque Kennedy", "San Isidro - Centro Financiero",
+    "Surco - Monterrico", "La Molina - Av. Javier Prado", "Lima Centro - Plaza San Martin",
+    "Aeropuerto Jorge Chavez", "Callao - La Punta", "Chorrillos - Malecon",
+    "San Borja - Av. Aviacion", "Magdalena - Costa Verde", "Pueblo Libre - Plaza Bolivar",
+    "Jesus Maria - Campo de Marte", "Los Olivos - Mega Plaza", "Ate - Real Plaza Puruchuco",
+]
+START = datetime(2025, 1, 1)
+DAYS = 180
+# Proporcion de usuarios que manejan y de rides por usuario.
+DRIVER_RATIO = 0.2
+RIDES_PER_USER = 0.5
+PAST_STATUSES = (('Aceptada', 70), ('Rechazada', 15), ('Missing', 10), ('NotMarked', 5))
+UPCOMING_STATUSES = (('Pendiente', 60), ('Aceptada', 30), ('Rechazada', 10))
+
+
+def _weighted(rng, choices):
+    total = sum(weight for _, weight in choices)
+    point = rng.random() * total
+    for value, weight in choices:
+        point -= weight
+        if point < 0:
+            return value
+    return choices[-1][0]
+
+
+def generate(n_users, seed=0, now=START + timedelta(days=DAYS // 2)):
+    # Cada ride lleva entre 0 y allowedSpaces pasajeros. Los pasajeros se
+    # eligen con sesgo hacia los primeros ids, asi unos pocos usuarios
+    # acumulan historiales largos y la mayoria pocos viajes. Las
+    # participaciones de rides pasados estan cerradas; las futuras, pendientes.
+    rng = random.Random(seed)
+    users = [{"id": i, "alias": "user%d" % i, "name": "User %d" % i, "carPlate": "P-%06d" % i,
+              "rides": []} for i in range(1, n_users + 1)]
+    n_drivers = max(1, int(n_users * DRIVER_RATIO))
+    rides = []
+    participations = []
+    for ride_id in range(1, int(n_users * RIDES_PER_USER) + 1):
+        when = START + timedelta(minutes=15 * rng.randrange(DAYS * 24 * 4))
+        driver_id = rng.randint(1, n_drivers)
+        allowed = rng.randint(2, 5)
+        ride = {"id": ride_id, "rideDateAndTime": when.strftime('%Y-%m-%d %H:%M'),
+                "finalAddress": rng.choice(ADDRESSES), "allowedSpaces": allowed,
+                "rideDriver": driver_id, "status": 'Finalizada' if when < now else 'Ready',
+                "participants": []}
+        rides.append(ride)
+        statuses = PAST_STATUSES if when < now else UPCOMING_STATUSES
+        for _ in range(rng.randint(0, allowed)):
+            passenger_id = 1 + int(n_users * rng.random() ** 2)
+            if passenger_id == driver_id or passenger_id in ride['participants']:
+                continue
+            participation_id = len(participations) + 1
+            participations.append({
+                "id": participation_id,
+                "confirmation": (when - timedelta(days=rng.randint(0, 7))).strftime('%d-%m-%y'),
+                "destination": ride['finalAddress'],
+                "occupiedSpaces": 1,
+                "status": _weighted(rng, statuses),
+                "rideId": ride_id,
+            })
+            ride['participants'].append(passenger_id)
+            users[passenger_id - 1]['rides'].append(participation_id)
+    return {'users': users, 'rides': rides, 'ride_participations': participations, 'user_stats': []}
+
+
+def write_dataset(data_dir, dataset, backend_class=JsonBackend):
+    backend = backend_class(data_dir)
+    for collection in COLLECTIONS:
+        backend.save(collection, dataset[collection], {}, rewrite=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', default='1k', choices=SCALES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', required=True, help="directorio de datos a escribir")
+    args = parser.parse_args(argv)
+
+    dataset = generate(SCALES[args.scale], args.seed)
+    write_dataset(args.out, dataset)
+    for collection in COLLECTIONS:
+        print(f"{collection}: {len(dataset[collection])}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Resumen de latencias y comparacion de resultados contra un baseline."""
+import json
+import math
+
+# Percentil a comparar y margen tolerado antes de marcar una regresion.
+COMPARE_METRIC = 'p50_us'
+DEFAULT_TOLERANCE = 0.25
+
+
+def percentile(ordered, fraction):
+    # Nearest-rank sobre una lista ya ordenada.
+    if not ordered:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(samples, elapsed=None):
+    # samples: latencias en segundos; elapsed: tiempo de pared total de la
+    # corrida (por defecto, la suma de las latencias).
+    ordered = sorted(samples)
+    elapsed = sum(ordered) if elapsed is None else elapsed
+    return {
+        'count': len(ordered),
+        'ops_per_s': round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+        'p50_us': round(percentile(ordered, 0.50) * 1e6, 1),
+        'p95_us': round(percentile(ordered, 0.95) * 1e6, 1),
+        'p99_us': round(percentile(ordered, 0.99) * 1e6, 1),
+    }
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE, metric=COMPARE_METRIC):
+    # Devuelve [(seccion, nombre, antes, ahora)] de lo que empeoro mas que
+    # `tolerance` (0.25 = 25%). Lo que no esta en ambos lados se ignora.
+    regressions = []
+    for section in ('methods', 'routes'):
+        current = results.get(section, {})
+        for name, before in baseline.get(section, {}).items():
+            if name not in current or not before.get(metric):
+                continue
+            now = current[name][metric]
+            if now > before[metric] * (1 + tolerance):
+                regressions.append((section, name, before[metric], now))
+    return regressions
+
+
+def load(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def dump(path, results):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def print_table(title, rows):
+    print(title)
+    print("  %-64s %8s %10s %10s %10s %10s %7s" % (
+        "", "count", "ops/s", "p50 us", "p95 us", "p99 us", "errors"))
+    for name, row in rows.items():
+        print("  %-64s %8d %10.1f %10.1f %10.1f %10.1f %7s" % (
+            name, row['count'], row['ops_per_s'], row['p50_us'], row['p95_us'], row['p99_us'],
+            row.get('errors', '-')))
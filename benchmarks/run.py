@@ -0,0 +1,80 @@
+"""Corre los micro-benchmarks y la carga de endpoints, guarda JSON y compara contra un baseline.
+
+Uso (desde la raiz del repo):
+    python -m benchmarks.run --scale 100k --output results.json
+    python -m benchmarks.run --scale 100k --baseline benchmarks/baseline.json
+    python -m benchmarks.run --scale 1k --output benchmarks/baseline.json   # nuevo baseline
+
+Sale con codigo 1 si alguna metrica p50 empeoro mas que --tolerance.
+"""
+import argparse
+import platform
+import sys
+import tempfile
+import time
+
+from benchmarks import bench_load, bench_methods
+from benchmarks.datagen import SCALES, generate, write_dataset
+from benchmarks.results import DEFAULT_TOLERANCE, compare, dump, load, print_table
+
+
+def run(scale='1k', seed=0, iterations=bench_methods.DEFAULT_ITERATIONS,
+        requests=bench_load.DEFAULT_REQUESTS, threads=bench_load.DEFAULT_THREADS,
+        persistence='journal'):
+    # Cada parte corre sobre su propia copia de los datos: las escrituras de
+    # los micro-benchmarks no cambian lo que ve la carga de endpoints.
+    dataset = generate(SCALES[scale], seed)
+    methods_dir, load_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+    write_dataset(methods_dir, dataset)
+    write_dataset(load_dir, dataset)
+    load_plan = bench_load.plan(dataset, requests, seed)
+    methods = bench_methods.run(bench_methods.open_handler(methods_dir, persistence),
+                                dataset, iterations, seed)
+    routes = bench_load.run(bench_methods.open_handler(load_dir, persistence), load_plan, threads)
+    return {
+        'meta': {
+            'scale': scale, 'seed': seed, 'iterations': iterations, 'requests': requests,
+            'threads': threads, 'persistence': persistence, 'python': platform.python_version(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'methods': methods,
+        'routes': routes,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', default='1k', choices=SCALES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--iterations', type=int, default=bench_methods.DEFAULT_ITERATIONS)
+    parser.add_argument('--requests', type=int, default=bench_load.DEFAULT_REQUESTS)
+    parser.add_argument('--threads', type=int, default=bench_load.DEFAULT_THREADS)
+    parser.add_argument('--persistence', default='journal', choices=('json', 'journal'))
+    parser.add_argument('--output', help="archivo JSON donde guardar los resultados")
+    parser.add_argument('--baseline', help="resultados JSON previos contra los que comparar")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="empeoramiento tolerado del p50 (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    results = run(args.scale, args.seed, args.iterations, args.requests, args.threads,
+                  args.persistence)
+    print_table(f"DataHandler ({args.scale}, {args.persistence})", results['methods'])
+    print_table(f"Endpoints ({args.scale}, {args.threads} hilos)", results['routes'])
+    if args.output:
+        dump(args.output, results)
+
+    if args.baseline:
+        baseline = load(args.baseline)
+        if baseline.get('meta', {}).get('scale') != args.scale:
+            print(f"Aviso: el baseline es de escala {baseline.get('meta', {}).get('scale')}")
+        regressions = compare(results, baseline, args.tolerance)
+        for section, name, before, now in regressions:
+            print(f"REGRESION {section} {name}: p50 {before:.1f} us -> {now:.1f} us")
+        if regressions:
+            return 1
+        print("Sin regresiones")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
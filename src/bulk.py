@@ -0,0 +1,55 @@
+"""Importa y exporta usuarios, rides y participaciones en NDJSON.
+
+Uso (desde la raiz del repo, con el servidor detenido o en modo
+EF_IS_MULTIPROCESS=1):
+    python -m src.bulk export --data-dir src/data > campus.ndjson
+    python -m src.bulk import --data-dir src/data < campus.ndjson
+"""
+import argparse
+import sys
+
+from .data_handler import DataHandler
+from .utils.bulk import BATCH_SIZE, BULK_COLLECTIONS, to_line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=('import', 'export'))
+    parser.add_argument('--data-dir', default='src/data')
+    parser.add_argument('--file', help="archivo NDJSON (por defecto stdin/stdout)")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--collections', default=','.join(BULK_COLLECTIONS),
+                        help="colecciones a exportar, separadas por comas")
+    args = parser.parse_args(argv)
+
+    data_handler = DataHandler(data_dir=args.data_dir, lazy=True)
+    if args.command == 'export':
+        requested = set(args.collections.split(','))
+        if not requested <= set(BULK_COLLECTIONS):
+            parser.error(f"unknown collection in {args.collections}")
+        collections = [collection for collection in BULK_COLLECTIONS if collection in requested]
+        out = open(args.file, 'w') if args.file else sys.stdout
+        try:
+            for collection, record in data_handler.export_records(collections):
+                out.write(to_line(collection, record))
+        finally:
+            if args.file:
+                out.close()
+        return 0
+
+    source = open(args.file, 'r') if args.file else sys.stdin
+    try:
+        result = data_handler.bulk_import(source, args.batch_size)
+    finally:
+        if args.file:
+            source.close()
+    for collection, count in result['imported'].items():
+        print(f"{collection}: {count}")
+    print(f"failed: {result['failed']}")
+    for error in result['errors']:
+        print(f"line {error['line']}: {error['error']}", file=sys.stderr)
+    return 1 if result['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
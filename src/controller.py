@@ -1,60 +1,457 @@
-from flask import Flask, jsonify
-from data_handler import DataHandler
+import json
+import os
+import signal
+import sys
+import time
+from datetime import datetime
+
+from flask import Flask, Response, g, jsonify
 from flask import request
 
+try:
+    from .data_handler import DataHandler
+    from .utils.admission import AdmissionController, Overloaded
+    from .utils.bulk import BATCH_SIZE, BULK_COLLECTIONS, MAX_BATCH_SIZE, to_line
+    from .utils.compression import COMPRESSIBLE, Compressor
+    from .utils.fields import RIDE_DETAIL_FIELDS, USER_FIELDS, parse_fields, project
+    from .utils.metrics import REGISTRY, Counter, Gauge
+    from .utils.profiler import PROFILE_HEADER, RequestProfiler
+except ImportError:
+    from data_handler import DataHandler
+    from utils.admission import AdmissionController, Overloaded
+    from utils.bulk import BATCH_SIZE, BULK_COLLECTIONS, MAX_BATCH_SIZE, to_line
+    from utils.compression import COMPRESSIBLE, Compressor
+    from utils.fields import RIDE_DETAIL_FIELDS, USER_FIELDS, parse_fields, project
+    from utils.metrics import REGISTRY, Counter, Gauge
+    from utils.profiler import PROFILE_HEADER, RequestProfiler
+
 app = Flask(__name__)
 data_handler = DataHandler()
 
+# Tamaño maximo de pagina para ?limit= y de cada bloque de las respuestas
+# en streaming.
+MAX_PAGE_SIZE = 1000
+STREAM_PAGE_SIZE = 500
+
+# Segundos sin eventos tras los que el stream de eventos manda un comentario:
+# mantiene viva la conexion y deja notar que el cliente se fue.
+EVENTS_KEEPALIVE = 15
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    'ef_is_http_request_seconds', 'Time to build each HTTP response',
+    ('method', 'route', 'status'))
+ADMISSION_WAIT_SECONDS = REGISTRY.histogram(
+    'ef_is_admission_wait_seconds', 'Time admitted requests spent queued for a slot', ('class',))
+
+# Rutas fuera del control de admision: el monitoreo tiene que responder
+# justamente cuando hay sobrecarga.
+ADMISSION_EXEMPT = ('/metrics',)
+
 class TaskController:
     def __init__(self, data_handler):
         self.data_handler = data_handler
 
+def page_args():
+    # (limit, after) de ?limit=&after=<id>, o None si no se pidio paginacion.
+    limit = request.args.get('limit')
+    after = request.args.get('after')
+    if limit is None and after is None:
+        return None
+    limit = MAX_PAGE_SIZE if limit is None else int(limit)
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    return min(limit, MAX_PAGE_SIZE), None if after is None else int(after)
+
+def date_arg(name):
+    # datetime de ?<name>= (ISO), o None si no vino. rideDateAndTime no tiene
+    # zona horaria: una fecha con offset no se puede comparar y es ValueError.
+    value = request.args.get(name)
+    if not value:
+        return None
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        raise ValueError(f"{name} must not have a UTC offset")
+    return moment
+
+def etag_for(version):
+    # Los contadores de version son de este proceso: el ETag lleva el id de
+    # la instancia para que otro worker nunca responda 304 por error.
+    if version is None:
+        return None
+    return '%s-%d' % (data_handler.instance_id, version)
+
+def with_etag(response, etag):
+    if etag is not None:
+        response.set_etag(etag)
+    return response
+
+def not_modified(etag):
+    # Comparacion debil: las respuestas comprimidas llevan el ETag como W/.
+    if etag is None or not request.if_none_match.contains_weak(etag):
+        return None
+    return with_etag(Response(status=304), etag)
+
+def fields_arg(schema):
+    # Arbol de ?fields=a,b.c validado contra schema (utils/fields.py), o None.
+    return parse_fields(request.args.get('fields'), schema)
+
+def stream_json_array(first_page, fetch_page):
+    # Envia el arreglo por bloques de pagina: la memoria no crece con el
+    # total de registros. fetch_page(cursor) devuelve (items, proximo cursor).
+    def generate():
+        items, cursor = first_page
+        yield '['
+        separator = ''
+        while True:
+            if items:
+                yield separator + ','.join(json.dumps(item) for item in items)
+                separator = ','
+            if cursor is None:
+                break
+            items, cursor = fetch_page(cursor)
+        yield ']'
+    return Response(generate(), mimetype='application/json')
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    # Se etiqueta con el patron de la ruta (/usuarios/<alias>), no con la URL,
+    # para que la cantidad de series no crezca con los usuarios. En las
+    # respuestas en streaming no incluye el envio del cuerpo.
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else '<unmatched>'
+        REQUEST_SECONDS.observe(time.perf_counter() - start,
+                                (request.method, route, str(response.status_code)))
+    return response
+
+# Profiler opcional (EF_IS_PROFILE=1 o EF_IS_PROFILE_TOKEN + header). Sin
+# configurar, los hooks solo comparan profiler con None.
+profiler = RequestProfiler.from_env()
+
+@app.before_request
+def start_profile():
+    if profiler is None:
+        return
+    profile, keep_anyway = profiler.wanted(request.headers.get(PROFILE_HEADER))
+    if profile:
+        g.profile = profiler.start()
+        g.profile_keep = keep_anyway
+
+@app.after_request
+def finish_profile(response):
+    started = g.pop('profile', None)
+    if started is not None:
+        path = profiler.finish(started, {
+            'method': request.method,
+            'route': request.url_rule.rule if request.url_rule else None,
+            'path': request.path,
+            'viewArgs': request.view_args or {},
+            'args': request.args.to_dict(flat=False),
+            'status': response.status_code,
+        }, g.pop('profile_keep', False))
+        if path:
+            response.headers['X-EF-IS-Profile-File'] = os.path.basename(path)
+    return response
+
+# Control de admision (EF_IS_ADMISSION=0 lo desactiva): cantidad limitada de
+# requests en curso por clase de ruta, con una cola corta; con sobrecarga se
+# responde 503 con Retry-After en lugar de encolar hasta el timeout.
+admission = AdmissionController.from_env()
+
+def route_class():
+    rule = request.url_rule
+    if rule is None or rule.rule in ADMISSION_EXEMPT:
+        return None
+    if rule.rule.endswith('/events'):
+        return 'stream'
+    return 'read' if request.method in ('GET', 'HEAD') else 'write'
+
+@app.before_request
+def admit_request():
+    if admission is None:
+        return None
+    name = route_class()
+    if name is None:
+        return None
+    limiter = admission.limiters[name]
+    try:
+        admitted_at, waited = limiter.acquire()
+    except Overloaded as e:
+        response = jsonify({"error": "Service overloaded, retry later"})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+    ADMISSION_WAIT_SECONDS.observe(waited, (name,))
+    g.admission = (limiter, admitted_at)
+    return None
+
+@app.after_request
+def hand_off_admission(response):
+    # Con el cuerpo ya armado el lugar se libera aqui; en las respuestas en
+    # streaming, recien al cerrarse (cuando se termino de enviar).
+    ticket = g.pop('admission', None)
+    if ticket is not None:
+        limiter, admitted_at = ticket
+        if response.is_streamed:
+            response.call_on_close(lambda: limiter.release(admitted_at))
+        else:
+            limiter.release(admitted_at)
+    return response
+
+@app.teardown_request
+def release_admission(exc):
+    # Requests que terminaron en una excepcion sin pasar por after_request.
+    ticket = g.pop('admission', None)
+    if ticket is not None:
+        limiter, admitted_at = ticket
+        limiter.release(admitted_at)
+
+# Compresion gzip/deflate negociada con Accept-Encoding
+# (EF_IS_COMPRESSION=0 la desactiva). Se registra despues del control de
+# admision para correr antes que hand_off_admission: comprimir es parte del
+# request.
+compressor = Compressor.from_env()
+
+@app.after_request
+def compress_response(response):
+    if compressor is None or response.mimetype not in COMPRESSIBLE:
+        return response
+    response.vary.add('Accept-Encoding')
+    if response.status_code != 200 or 'Content-Encoding' in response.headers:
+        return response
+    encoding = compressor.choose(request.accept_encodings)
+    if encoding is None:
+        return response
+    if response.is_streamed:
+        response.response = compressor.stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < compressor.min_size:
+            return response
+        response.set_data(compressor.compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    # Otra codificacion es otra representacion: el ETag pasa a ser debil.
+    etag, weak = response.get_etag()
+    if etag is not None and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+def admission_metrics():
+    if admission is None:
+        return []
+    in_flight = Gauge('ef_is_admission_in_flight', 'Requests currently admitted', ('class',))
+    queued = Gauge('ef_is_admission_queue_depth', 'Requests waiting for admission', ('class',))
+    shed = Counter('ef_is_admission_shed_total', 'Requests rejected with 503 by admission control',
+                   ('class',))
+    for name, stats in admission.stats().items():
+        in_flight.set((name,), stats['active'])
+        queued.set((name,), stats['waiting'])
+        shed.inc((name,), stats['shed'])
+    return [in_flight, queued, shed]
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Formato de texto de Prometheus.
+    body = REGISTRY.render(data_handler.collect_metrics() + admission_metrics())
+    return Response(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/bulk/import', methods=['POST'])
+def bulk_import():
+    # Cuerpo NDJSON, una linea {"collection": "users" | "rides" |
+    # "ride_participations", "record": {...}} por registro; se lee a medida
+    # que llega y se guarda por lotes de ?batchSize= lineas.
+    try:
+        batch_size = int(request.args.get('batchSize', BATCH_SIZE))
+        if batch_size < 1:
+            raise ValueError("batchSize must be positive")
+    except ValueError:
+        return jsonify({"error": "Invalid batch size"}), 400
+    try:
+        result = data_handler.bulk_import(request.stream, min(batch_size, MAX_BATCH_SIZE))
+        return jsonify(result), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/bulk/export', methods=['GET'])
+def bulk_export():
+    # Las colecciones en el mismo formato que /bulk/import (incluidos los
+    # rides archivados), en streaming. ?collections=users,rides
+    requested = request.args.get('collections')
+    requested = set(requested.split(',')) if requested else set(BULK_COLLECTIONS)
+    if not requested <= set(BULK_COLLECTIONS):
+        return jsonify({"error": "Unknown collection"}), 400
+    # Siempre en el orden de BULK_COLLECTIONS, que es el que necesita el import.
+    collections = [collection for collection in BULK_COLLECTIONS if collection in requested]
+    records = data_handler.export_records(collections, STREAM_PAGE_SIZE)
+    return Response((to_line(collection, record) for collection, record in records),
+                    mimetype='application/x-ndjson')
+
 @app.route('/dummy', methods=['GET'])
 def dummy_endpoint():
     # Example dummy response
     return jsonify({"message": "This is a dummy endpoint!"})
 
 
+@app.route('/rides', methods=['GET'])
+def search_rides():
+    # ?from=&to= (ISO, p. ej. 2025-07-20T08:00), destination=<texto>, minSeats=<n>, limit=<n>
+    try:
+        args = request.args
+        start = date_arg('from')
+        end = date_arg('to')
+        min_seats = int(args['minSeats']) if args.get('minSeats') else None
+        limit = min(int(args.get('limit', 50)), MAX_PAGE_SIZE)
+        if limit < 1:
+            raise ValueError("limit must be positive")
+    except ValueError:
+        return jsonify({"error": "Invalid search parameters"}), 400
+    try:
+        rides = data_handler.search_rides(start, end, args.get('destination'), min_seats, limit)
+        return jsonify({"rides": rides})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/usuarios', methods=['GET'])
 def get_users():
+    # ?fields=alias,name: solo esos campos de cada usuario.
     try:
-        users = data_handler.get_all_users()
-        if not users:
-            return jsonify([]), 200  # Devolver lista vacía con status 200 en lugar de error 404
-        return jsonify(users)
+        fields = fields_arg(USER_FIELDS)
+    except ValueError:
+        return jsonify({"error": "Invalid fields parameter"}), 400
+    try:
+        page = page_args()
+        if page is None:
+            first_page = data_handler.get_users_page(STREAM_PAGE_SIZE, fields=fields)
+            return stream_json_array(
+                first_page, lambda after: data_handler.get_users_page(STREAM_PAGE_SIZE, after, fields))
+        users, cursor = data_handler.get_users_page(*page, fields=fields)
+        return jsonify({"users": users, "next": cursor})
+    except ValueError:
+        return jsonify({"error": "Invalid pagination parameters"}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/usuarios/<alias>', methods=['GET'])
 def get_user_by_alias(alias):
     try:
+        fields = fields_arg(USER_FIELDS)
+    except ValueError:
+        return jsonify({"error": "Invalid fields parameter"}), 400
+    try:
+        etag = etag_for(data_handler.get_user_version(alias))
+        cached = not_modified(etag)
+        if cached:
+            return cached
         user = data_handler.get_user_by_atribute('alias',alias)
         if not user:
             return jsonify({"error": "User not found"}), 404
-        return user
+        return with_etag(jsonify(project(user, fields)), etag)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def summary_filters():
+    # Filtros de la vista con datos del ride: ?status=Aceptada,Pendiente
+    # &from=&to= (ISO, sobre rideDateAndTime). None si no se pidio la vista
+    # (?expand=1 o algun filtro).
+    args = request.args
+    if args.get('expand', '0') in ('', '0') and not any(args.get(name) for name in ('status', 'from', 'to')):
+        return None
+    statuses = set(args['status'].split(',')) if args.get('status') else None
+    return statuses, date_arg('from'), date_arg('to')
+
 @app.route('/usuarios/<alias>/rides', methods=['GET'])
 def get_rides_of_user(alias):
     try:
-        rides = data_handler.get_rides_of_user(alias)
-        if not rides:
+        filters = summary_filters()
+    except ValueError:
+        return jsonify({"error": "Invalid filter parameters"}), 400
+    try:
+        page = page_args()
+        limit, after = page or (STREAM_PAGE_SIZE, None)
+        if filters is None:
+            def fetch(limit, cursor):
+                return data_handler.get_rides_of_user_page(alias, limit, cursor)
+        else:
+            def fetch(limit, cursor):
+                return data_handler.get_ride_summaries_of_user_page(alias, limit, cursor, *filters)
+        first_page = fetch(limit, after)
+        # Sin filtros un usuario sin rides es 404; con filtros, una lista vacia.
+        if not first_page or (filters is None and after is None and not first_page[0]):
             return jsonify({"error": "No rides found for user"}), 404
-        return jsonify(rides)
+        if page is None:
+            return stream_json_array(first_page, lambda cursor: fetch(STREAM_PAGE_SIZE, cursor) or ([], None))
+        rides, cursor = first_page
+        return jsonify({"rides": rides, "next": cursor})
+    except ValueError:
+        return jsonify({"error": "Invalid pagination parameters"}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/usuarios/<alias>/rides/<ride_id>', methods=['GET'])
 def get_ride_details(alias, ride_id):
+    # ?fields=status,participants.participant.alias: lo que no se pide no se
+    # calcula (p. ej. los contadores previousRides* de cada participante).
+    try:
+        fields = fields_arg(RIDE_DETAIL_FIELDS)
+    except ValueError:
+        return jsonify({"error": "Invalid fields parameter"}), 400
     try:
-        ride = data_handler.get_ride_details(alias, int(ride_id))
+        etag = etag_for(data_handler.get_ride_version(int(ride_id)))
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        ride = data_handler.get_ride_details(alias, int(ride_id), fields)
         if not ride:
             return jsonify({"error": "Ride not found"}), 404
-        return jsonify({"ride": ride})
+        return with_etag(jsonify({"ride": ride}), etag)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/usuarios/<alias>/rides/<ride_id>/events', methods=['GET'])
+def ride_events(alias, ride_id):
+    # Server-Sent Events con los cambios del ride (join, accept, reject,
+    # start, end, unload). Al reconectar, el navegador manda Last-Event-ID y
+    # se reenvia lo que falto; si ya no esta en el buffer llega un evento
+    # 'reset' y el cliente vuelve a pedir el detalle.
+    try:
+        ride_id = int(ride_id)
+        last_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+        last_id = int(last_id) if last_id else None
+    except ValueError:
+        return jsonify({"error": "Invalid event id"}), 400
+    try:
+        if data_handler.get_ride_version(ride_id) is None:
+            return jsonify({"error": "Ride not found"}), 404
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    subscription = data_handler.events.subscribe(ride_id, last_id)
+
+    def generate():
+        try:
+            yield 'retry: 3000\n\n'
+            if subscription.gap:
+                yield 'id: %d\nevent: reset\ndata: {}\n\n' % subscription.last_id
+            while not subscription.done:
+                event = subscription.get(EVENTS_KEEPALIVE)
+                if event is not None:
+                    yield event.to_sse()
+                elif not subscription.dropped:
+                    yield ': keepalive\n\n'
+        finally:
+            subscription.close()
+
+    response = Response(generate(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Si el cuerpo nunca se empieza a enviar, el generador no llega al finally.
+    response.call_on_close(subscription.close)
+    return response
+
 @app.route('/usuarios/<alias>/rides/<ride_id>/requestToJoin/<alias2>', methods=['POST'])
 def request_to_join_ride(alias, ride_id, alias2):
     try:
@@ -85,6 +482,24 @@ def reject_ride_request(alias, ride_id, alias2):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/usuarios/<alias>/rides/<ride_id>/decisions', methods=['POST'])
+def decide_ride_requests(alias, ride_id):
+    # Body: {"decisions": [{"alias": "maria", "decision": "accept" | "reject"}, ...]}
+    try:
+        body = request.get_json(silent=True) or {}
+        decisions = body.get('decisions') if isinstance(body, dict) else None
+        if not isinstance(decisions, list):
+            return jsonify({"error": "Expected a list of decisions"}), 400
+        invalid = data_handler.invalid_decision(decisions)
+        if invalid is not None:
+            return jsonify({"error": f"Invalid decision at position {invalid}"}), 400
+        results = data_handler.decide_ride_requests(alias, int(ride_id), decisions)
+        if results is None:
+            return jsonify({"error": "Participation request failed"}), 400
+        return jsonify({"results": results}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/usuarios/<alias>/rides/<ride_id>/start', methods=['POST'])
 def start_ride(alias, ride_id):
     try:
@@ -116,4 +531,7 @@ def unload_participant(alias, ride_id):
         return jsonify({"error": str(e)}), 500
 
 if __name__ == '__main__':
+    # SIGTERM termina con SystemExit para que corran los atexit (flush de
+    # las mutaciones pendientes en modo group/async).
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
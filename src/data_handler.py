@@ -1,20 +1,214 @@
+import atexit
+import bisect
+import functools
 import json
+import os
+import threading
+import time
+import uuid
+import weakref
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 
+try:
+    from .storage import COLLECTIONS, create_backend
+    from .storage.archive import COLD_COLLECTIONS, Archive, finished_rides
+    from .utils.bulk import BATCH_SIZE, BULK_COLLECTIONS, ImportResult, read_batches, validate_batch
+    from .utils.columnar import ColumnarTable, RecordView, participation_table
+    from .utils.events import EventHub
+    from .utils.fields import PARTICIPANT_COUNTERS, includes, project
+    from .utils.flusher import Flusher
+    from .utils.indexes import Index
+    from .utils.lru import LRUCache
+    from .utils.metrics import REGISTRY, Counter
+    from .utils.ride_search import RideSearch
+    from .utils.rwlock import RWLock
+    from .utils.user_rides import UserRides
+    from .utils.versions import VersionClock
+except ImportError:
+    from storage import COLLECTIONS, create_backend
+    from storage.archive import COLD_COLLECTIONS, Archive, finished_rides
+    from utils.bulk import BATCH_SIZE, BULK_COLLECTIONS, ImportResult, read_batches, validate_batch
+    from utils.columnar import ColumnarTable, RecordView, participation_table
+    from utils.events import EventHub
+    from utils.fields import PARTICIPANT_COUNTERS, includes, project
+    from utils.flusher import Flusher
+    from utils.indexes import Index
+    from utils.lru import LRUCache
+    from utils.metrics import REGISTRY, Counter
+    from utils.ride_search import RideSearch
+    from utils.rwlock import RWLock
+    from utils.user_rides import UserRides
+    from utils.versions import VersionClock
+
+# Colecciones de las que se deriva user_stats.
+STATS_SOURCES = ('users', 'ride_participations')
+
+# Colecciones guardadas en memoria por columnas (ColumnarTable) en lugar de
+# como lista de dicts; hacia el backend siempre salen dicts.
+COLUMNAR = {'ride_participations': participation_table}
+
+# Metricas de /metrics. Los bytes y la cache de carga los lleva el backend y
+# se leen recien al exportar (collect_metrics).
+STORAGE_SECONDS = REGISTRY.histogram(
+    'ef_is_storage_operation_seconds', 'Time spent in each load/save of a collection',
+    ('collection', 'operation'))
+LOOKUPS = REGISTRY.counter(
+    'ef_is_lookups_total', 'get_*_by_attribute lookups, resolved by index or linear scan',
+    ('collection', 'attribute', 'method'))
+LOOKUP_SCANNED = REGISTRY.counter(
+    'ef_is_lookup_scanned_items_total', 'Records compared by lookups without a usable index',
+    ('collection', 'attribute'))
+
+
+def _collection(name):
+    # Reasignar la coleccion (load_*, tests) reconstruye sus indices, obliga a
+    # releerla en el proximo load_* y hace que el proximo save_* la escriba
+    # completa.
+    def getter(self):
+        if name in self._pending:
+            self._load_collection(name)
+        return self._collections[name]
+
+    def setter(self, items):
+        self._pending.discard(name)
+        self._set_collection(name, items)
+        self.backend.invalidate(name)
+        self._rewrite.add(name)
+        if name in STATS_SOURCES:
+            self._stats_stale = True
+
+    return property(getter, setter)
+
+
+# Los metodos publicos toman el RWLock del handler: las consultas corren en
+# paralelo y cada mutacion (cargar, modificar, guardar) es exclusiva. Las
+# recargas desde el backend y la reconstruccion de user_stats reemplazan
+# colecciones enteras y se serializan aparte con _load_lock. El lock del
+# backend extiende lo mismo a otros procesos (EF_IS_MULTIPROCESS).
+
+def _reads(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock.read(), self.backend.lock(shared=True):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _writes(method):
+    # En modo 'group' la respuesta espera, ya sin el lock, al flush que
+    # incluye esta mutacion.
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        seq = None
+        with self._lock.write(), self.backend.lock():
+            result = method(self, *args, **kwargs)
+            flusher = self._flusher
+            if flusher is not None and self._dirty:
+                seq = flusher.queue()
+        if seq is not None and self.durability == 'group':
+            flusher.wait(seq)
+        return result
+    return wrapper
+
+
+# Handlers con flusher en segundo plano: se cierran al salir del proceso para
+# no perder mutaciones ya confirmadas.
+_flushing_handlers = weakref.WeakSet()
+
+
+@atexit.register
+def _close_flushing_handlers():
+    for handler in list(_flushing_handlers):
+        handler.close()
+
+
 class DataHandler:
-    def __init__(self, filename='data.json'):
+    users = _collection('users')
+    rides = _collection('rides')
+    ride_participations = _collection('ride_participations')
+    user_stats = _collection('user_stats')
+
+    DURABILITY_MODES = ('sync', 'group', 'async')
+
+    def __init__(self, filename='data.json', data_dir='src/data', persistence=None,
+                 fsync=None, compact_every=1000, backend=None, multiprocess=None, lazy=None,
+                 durability=None, flush_interval=0.05, flush_every=100, detail_cache=None,
+                 detail_cache_ttl=None):
         self.filename = filename
+        self.data_dir = data_dir
+        self.backend = backend or create_backend(
+            data_dir=data_dir, persistence=persistence, fsync=fsync, compact_every=compact_every,
+            multiprocess=multiprocess)
+        # durability: 'sync' escribe antes de responder; 'group' y 'async'
+        # marcan las colecciones como sucias y un hilo las escribe cada
+        # flush_interval segundos o cada flush_every mutaciones ('group'
+        # espera ese flush antes de responder, 'async' no).
+        self.durability = durability or os.environ.get('EF_IS_DURABILITY', 'sync')
+        if self.durability not in self.DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode: {self.durability}")
+        if self.durability != 'sync' and getattr(self.backend, 'multiprocess', False):
+            raise ValueError("Multi-process mode requires durability='sync'")
+        self._dirty = set()
+        self._flusher = None
+        self._collections = {}
+        self._pending = set()
+        self._changes = {}
+        self._rewrite = set()
+        self._stats_stale = False
+        self._lock = RWLock()
+        self._load_lock = threading.RLock()
+        # Versiones por coleccion y por registro ((coleccion, id)); los ETags
+        # llevan instance_id porque los contadores son de este proceso.
+        self.instance_id = uuid.uuid4().hex[:12]
+        self._versions = VersionClock()
+        self._indexes = {
+            'users': {'id': Index('id'), 'alias': Index('alias')},
+            'rides': {'id': Index('id')},
+            'ride_participations': {'id': Index('id'), 'rideId': Index('rideId', unique=False)},
+            'user_stats': {'id': Index('id')},
+        }
+        self._search = RideSearch()
+        # Eventos de cambios por ride (topic = id del ride) para el stream
+        # /usuarios/<alias>/rides/<ride_id>/events.
+        self.events = EventHub()
+        # Cache de get_ride_details por id de ride: detail_cache entradas (0
+        # la desactiva) de hasta detail_cache_ttl segundos. Cada entrada vale
+        # mientras no cambie la version del ride (get_ride_version).
+        if detail_cache is None:
+            detail_cache = int(os.environ.get('EF_IS_DETAIL_CACHE', 1024))
+        if detail_cache_ttl is None:
+            detail_cache_ttl = float(os.environ.get('EF_IS_DETAIL_CACHE_TTL', 60))
+        self._detail_cache = LRUCache(detail_cache, detail_cache_ttl) if detail_cache else None
+        # Rides finalizados y sus participaciones archivados en segmentos de
+        # solo lectura (archive_finished_rides); se leen solo cuando una
+        # consulta pide un id que no esta en memoria.
+        self._archive = Archive(os.path.join(data_dir, 'archive'))
+        self._user_rides = UserRides(
+            lambda participation_id: self._find('ride_participations', participation_id),
+            lambda ride_id: self._find('rides', ride_id),
+            lambda user_id: self._lookup('users', 'id', user_id))
         self.rides = []
         self.users = []
         self.ride_participations = []
-        self.load_data()
+        self.user_stats = []
+        # lazy: cada coleccion se lee del backend la primera vez que se usa
+        # (load_* o el atributo) en lugar de leerlas todas al crear el handler.
+        if lazy is None:
+            lazy = os.environ.get('EF_IS_LAZY_LOAD', '') not in ('', '0')
+        self._pending = set(COLLECTIONS) if lazy else set()
+        if not lazy:
+            with self.backend.lock(shared=True):
+                self.load_data()
+        if self.durability != 'sync':
+            self._flusher = Flusher(self._flush_dirty, flush_interval, flush_every)
+            _flushing_handlers.add(self)
 
     def save_data(self):
         data = {
             'rides': self.rides,
             'users': self.users,
-            'ride_participations': self.ride_participations
+            'ride_participations': self.ride_participations.to_dicts()
         }
         with open(self.filename, 'w') as f:
             json.dump(data, f)
@@ -23,153 +217,561 @@ class DataHandler:
         self.load_users()
         self.load_rides()
         self.load_ride_participations()
+        self.load_user_stats()
 
-    def load_users(self, path='src/data/users.json'):
+    def _load_collection(self, collection):
+        if collection in self._dirty:
+            # Lo que hay en memoria es mas nuevo que el disco.
+            return False
+        start = time.perf_counter()
         try:
-            with open(path, 'r') as f:
-                self.users = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            self.users = []
+            with self._load_lock:
+                items = self.backend.load(collection)
+                if items is None:
+                    return False
+                self._pending.discard(collection)
+                self._set_collection(collection, items)
+                self._rewrite.discard(collection)
+                if collection in STATS_SOURCES:
+                    # Otro escritor (u otro proceso) cambio la fuente: la
+                    # proyeccion en memoria ya no la refleja. Si despues se
+                    # recarga tambien user_stats, load_user_stats decide.
+                    self._stats_stale = True
+                return True
+        finally:
+            STORAGE_SECONDS.observe(time.perf_counter() - start, (collection, 'load'))
 
-    def save_users(self, path='src/data/users.json'):
-        with open(path, 'w') as f:
-            json.dump(self.users, f)
+    def _set_collection(self, collection, items):
+        if collection in COLUMNAR and not isinstance(items, ColumnarTable):
+            items = COLUMNAR[collection](items)
+        self._collections[collection] = items
+        self._rebuild_indexes(collection)
+        self._changes[collection] = {}
+        self._versions.bump(collection)
+        if collection == 'rides':
+            self._search.rebuild_rides(items)
+        elif collection == 'ride_participations':
+            self._search.rebuild_participations(items)
+        if collection != 'user_stats':
+            self._user_rides.clear()
 
-    def load_rides(self, path='src/data/rides.json'):
-        try:
-            with open(path, 'r') as f:
-                self.rides = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            self.rides = []
+    def _save_collection(self, collection):
+        if self._flusher is not None:
+            self._dirty.add(collection)
+            return
+        self._write_collection(collection)
 
-    def save_rides(self, path='src/data/rides.json'):
-        with open(path, 'w') as f:
-            json.dump(self.rides, f)
+    def _export(self, collection):
+        # (registros, cambios) como dicts, para el backend. De una
+        # ColumnarTable sale to_dicts sin llamar: el backend la llama solo si
+        # reescribe la coleccion completa.
+        items = self._collections[collection]
+        changes = self._changes[collection]
+        if isinstance(items, ColumnarTable):
+            items = items.to_dicts
+            changes = {record_id: None if record is None else record.to_dict()
+                       for record_id, record in changes.items()}
+        return items, changes
 
-    def load_ride_participations(self, path='src/data/rideParticipations.json'):
-        try:
-            with open(path, 'r') as f:
-                self.ride_participations = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            self.ride_participations = []
+    def _write_collection(self, collection):
+        start = time.perf_counter()
+        items, changes = self._export(collection)
+        self.backend.save(collection, items, changes, collection in self._rewrite)
+        STORAGE_SECONDS.observe(time.perf_counter() - start, (collection, 'save'))
+        self._changes[collection] = {}
+        self._rewrite.discard(collection)
+
+    def _flush_dirty(self):
+        with self._lock.write(), self.backend.lock():
+            for collection in list(self._dirty):
+                self._write_collection(collection)
+                self._dirty.discard(collection)
+
+    def close(self):
+        # Detiene el flusher despues de escribir lo pendiente; desde aqui las
+        # mutaciones se guardan de forma sincronica.
+        flusher = self._flusher
+        if flusher is None:
+            return
+        with self._lock.write():
+            self._flusher = None
+        _flushing_handlers.discard(self)
+        flusher.close()
+        self._flush_dirty()
+
+    @_writes
+    def compact(self, collection=None):
+        for name in ([collection] if collection else COLLECTIONS):
+            if name in self._pending:
+                continue
+            self.backend.compact(name, self._export(name)[0])
+            self._changes[name] = {}
+            self._rewrite.discard(name)
+            self._dirty.discard(name)
+
+    def _touch(self, collection, item):
+        self._changes[collection][item['id']] = item
+        self._versions.bump(self._version_key(collection, item))
+        self._update_derived(collection, item)
+
+    def _update_derived(self, collection, item, removed=False):
+        # Indices de busqueda y proyeccion "mis rides".
+        if collection == 'rides':
+            self._search.update_ride(item, removed)
+        elif collection == 'ride_participations':
+            self._search.update_participation(item, removed)
+        self._user_rides.update(collection, item, removed)
+
+    def _version_key(self, collection, item):
+        # Las participaciones y los contadores se versionan con el ride y el
+        # usuario que muestran.
+        if collection == 'ride_participations':
+            return ('rides', item.get('rideId'))
+        if collection == 'user_stats':
+            return ('users', item['id'])
+        return (collection, item['id'])
+
+    def _publish(self, event, ride_id, passenger=None, status=None, ride=None):
+        # Se publica con el cambio ya aplicado en memoria y el lock tomado:
+        # el orden de los eventos es el de las mutaciones.
+        data = {'rideId': ride_id}
+        if ride is not None:
+            data['rideStatus'] = ride['status']
+        if passenger is not None:
+            data['participant'] = passenger['alias']
+            data['status'] = status
+        self.events.publish(ride_id, event, data)
+
+    def load_cache_stats(self):
+        return self.backend.stats()
+
+    def archive_stats(self):
+        return self._archive.stats()
+
+    def detail_cache_stats(self):
+        return self._detail_cache.stats() if self._detail_cache is not None else None
+
+    def collect_metrics(self):
+        # Metricas del backend de este handler, armadas al momento de exportar.
+        io_bytes = Counter('ef_is_storage_bytes_total', 'Bytes read from and written to storage',
+                           ('collection', 'direction'))
+        for key, n in self.backend.io_stats().items():
+            io_bytes.inc(key, n)
+        load_cache = Counter('ef_is_load_cache_total',
+                             'Collection loads served from memory (hit) or re-read (miss)', ('result',))
+        stats = self.backend.stats()
+        for key, result in (('hits', 'hit'), ('misses', 'miss')):
+            if key in stats:
+                load_cache.inc((result,), stats[key])
+        metrics = [io_bytes, load_cache]
+        stats = self.detail_cache_stats()
+        if stats is not None:
+            lookups = Counter('ef_is_detail_cache_total',
+                              'get_ride_details calls served from the response cache (hit) or not (miss)',
+                              ('result',))
+            lookups.inc(('hit',), stats['hits'])
+            lookups.inc(('miss',), stats['misses'])
+            dropped = Counter('ef_is_detail_cache_dropped_total',
+                              'Cached ride details dropped because they changed, expired or were evicted',
+                              ('reason',))
+            for key, reason in (('stale', 'stale'), ('expired', 'expired'), ('evictions', 'evicted')):
+                dropped.inc((reason,), stats[key])
+            metrics += [lookups, dropped]
+        return metrics
+
+    def load_users(self):
+        self._load_collection('users')
+
+    def save_users(self):
+        self._save_collection('users')
+
+    def load_rides(self):
+        self._load_collection('rides')
+
+    def save_rides(self):
+        self._save_collection('rides')
+
+    def load_ride_participations(self):
+        self._load_collection('ride_participations')
     
-    def save_ride_participations(self, path='src/data/rideParticipations.json'):
-        with open(path, 'w') as f:
-            json.dump(self.ride_participations, f)
+    def save_ride_participations(self):
+        self._save_collection('ride_participations')
+
+    def load_user_stats(self):
+        with self._load_lock:
+            if self._load_collection('user_stats'):
+                # Datos guardados antes de existir la proyeccion: se reconstruye
+                # una vez y se persiste con el proximo save_user_stats.
+                self._stats_stale = not self.user_stats and any(user.get('rides') for user in self.users)
+
+    def save_user_stats(self):
+        self._save_collection('user_stats')
+
+    def _rebuild_indexes(self, collection):
+        items = self._collections[collection]
+        for index in self._indexes[collection].values():
+            index.rebuild(items)
+
+    def _add(self, collection, item):
+        items = self._collections[collection]
+        items.append(item)
+        # Una ColumnarTable guarda una copia: se indexa su vista.
+        item = items[-1]
+        for index in self._indexes[collection].values():
+            index.add(item)
+        self._touch(collection, item)
+        return item
+
+    def _remove(self, collection, item):
+        self._collections[collection].remove(item)
+        for index in self._indexes[collection].values():
+            index.remove(item)
+        self._changes[collection][item['id']] = None
+        self._versions.bump(self._version_key(collection, item))
+        self._update_derived(collection, item, removed=True)
+
+    def _lookup(self, collection, attribute, value):
+        index = self._indexes[collection].get(attribute)
+        if index is not None:
+            try:
+                return index.first(value)
+            except TypeError:
+                pass
+        return self._scan(collection, attribute, value)
+
+    def _find(self, collection, record_id):
+        # Registro por id en memoria o, para rides y participaciones, en el
+        # archivo frio.
+        found = self._lookup(collection, 'id', record_id)
+        if found is None and collection in ('rides', 'ride_participations'):
+            found = self._archive.get(collection, record_id)
+        return found
+
+    def _scan(self, collection, attribute, value):
+        scanned = 0
+        found = None
+        for item in self._collections[collection]:
+            scanned += 1
+            if item.get(attribute) == value:
+                found = item
+                break
+        LOOKUP_SCANNED.inc((collection, attribute), scanned)
+        return found
+
+    def _counted_lookup(self, collection, attribute, value):
+        # _lookup de los get_*_by_attribute publicos, contando si lo resolvio
+        # un indice o un recorrido. Las busquedas internas no se cuentan: son
+        # varias por request y casi todas por indice.
+        index = self._indexes[collection].get(attribute)
+        if index is not None:
+            try:
+                found = index.first(value)
+                LOOKUPS.inc((collection, attribute, 'index'))
+                return found
+            except TypeError:
+                pass
+        LOOKUPS.inc((collection, attribute, 'scan'))
+        return self._scan(collection, attribute, value)
+
+    def _participations_of_ride(self, ride_id):
+        return self._indexes['ride_participations']['rideId'].get(ride_id)
+
+    def _participation_of_user(self, user, ride_id, candidates=None):
+        owned = set(user.get('rides', []))
+        if candidates is None:
+            candidates = self._participations_of_ride(ride_id)
+        for participation in candidates:
+            if participation['id'] in owned:
+                return participation
+        return None
+
+    # Consultas de solo lectura: se delegan al backend cuando puede
+    # resolverlas con indices propios (SQL), pero solo si ya tiene todo lo
+    # que hay en memoria. Con durabilidad 'group' o 'async' los cambios
+    # pueden no estar escritos todavia: se usa el indice en memoria.
+
+    def _ride_participations(self, ride_id):
+        if self.backend.supports_queries and self._flusher is None and not self._dirty:
+            return self.backend.participations_of_ride(ride_id)
+        return self._participations_of_ride(ride_id)
+
+    # Proyeccion user_stats: {"id": userId, "counts": {estado: n}} sobre las
+    # participaciones de cada usuario. Se actualiza en cada transicion de
+    # estado para que get_ride_details no recorra el historial de nadie.
+
+    def rebuild_user_stats(self):
+        with self._load_lock:
+            # Los estados se cuentan por columna: codigos enteros por usuario,
+            # traducidos a texto una vez por usuario.
+            # Las participaciones archivadas se cuentan desde el archivo.
+            participations = self.ride_participations
+            items = []
+            for user in self.users:
+                owned = []
+                archived = []
+                for participation_id in user.get('rides', []):
+                    participation = self._lookup('ride_participations', 'id', participation_id)
+                    if participation is None:
+                        participation = self._archive.get('ride_participations', participation_id)
+                        if participation is not None:
+                            archived.append(participation.get('status', ''))
+                    else:
+                        owned.append(participation)
+                counts = participations.value_counts('status', owned, '')
+                for status in archived:
+                    counts[status] = counts.get(status, 0) + 1
+                items.append({'id': user['id'], 'counts': counts})
+            self._set_collection('user_stats', items)
+            self._rewrite.add('user_stats')
+            self._stats_stale = False
+
+    def _ensure_stats(self):
+        if self._stats_stale:
+            with self._load_lock:
+                if self._stats_stale:
+                    self.rebuild_user_stats()
+
+    def _stats_of(self, user_id):
+        self._ensure_stats()
+        return self._lookup('user_stats', 'id', user_id)
+
+    def _status_counts(self, user_id):
+        stats = self._stats_of(user_id)
+        return stats['counts'] if stats else {}
+
+    def _count_transition(self, user_id, old_status=None, new_status=None):
+        # Se llama con el cambio ya aplicado: si la proyeccion estaba
+        # desactualizada, reconstruirla ya lo incluye.
+        if self._stats_stale:
+            self.rebuild_user_stats()
+            return
+        stats = self._lookup('user_stats', 'id', user_id)
+        if stats is None:
+            stats = {'id': user_id, 'counts': {}}
+            self._add('user_stats', stats)
+        counts = stats['counts']
+        if old_status is not None:
+            counts[old_status] = counts.get(old_status, 0) - 1
+            if counts[old_status] <= 0:
+                del counts[old_status]
+        if new_status is not None:
+            counts[new_status] = counts.get(new_status, 0) + 1
+        self._touch('user_stats', stats)
+
+    def _next_id(self, collection):
+        # Los ids archivados tampoco se reusan.
+        return max(self.generate_new_id(self._collections[collection]),
+                   self._archive.max_id(collection) + 1)
 
     def generate_new_id(self, data_list):
         if not data_list:
             return 1
+        if isinstance(data_list, ColumnarTable):
+            return data_list.max_value('id') + 1
         return max(item['id'] for item in data_list) + 1
 
+    @_reads
     def get_user_by_attribute(self, attribute, value):
         self.load_users()
-        for user in self.users:
-            if user.get(attribute) == value:
-                return user
-        return None
+        return self._counted_lookup('users', attribute, value)
 
     def get_user_by_atribute(self, attribute, value):
         return self.get_user_by_attribute(attribute, value)
 
+    @_reads
     def get_ride_by_attribute(self, attribute, value):
         self.load_rides()
-        for ride in self.rides:
-            if ride.get(attribute) == value:
-                return ride
-        return None
+        found = self._counted_lookup('rides', attribute, value)
+        if found is None and attribute == 'id':
+            found = self._archive.get('rides', value)
+        return found
 
+    @_reads
     def get_ride_participation_by_attribute(self, attribute, value):
         self.load_ride_participations()
-        for participation in self.ride_participations:
-            if participation.get(attribute) == value:
-                return participation
-        return None
+        found = self._counted_lookup('ride_participations', attribute, value)
+        if found is None and attribute == 'id':
+            found = self._archive.get('ride_participations', value)
+        return found
 
+    @_reads
     def get_all_users(self):
         self.load_users()
         return self.users
     
+    @_reads
+    def get_user_version(self, alias):
+        self.load_users()
+        user = self._lookup('users', 'alias', alias)
+        if not user:
+            return None
+        return self._versions.latest(['users', ('users', user['id'])])
+
+    @_reads
+    def get_ride_version(self, ride_id):
+        # Cambia con todo lo que muestra get_ride_details: el ride, sus
+        # participaciones, el conductor y los participantes con sus contadores.
+        self.load_users()
+        self.load_rides()
+        self.load_ride_participations()
+        self.load_user_stats()
+        self._ensure_stats()
+        ride = self._find('rides', ride_id)
+        if not ride:
+            return None
+        return self._ride_version(ride)
+
+    def _ride_version(self, ride):
+        keys = list(COLLECTIONS) + [('rides', ride['id']), ('users', ride['rideDriver'])]
+        keys += [('users', participant_id) for participant_id in ride['participants']]
+        return self._versions.latest(keys)
+
+    @_reads
+    def search_rides(self, start=None, end=None, destination=None, min_seats=None, limit=50):
+        # start/end: datetime. Devuelve un resumen de cada ride con su
+        # conductor y asientos libres (allowedSpaces - participaciones aceptadas).
+        self.load_users()
+        self.load_rides()
+        self.load_ride_participations()
+
+        results = []
+        for ride in self._search.search(start, end, destination, min_seats, limit):
+            driver = self._lookup('users', 'id', ride['rideDriver'])
+            results.append({
+                "id": ride['id'],
+                "rideDateAndTime": ride['rideDateAndTime'],
+                "finalAddress": ride['finalAddress'],
+                "driver": driver['alias'] if driver else None,
+                "status": ride['status'],
+                "allowedSpaces": ride['allowedSpaces'],
+                "freeSeats": self._search.free_seats(ride),
+            })
+        return results
+
+    @_reads
+    def get_users_page(self, limit, after=None, fields=None):
+        # Pagina por cursor sobre el orden de ids: (usuarios, proximo cursor).
+        # Con fields (arbol de utils/fields.py) cada usuario es una copia con
+        # esos campos.
+        self.load_users()
+        users, cursor = self._indexes['users']['id'].page(limit, after)
+        if fields is not None:
+            users = [project(user, fields) for user in users]
+        return users, cursor
+
+    @_reads
+    def get_rides_of_user_page(self, alias, limit, after=None):
+        self.load_users()
+
+        user = self._lookup('users', 'alias', alias)
+        if not user:
+            return None
+
+        rides = sorted(user.get('rides', []))
+        start = 0 if after is None else bisect.bisect_right(rides, after)
+        page = rides[start:start + limit]
+        cursor = page[-1] if page and start + limit < len(rides) else None
+        return page, cursor
+
+    @_reads
+    def get_ride_summaries_of_user_page(self, alias, limit=None, after=None, statuses=None,
+                                        start=None, end=None):
+        # Proyeccion "mis rides": cada participacion del usuario con los datos
+        # de su ride, filtrada por estado y rango de fecha del ride.
+        self.load_users()
+        self.load_rides()
+        self.load_ride_participations()
+
+        user = self._lookup('users', 'alias', alias)
+        if not user:
+            return None
+
+        with self._load_lock:
+            entries = self._user_rides.entries(user)
+        return self._user_rides.page(entries, limit, after, statuses, start, end)
+
+    @_reads
     def get_rides_of_user(self, alias):
         self.load_users()
         self.load_rides()
 
-        user = self.get_user_by_atribute('alias', alias)
+        user = self._lookup('users', 'alias', alias)
         if not user:
             return None
         
         return user.get('rides', [])
 
-    def get_ride_details(self, alias, value):
+    @_reads
+    def get_ride_details(self, alias, value, fields=None):
+        # fields: arbol de utils/fields.py (RIDE_DETAIL_FIELDS). Lo que no se
+        # pide no se arma: sin participants no se recorren las
+        # participaciones y sin contadores no se leen los de user_stats.
+        self.load_users()
         self.load_rides()
         self.load_ride_participations()
+        self.load_user_stats()
         
-        ride = self.get_ride_by_attribute('id', value)
+        ride = self._lookup('rides', 'id', value)
+        archived = False
         if not ride:
-            return None
+            ride = self._archive.get('rides', value)
+            if not ride:
+                return None
+            archived = True
+
+        # El dict cacheado se comparte entre requests: no se modifica. Solo
+        # se cachea la respuesta completa; las proyecciones salen de ella.
+        cache = self._detail_cache
+        if cache is not None:
+            self._ensure_stats()
+            version = self._ride_version(ride)
+            cached = cache.get(value, version)
+            if cached is not None:
+                return project(cached, fields)
         
-        driver = self.get_user_by_atribute('id', ride['rideDriver'])
+        driver = self._lookup('users', 'id', ride['rideDriver'])
         if not driver:
             return None
         driver_alias = driver['alias']
-        
+
         participants = []
-        for participant_id in ride['participants']:
-            participant = self.get_user_by_atribute('id', participant_id)
-            if not participant:
-                continue
+        if includes(fields, 'participants'):
+            counters = [(name, status) for name, status in PARTICIPANT_COUNTERS.items()
+                        if includes(fields, 'participants', 'participant', name)]
+            if archived:
+                ride_participations = self._archive.participations_of_ride(value)
+            else:
+                ride_participations = self._ride_participations(value)
+            for participant_id in ride['participants']:
+                participant = self._lookup('users', 'id', participant_id)
+                if not participant:
+                    continue
+                    
+                participation = self._participation_of_user(participant, value, ride_participations)
                 
-            participation = None
-            for part in self.ride_participations:
-                if part['rideId'] == value:
-                    participation = part
-                    break
-            
-            if not participation:
-                participation = {
-                    'confirmation': None,
-                    'destination': ride['finalAddress'],
-                    'occupiedSpaces': 1,
-                    'status': 'waiting'
+                if not participation:
+                    participation = {
+                        'confirmation': None,
+                        'destination': ride['finalAddress'],
+                        'occupiedSpaces': 1,
+                        'status': 'waiting'
+                    }
+
+                participant_data = {'alias': participant['alias']}
+                if counters:
+                    counts = self._status_counts(participant['id'])
+                    for name, status in counters:
+                        participant_data[name] = counts.get(status, 0)
+
+                user_data = {
+                    'confirmation': participation.get('confirmation', None),
+                    'participant': participant_data,
+                    'destination': participation.get('destination', ''),
+                    'occupiedSpaces': participation.get('occupiedSpaces', 0),
+                    'status': participation.get('status', 'waiting'),
                 }
-            
-            previousRidesTotal = 0
-            previousRidesCompleted = 0
-            previousRidesMissing = 0
-            previousRidesNotMarked = 0
-            previousRidesRejected = 0
-            
-            for ride_participation_id in participant['rides']:
-                ride_participation = self.get_ride_participation_by_attribute('id', ride_participation_id)
-                if ride_participation:
-                    status = ride_participation.get('status', '')
-                    if status == 'Pendiente':
-                        previousRidesTotal += 1
-                    elif status == 'Aceptada':
-                        previousRidesCompleted += 1
-                    elif status == 'Missing':
-                        previousRidesMissing += 1
-                    elif status == 'NotMarked':
-                        previousRidesNotMarked += 1
-                    elif status == 'Rechazada':
-                        previousRidesRejected += 1
-
-            user_data = {
-                'confirmation': participation.get('confirmation', None),
-                'participant': {
-                    'alias': participant['alias'],
-                    "previousRidesTotal": previousRidesTotal,
-                    "previousRidesCompleted": previousRidesCompleted,
-                    "previousRidesMissing": previousRidesMissing,
-                    "previousRidesNotMarked": previousRidesNotMarked,
-                    "previousRidesRejected": previousRidesRejected
-                },
-                'destination': participation.get('destination', ''),
-                'occupiedSpaces': participation.get('occupiedSpaces', 0),
-                'status': participation.get('status', 'waiting'),
-            }
-
-            participants.append(user_data)
+
+                participants.append(user_data)
 
         res = {
             "id": ride['id'],
@@ -179,19 +781,25 @@ class DataHandler:
             "status": ride['status'],
             "participants": participants
         }
+        if fields is not None:
+            return project(res, fields)
+        if cache is not None:
+            cache.put(value, version, res)
         return res
         
+    @_writes
     def request_to_join_ride(self, alias, ride_id, alias2):
         self.load_users()
         self.load_rides()
         self.load_ride_participations()
+        self.load_user_stats()
 
-        driver = self.get_user_by_atribute('alias', alias)
-        passenger = self.get_user_by_atribute('alias', alias2)
+        driver = self._lookup('users', 'alias', alias)
+        passenger = self._lookup('users', 'alias', alias2)
         if not driver or not passenger:
             return None
         
-        ride = self.get_ride_by_attribute('id', ride_id)
+        ride = self._lookup('rides', 'id', ride_id)
         if not ride:
             return None
         
@@ -202,8 +810,9 @@ class DataHandler:
             return None
         
         ride['participants'].append(passenger['id'])
+        self._touch('rides', ride)
 
-        new_participation_id = self.generate_new_id(self.ride_participations)
+        new_participation_id = self._next_id('ride_participations')
         new_ride_participation = {
             "id": new_participation_id,
             "confirmation": datetime.now().strftime('%d-%m-%y'),
@@ -214,117 +823,343 @@ class DataHandler:
         }
         
         passenger['rides'].append(new_participation_id)
+        self._touch('users', passenger)
 
-        self.ride_participations.append(new_ride_participation)
+        new_ride_participation = self._add('ride_participations', new_ride_participation)
+        self._count_transition(passenger['id'], new_status='Pendiente')
+        self._publish('join', ride_id, passenger, 'Pendiente', ride)
         self.save_rides()
         self.save_ride_participations()
         self.save_users()
+        self.save_user_stats()
 
         return new_ride_participation
     
+    @_writes
     def accept_ride_request(self, alias, ride_id, alias2):
         self.load_users()
         self.load_rides()
         self.load_ride_participations()
+        self.load_user_stats()
 
-        driver = self.get_user_by_atribute('alias', alias)
-        passenger = self.get_user_by_atribute('alias', alias2)
+        driver = self._lookup('users', 'alias', alias)
+        passenger = self._lookup('users', 'alias', alias2)
         if not driver or not passenger:
             return None
         
-        ride = self.get_ride_by_attribute('id', ride_id)
+        ride = self._lookup('rides', 'id', ride_id)
         if not ride or ride['rideDriver'] != driver['id'] or passenger['id'] not in ride['participants']:
             return None
         
-        for participation in self.ride_participations:
-            if participation['rideId'] == ride_id and participation['id'] in passenger['rides']:
-                participation['status'] = 'Aceptada'
-                self.save_ride_participations()
-                return participation
+        participation = self._participation_of_user(passenger, ride_id)
+        if participation:
+            previous_status = participation.get('status', '')
+            participation['status'] = 'Aceptada'
+            self._touch('ride_participations', participation)
+            self._count_transition(passenger['id'], previous_status, 'Aceptada')
+            self._publish('accept', ride_id, passenger, 'Aceptada', ride)
+            self.save_ride_participations()
+            self.save_user_stats()
+            return participation
 
         return None
     
+    @_writes
     def reject_ride_request(self, alias, ride_id, alias2):
         self.load_users()
         self.load_rides()
         self.load_ride_participations()
+        self.load_user_stats()
 
-        driver = self.get_user_by_atribute('alias', alias)
-        passenger = self.get_user_by_atribute('alias', alias2)
+        driver = self._lookup('users', 'alias', alias)
+        passenger = self._lookup('users', 'alias', alias2)
         if not driver or not passenger:
             return None
     
-        ride = self.get_ride_by_attribute('id', ride_id)
+        ride = self._lookup('rides', 'id', ride_id)
         if not ride or ride['rideDriver'] != driver['id'] or passenger['id'] not in ride['participants']:
             return None
         
-        for participation in self.ride_participations:
-            if participation['rideId'] == ride_id and participation['id'] in passenger['rides']:
-                participation['status'] = 'Rechazada'
-                self.save_ride_participations()
-                return participation
+        participation = self._participation_of_user(passenger, ride_id)
+        if participation:
+            previous_status = participation.get('status', '')
+            participation['status'] = 'Rechazada'
+            self._touch('ride_participations', participation)
+            self._count_transition(passenger['id'], previous_status, 'Rechazada')
+            self._publish('reject', ride_id, passenger, 'Rechazada', ride)
+            self.save_ride_participations()
+            self.save_user_stats()
+            return participation
 
         return None
     
+    # Decisiones en lote del conductor: [{'alias': ..., 'decision': 'accept'|'reject'}].
+    DECISIONS = {'accept': 'Aceptada', 'reject': 'Rechazada'}
+
+    @classmethod
+    def invalid_decision(cls, decisions):
+        # Posicion del primer elemento mal formado, o None. Se revisa el lote
+        # entero antes de aplicar nada: un error a mitad de camino dejaria
+        # cambios en memoria sin guardar.
+        for position, decision in enumerate(decisions):
+            if not isinstance(decision, dict) or not isinstance(decision.get('alias'), str) \
+                    or not isinstance(decision.get('decision'), str) \
+                    or decision['decision'] not in cls.DECISIONS:
+                return position
+        return None
+
+    @_writes
+    def decide_ride_requests(self, alias, ride_id, decisions):
+        # None si el conductor o el ride no corresponden, o si algun elemento
+        # esta mal formado (invalid_decision); en ese caso no se aplica ninguno.
+        if self.invalid_decision(decisions) is not None:
+            return None
+        self.load_users()
+        self.load_rides()
+        self.load_ride_participations()
+        self.load_user_stats()
+
+        driver = self._lookup('users', 'alias', alias)
+        if not driver:
+            return None
+
+        ride = self._lookup('rides', 'id', ride_id)
+        if not ride or ride['rideDriver'] != driver['id']:
+            return None
+
+        ride_participations = self._participations_of_ride(ride_id)
+        results = []
+        for decision in decisions:
+            result = {'alias': decision['alias'], 'decision': decision['decision']}
+            results.append(result)
+
+            status = self.DECISIONS[decision['decision']]
+            passenger = self._lookup('users', 'alias', decision['alias'])
+            if not passenger or passenger['id'] not in ride['participants']:
+                result['error'] = 'Passenger not in ride'
+                continue
+            participation = self._participation_of_user(passenger, ride_id, ride_participations)
+            if not participation:
+                result['error'] = 'Participation not found'
+                continue
+
+            previous_status = participation.get('status', '')
+            participation['status'] = status
+            self._touch('ride_participations', participation)
+            self._count_transition(passenger['id'], previous_status, status)
+            self._publish(decision['decision'], ride_id, passenger, status, ride)
+            result['status'] = status
+
+        if any('status' in result for result in results):
+            self.save_ride_participations()
+            self.save_user_stats()
+        return results
+
+    @_writes
+    def archive_finished_rides(self, before=None):
+        # Mueve los rides finalizados (con fecha anterior a `before`, o todos)
+        # y sus participaciones a segmentos frios, y reescribe las colecciones
+        # en memoria sin ellos. user['rides'] y user_stats no cambian: el
+        # historial sigue completo y se lee del archivo cuando se pide.
+        self.load_users()
+        self.load_rides()
+        self.load_ride_participations()
+        self.load_user_stats()
+        self._ensure_stats()
+
+        rides = finished_rides(self.rides, before)
+        if not rides:
+            return {'rides': 0, 'ride_participations': 0}
+        # Las colecciones calientes se arman de nuevo con lo que queda: sale
+        # mas barato que borrar registro por registro.
+        archived = {ride['id'] for ride in rides}
+        hot, participations = [], []
+        for participation in self.ride_participations.to_dicts():
+            (participations if participation.get('rideId') in archived else hot).append(participation)
+        self._archive.add(rides, participations)
+
+        self._set_collection('rides', [ride for ride in self.rides if ride['id'] not in archived])
+        self._set_collection('ride_participations', hot)
+        self._rewrite.update(COLD_COLLECTIONS)
+        self.save_rides()
+        self.save_ride_participations()
+        return {'rides': len(rides), 'ride_participations': len(participations)}
+
+    def bulk_import(self, lines, batch_size=BATCH_SIZE):
+        # Importa lineas NDJSON {"collection": ..., "record": ...} (ver
+        # utils/bulk.py) a medida que llegan: cada lote se valida fuera del
+        # lock con una llamada por modelo y se aplica con un solo save por
+        # coleccion. Los registros sin id reciben uno nuevo; los invalidos se
+        # saltean y se informan por numero de linea. user_stats se
+        # reconstruye una vez al final.
+        result = ImportResult()
+        ids = {}
+        try:
+            for batch in read_batches(lines, batch_size, result):
+                records = validate_batch(batch, result)
+                if records:
+                    self._import_batch(records, ids, result)
+        finally:
+            if any(result.imported[collection] for collection in STATS_SOURCES):
+                self._finish_import()
+        return result.to_dict()
+
+    @_writes
+    def _import_batch(self, records, ids, result):
+        self.load_users()
+        self.load_rides()
+        self.load_ride_participations()
+        self.load_user_stats()
+
+        changed = set()
+        for line, collection, record in records:
+            error = self._import_error(collection, record)
+            if error is not None:
+                result.error(line, error)
+                continue
+            if record['id'] is None:
+                record['id'] = self._allocate_id(collection, ids)
+            self._add(collection, record)
+            result.added(collection)
+            changed.add(collection)
+        for collection in BULK_COLLECTIONS:
+            if collection in changed:
+                self._save_collection(collection)
+        # Hasta _finish_import los contadores se recalculan al leerlos.
+        if changed.intersection(STATS_SOURCES):
+            self._stats_stale = True
+
+    @_writes
+    def _finish_import(self):
+        self.load_user_stats()
+        self.rebuild_user_stats()
+        self.save_user_stats()
+
+    def _import_error(self, collection, record):
+        # Lo que no puede validar el modelo: ids y alias repetidos y
+        # referencias a registros que no existen (ni en el mismo import).
+        if record['id'] is not None and self._find(collection, record['id']) is not None:
+            return f"Duplicate id: {record['id']}"
+        if collection == 'users':
+            if self._lookup('users', 'alias', record['alias']) is not None:
+                return f"Duplicate alias: {record['alias']}"
+        elif collection == 'rides':
+            for user_id in [record['rideDriver']] + record['participants']:
+                if self._lookup('users', 'id', user_id) is None:
+                    return f"Unknown user: {user_id}"
+        elif self._find('rides', record['rideId']) is None:
+            return f"Unknown ride: {record['rideId']}"
+        return None
+
+    def _allocate_id(self, collection, ids):
+        # Un contador por coleccion para todo el import: el maximo se busca
+        # una vez y no en cada registro como generate_new_id. Se saltean los
+        # ids que ya estan en uso (ids explicitos del import o asignados por
+        # otras mutaciones entre lotes).
+        index = self._indexes[collection]['id']
+        new_id = ids.get(collection)
+        if new_id is None:
+            new_id = self._next_id(collection)
+        while index.get(new_id) is not None:
+            new_id += 1
+        ids[collection] = new_id + 1
+        return new_id
+
+    @_reads
+    def export_page(self, collection, limit, after=None):
+        # Registros de una coleccion en orden de id, como dicts: (registros,
+        # proximo cursor).
+        self._load_collection(collection)
+        items, cursor = self._indexes[collection]['id'].page(limit, after)
+        return [item.to_dict() if isinstance(item, RecordView) else item for item in items], cursor
+
+    def export_records(self, collections=BULK_COLLECTIONS, page_size=500):
+        # (coleccion, registro) de cada coleccion, una pagina por vez con el
+        # lock de lectura, seguidos de los rides y participaciones archivados.
+        for collection in collections:
+            records, cursor = self.export_page(collection, page_size)
+            while True:
+                for record in records:
+                    yield collection, record
+                if cursor is None:
+                    break
+                records, cursor = self.export_page(collection, page_size, cursor)
+            if collection in COLD_COLLECTIONS:
+                for record in self._archive.records(collection):
+                    yield collection, record
+
+    @_writes
     def start_ride(self, alias, ride_id):
         self.load_users()
         self.load_rides()
         self.load_ride_participations()
 
-        driver = self.get_user_by_atribute('alias', alias)
+        driver = self._lookup('users', 'alias', alias)
         if not driver:
             return None
         
-        ride = self.get_ride_by_attribute('id', ride_id)
+        ride = self._lookup('rides', 'id', ride_id)
         if not ride or ride['rideDriver'] != driver['id']:
             return None
         
         ride['status'] = 'En Progreso'
+        self._touch('rides', ride)
+        self._publish('start', ride_id, ride=ride)
         self.save_rides()
         
         return {"message": "Ride started successfully", "ride": ride}
     
+    @_writes
     def end_ride(self, alias, ride_id):
         self.load_users()
         self.load_rides()
         self.load_ride_participations()
 
-        driver = self.get_user_by_atribute('alias', alias)
+        driver = self._lookup('users', 'alias', alias)
         if not driver:
             return None
         
-        ride = self.get_ride_by_attribute('id', ride_id)
+        ride = self._lookup('rides', 'id', ride_id)
         if not ride or ride['rideDriver'] != driver['id']:
             return None
         
         ride['status'] = 'Finalizada'
+        self._touch('rides', ride)
+        self._publish('end', ride_id, ride=ride)
         self.save_rides()
         
         return {"message": "Ride ended successfully", "ride": ride}
     
+    @_writes
     def unload_participant(self, alias, ride_id):
         self.load_users()
         self.load_rides()
         self.load_ride_participations()
+        self.load_user_stats()
 
-        user = self.get_user_by_atribute('alias', alias)
+        user = self._lookup('users', 'alias', alias)
         if not user:
             return None
         
         for participation_id in user['rides']:
-            participation = self.get_ride_participation_by_attribute('id', participation_id)
+            participation = self._lookup('ride_participations', 'id', participation_id)
             if participation and participation['rideId'] == ride_id:
                 user['rides'].remove(participation_id)
+                self._touch('users', user)
                 
-                self.ride_participations.remove(participation)
+                self._remove('ride_participations', participation)
+                self._count_transition(user['id'], old_status=participation.get('status', ''))
                 
-                ride = self.get_ride_by_attribute('id', ride_id)
+                ride = self._lookup('rides', 'id', ride_id)
                 if ride and user['id'] in ride['participants']:
                     ride['participants'].remove(user['id'])
+                    self._touch('rides', ride)
                     self.save_rides()
+                self._publish('unload', ride_id, user, None, ride)
                 
                 self.save_users()
                 self.save_ride_participations()
+                self.save_user_stats()
                 return {"message": "Participant unloaded successfully"}
 
         return None
\ No newline at end of file
@@ -0,0 +1,27 @@
+import os
+
+from .base import COLLECTIONS, StorageBackend
+from .json_backend import JsonBackend
+from .snapshot import SnapshotBackend
+
+
+def create_backend(url=None, data_dir='src/data', persistence=None, fsync=None, compact_every=1000,
+                   multiprocess=None):
+    # url: None/'json' -> archivos JSON en data_dir; 'snapshot' -> snapshots
+    # binarios (*.snap) en data_dir; 'sqlite:///ruta.db' (o cualquier URL de
+    # SQLAlchemy) -> SqlBackend. Por defecto se toma de EF_IS_STORAGE para que
+    # controller.py no tenga que cambiar.
+    url = url or os.environ.get('EF_IS_STORAGE', 'json')
+    if url in ('json', 'snapshot'):
+        persistence = persistence or os.environ.get('EF_IS_PERSISTENCE', 'json')
+        if fsync is None:
+            fsync = os.environ.get('EF_IS_FSYNC', '') not in ('', '0')
+        if multiprocess is None:
+            multiprocess = os.environ.get('EF_IS_MULTIPROCESS', '') not in ('', '0')
+        backend_class = SnapshotBackend if url == 'snapshot' else JsonBackend
+        return backend_class(data_dir, persistence, fsync, compact_every, multiprocess)
+    from .sql_backend import SqlBackend
+    return SqlBackend(url)
+
+
+__all__ = ['COLLECTIONS', 'StorageBackend', 'JsonBackend', 'SnapshotBackend', 'create_backend']
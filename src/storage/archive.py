@@ -0,0 +1,222 @@
+"""Archiva los rides finalizados (y sus participaciones) en segmentos frios.
+
+Uso (desde la raiz del repo, con el servidor detenido o en modo
+EF_IS_MULTIPROCESS=1):
+    python -m src.storage.archive --data-dir src/data --older-than-days 30
+"""
+import argparse
+import json
+import os
+from datetime import datetime, timedelta
+
+from .journal import atomic_write_json
+from .load_cache import LoadCache
+
+FINISHED = 'Finalizada'
+COLD_COLLECTIONS = ('rides', 'ride_participations')
+MANIFEST = 'manifest.json'
+
+
+def ride_month(ride):
+    # Particion de un ride: "YYYY-MM" de rideDateAndTime.
+    try:
+        return datetime.fromisoformat(ride.get('rideDateAndTime')).strftime('%Y-%m')
+    except (TypeError, ValueError):
+        return 'undated'
+
+
+def finished_rides(rides, before=None):
+    # Rides finalizados con fecha anterior a `before` (todos si es None).
+    selected = []
+    for ride in rides:
+        if ride.get('status') != FINISHED:
+            continue
+        if before is not None:
+            try:
+                if datetime.fromisoformat(ride.get('rideDateAndTime')) >= before:
+                    continue
+            except (TypeError, ValueError):
+                pass
+        selected.append(ride)
+    return selected
+
+
+class _Segment:
+    def __init__(self, items):
+        self.records = {collection: {item['id']: item for item in items.get(collection, [])}
+                        for collection in COLD_COLLECTIONS}
+        self.by_ride = {}
+        for participation in items.get('ride_participations', []):
+            self.by_ride.setdefault(participation.get('rideId'), []).append(participation)
+
+
+class Archive:
+    # Segmentos de solo lectura en `directory`, uno por mes de
+    # rideDateAndTime y por corrida de archivado (AAAA-MM-NNNN.json), con
+    # los rides y sus participaciones. manifest.json lista los segmentos con
+    # el rango de ids de cada coleccion; se escribe despues de los segmentos,
+    # asi un segmento existe recien cuando figura en el manifest.
+    #
+    # Los segmentos se leen solo cuando una consulta cae en su rango de ids y
+    # se mantienen hasta `max_segments` en memoria (los menos usados salen
+    # primero). Si otro proceso archiva, el manifest nuevo se detecta por su
+    # firma en disco.
+    def __init__(self, directory, max_segments=8):
+        self.directory = directory
+        self.max_segments = max_segments
+        self._path = os.path.join(directory, MANIFEST)
+        self._signatures = LoadCache()
+        self._manifest = {'segments': [], 'maxIds': {}}
+        self._loaded = {}
+        self.segment_loads = 0
+
+    def _current(self):
+        fresh, signature = self._signatures.check(MANIFEST, self._path)
+        if not fresh:
+            try:
+                with open(self._path, 'r') as f:
+                    manifest = json.load(f)
+            except FileNotFoundError:
+                manifest = {'segments': [], 'maxIds': {}}
+            self._manifest = manifest
+            self._signatures.record(MANIFEST, signature=signature)
+        return self._manifest
+
+    def _segment(self, name):
+        segment = self._loaded.get(name)
+        if segment is not None:
+            # Reinsertar lo deja al final: el orden del dict es el de uso.
+            self._loaded.pop(name, None)
+            self._loaded[name] = segment
+            return segment
+        with open(os.path.join(self.directory, name + '.json'), 'r') as f:
+            segment = _Segment(json.load(f))
+        self.segment_loads += 1
+        loaded = dict(self._loaded)
+        loaded[name] = segment
+        while len(loaded) > self.max_segments:
+            del loaded[next(iter(loaded))]
+        self._loaded = loaded
+        return segment
+
+    def _candidates(self, collection, record_id):
+        # Segmentos cuyo rango de ids incluye record_id, los mas nuevos primero.
+        for entry in reversed(self._current()['segments']):
+            low, high = entry[collection]
+            if low is not None and low <= record_id <= high:
+                yield self._segment(entry['name'])
+
+    def get(self, collection, record_id):
+        # Registro archivado de `collection` ('rides' o 'ride_participations').
+        for segment in self._candidates(collection, record_id):
+            found = segment.records[collection].get(record_id)
+            if found is not None:
+                return found
+        return None
+
+    def participations_of_ride(self, ride_id):
+        for segment in self._candidates('rides', ride_id):
+            if ride_id in segment.records['rides']:
+                return segment.by_ride.get(ride_id, [])
+        return []
+
+    def records(self, collection):
+        # Todos los registros archivados de `collection`, segmento por
+        # segmento (para exportar): se leen sin pasar por los segmentos en
+        # memoria, asi no desplazan a los que usan las consultas.
+        for entry in self._current()['segments']:
+            if entry[collection][0] is None:
+                continue
+            with open(os.path.join(self.directory, entry['name'] + '.json'), 'r') as f:
+                items = json.load(f)
+            yield from items.get(collection, [])
+
+    def max_id(self, collection):
+        return self._current()['maxIds'].get(collection, 0)
+
+    def add(self, rides, participations):
+        # Escribe un segmento nuevo por mes con estos rides y las
+        # participaciones de cada uno, y despues el manifest. Devuelve los
+        # nombres de los segmentos escritos.
+        manifest = self._current()
+        by_month = {}
+        month_of_ride = {}
+        for ride in rides:
+            month = ride_month(ride)
+            month_of_ride[ride['id']] = month
+            by_month.setdefault(month, {'rides': [], 'ride_participations': []})['rides'].append(ride)
+        for participation in participations:
+            by_month[month_of_ride[participation['rideId']]]['ride_participations'].append(participation)
+
+        if by_month:
+            os.makedirs(self.directory, exist_ok=True)
+        existing = {entry['name'] for entry in manifest['segments']}
+        segments = list(manifest['segments'])
+        max_ids = dict(manifest['maxIds'])
+        names = []
+        for month, items in sorted(by_month.items()):
+            sequence = 1
+            while '%s-%04d' % (month, sequence) in existing:
+                sequence += 1
+            name = '%s-%04d' % (month, sequence)
+            atomic_write_json(os.path.join(self.directory, name + '.json'), items)
+            entry = {'name': name, 'month': month}
+            for collection in COLD_COLLECTIONS:
+                ids = [item['id'] for item in items[collection]]
+                entry[collection] = [min(ids, default=None), max(ids, default=None)]
+                if ids:
+                    max_ids[collection] = max(max_ids.get(collection, 0), max(ids))
+            segments.append(entry)
+            names.append(name)
+        if names:
+            atomic_write_json(self._path, {'segments': segments, 'maxIds': max_ids})
+        return names
+
+    def stats(self):
+        manifest = self._current()
+        return {
+            'segments': len(manifest['segments']),
+            'loadedSegments': len(self._loaded),
+            'segmentLoads': self.segment_loads,
+        }
+
+
+def archive_backend(backend, archive, before=None):
+    # Archivado sin DataHandler: lee las colecciones del backend, escribe
+    # los segmentos y reescribe las colecciones calientes sin lo archivado.
+    with backend.lock():
+        rides = backend.load('rides') or []
+        participations = backend.load('ride_participations') or []
+        cold = finished_rides(rides, before)
+        ride_ids = {ride['id'] for ride in cold}
+        if not cold:
+            return 0, 0
+        cold_participations = [p for p in participations if p.get('rideId') in ride_ids]
+        archive.add(cold, cold_participations)
+        backend.save('rides', [ride for ride in rides if ride['id'] not in ride_ids], {}, rewrite=True)
+        backend.save('ride_participations',
+                     [p for p in participations if p.get('rideId') not in ride_ids], {}, rewrite=True)
+    return len(cold), len(cold_participations)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data-dir', default='src/data')
+    parser.add_argument('--older-than-days', type=int, default=30,
+                        help="solo rides con fecha de hace mas de N dias")
+    args = parser.parse_args(argv)
+
+    from . import create_backend
+    backend = create_backend(data_dir=args.data_dir)
+    try:
+        rides, participations = archive_backend(
+            backend, Archive(os.path.join(args.data_dir, 'archive')),
+            datetime.now() - timedelta(days=args.older_than_days))
+    finally:
+        backend.close()
+    print(f"rides: {rides}")
+    print(f"ride_participations: {participations}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+from contextlib import nullcontext
+
+COLLECTIONS = ('users', 'rides', 'ride_participations', 'user_stats')
+
+
+def materialize(items):
+    # save/compact reciben la lista de registros o una funcion sin argumentos
+    # que la arma: DataHandler no convierte una coleccion entera si el
+    # backend solo agrega los cambios a un journal.
+    return items() if callable(items) else items
+
+
+class StorageBackend:
+    # Interfaz de persistencia de DataHandler. Las colecciones viven en
+    # memoria en DataHandler; el backend solo las lee y escribe.
+    supports_queries = False
+
+    def load(self, collection):
+        # Devuelve la lista de registros, o None si no cambio desde la
+        # ultima lectura/escritura de este proceso.
+        raise NotImplementedError
+
+    def save(self, collection, items, changes, rewrite):
+        # changes: {id: registro | None (borrado)}. rewrite=True indica que
+        # la coleccion se reemplazo entera y hay que escribirla completa.
+        # items puede ser una funcion: ver materialize().
+        raise NotImplementedError
+
+    def compact(self, collection, items):
+        pass
+
+    def invalidate(self, collection=None):
+        pass
+
+    def lock(self, shared=False):
+        # Exclusion entre procesos que comparten el almacenamiento. DataHandler
+        # toma el lock compartido en las consultas y el exclusivo alrededor de
+        # cada ciclo cargar-modificar-guardar.
+        return nullcontext()
+
+    def stats(self):
+        return {}
+
+    def io_stats(self):
+        # Bytes leidos y escritos por coleccion: {(coleccion, 'read' |
+        # 'written'): n}. Vacio si el backend no los puede medir.
+        return {}
+
+    def close(self):
+        pass
+
+    # Consultas opcionales (supports_queries = True)
+
+    def participations_of_ride(self, ride_id):
+        raise NotImplementedError
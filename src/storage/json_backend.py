@@ -0,0 +1,114 @@
+import json
+import os
+
+from .base import StorageBackend, materialize
+from .journal import Journal, atomic_write_json
+from .load_cache import LoadCache
+from .multiprocess import FileLock, GenerationFile
+
+
+class JsonBackend(StorageBackend):
+    FILES = {
+        'users': 'users.json',
+        'rides': 'rides.json',
+        'ride_participations': 'rideParticipations.json',
+        'user_stats': 'userStats.json',
+    }
+    PERSISTENCE_MODES = ('json', 'journal')
+
+    def __init__(self, data_dir='src/data', persistence='json', fsync=False, compact_every=1000,
+                 multiprocess=False):
+        if persistence not in self.PERSISTENCE_MODES:
+            raise ValueError(f"Unknown persistence mode: {persistence}")
+        self.data_dir = data_dir
+        self.persistence = persistence
+        self.fsync = fsync
+        self.compact_every = compact_every
+        self.paths = {name: os.path.join(data_dir, file) for name, file in self.FILES.items()}
+        self.journals = {name: Journal(path + '.log', fsync) for name, path in self.paths.items()}
+        self.load_cache = LoadCache()
+        self._io_bytes = {}
+        # Modo multiproceso: los cambios de otros procesos se detectan con el
+        # archivo de generaciones en lugar de la firma de cada archivo, y
+        # cada mutacion se hace bajo un flock exclusivo.
+        self.multiprocess = multiprocess
+        self.file_lock = FileLock(os.path.join(data_dir, '.lock')) if multiprocess else None
+        self.generation = GenerationFile(os.path.join(data_dir, '.generation')) if multiprocess else None
+
+    def _sources(self, collection):
+        if self.persistence == 'journal':
+            return (self.paths[collection], self.journals[collection].path)
+        return (self.paths[collection],)
+
+    def _read(self, path):
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return []
+
+    def _write(self, path, items):
+        # Devuelve los bytes escritos.
+        atomic_write_json(path, items, self.fsync)
+        return os.path.getsize(path)
+
+    def _count_bytes(self, collection, direction, n):
+        key = (collection, direction)
+        self._io_bytes[key] = self._io_bytes.get(key, 0) + n
+
+    def _check(self, collection):
+        if self.multiprocess:
+            return self.load_cache.check(collection, signature=self.generation.get(collection))
+        return self.load_cache.check(collection, *self._sources(collection))
+
+    def _record(self, collection):
+        if self.multiprocess:
+            self.load_cache.record(collection, signature=self.generation.bump(collection))
+        else:
+            self.load_cache.record(collection, *self._sources(collection))
+
+    def load(self, collection):
+        fresh, signature = self._check(collection)
+        if fresh:
+            return None
+        items = self._read(self.paths[collection])
+        if self.persistence == 'journal':
+            items = self.journals[collection].replay(items)
+        self._count_bytes(collection, 'read', sum(
+            os.path.getsize(path) for path in self._sources(collection) if os.path.exists(path)))
+        self.load_cache.record(collection, signature=signature)
+        return items
+
+    def save(self, collection, items, changes, rewrite):
+        journal = self.journals[collection]
+        if self.persistence == 'journal' and not rewrite:
+            self._count_bytes(collection, 'written', journal.append(changes))
+            if journal.entries >= self.compact_every:
+                self.compact(collection, items)
+                return
+        else:
+            self._count_bytes(collection, 'written', self._write(self.paths[collection], materialize(items)))
+            if self.persistence == 'journal':
+                journal.reset()
+        self._record(collection)
+
+    def compact(self, collection, items):
+        # Vuelca el estado en memoria a un snapshot atomico y vacia el log.
+        self._count_bytes(collection, 'written', self._write(self.paths[collection], materialize(items)))
+        if self.persistence == 'journal':
+            self.journals[collection].reset()
+        self._record(collection)
+
+    def lock(self, shared=False):
+        if not self.multiprocess:
+            return super().lock(shared)
+        return self.file_lock.hold(shared)
+
+    def invalidate(self, collection=None):
+        self.load_cache.invalidate(collection)
+
+    def stats(self):
+        return self.load_cache.stats()
+
+    def io_stats(self):
+        return dict(self._io_bytes)
@@ -0,0 +1,52 @@
+import os
+
+_NEVER_LOADED = object()
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class LoadCache:
+    # Recuerda la firma (mtime, size, inode) de los archivos de los que sale
+    # cada coleccion para volver a parsearlos solo cuando cambian en disco.
+    def __init__(self):
+        self._signatures = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def signature(*paths):
+        return tuple(_stat(path) for path in paths)
+
+    def check(self, key, *paths, signature=_NEVER_LOADED):
+        if signature is _NEVER_LOADED:
+            signature = self.signature(*(paths or (key,)))
+        if self._signatures.get(key, _NEVER_LOADED) == signature:
+            self.hits += 1
+            return True, signature
+        self.misses += 1
+        return False, signature
+
+    def record(self, key, *paths, signature=_NEVER_LOADED):
+        if signature is _NEVER_LOADED:
+            signature = self.signature(*(paths or (key,)))
+        self._signatures[key] = signature
+
+    def invalidate(self, key=None):
+        if key is None:
+            self._signatures.clear()
+        else:
+            self._signatures.pop(key, None)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hitRate': self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,41 @@
+"""Importa los archivos JSON de src/data a una base SQLite.
+
+Uso (desde la raiz del repo):
+    python -m src.storage.migrate --url sqlite:///src/data/ef_is.db
+    EF_IS_STORAGE=sqlite:///src/data/ef_is.db python src/controller.py
+"""
+import argparse
+
+from .base import COLLECTIONS
+from .json_backend import JsonBackend
+
+
+def migrate(source, target):
+    counts = {}
+    for collection in COLLECTIONS:
+        items = source.load(collection) or []
+        target.save(collection, items, {}, rewrite=True)
+        counts[collection] = len(items)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data-dir', default='src/data')
+    parser.add_argument('--persistence', default='json', choices=JsonBackend.PERSISTENCE_MODES,
+                        help="'journal' aplica tambien los logs *.json.log")
+    parser.add_argument('--url', default='sqlite:///src/data/ef_is.db')
+    args = parser.parse_args(argv)
+
+    from .sql_backend import SqlBackend
+    target = SqlBackend(args.url)
+    try:
+        counts = migrate(JsonBackend(args.data_dir, args.persistence), target)
+    finally:
+        target.close()
+    for collection, count in counts.items():
+        print(f"{collection}: {count}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+import json
+import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin flock, solo un proceso por directorio.
+    fcntl = None
+
+from .journal import atomic_write_json
+from .load_cache import LoadCache
+
+
+class FileLock:
+    # flock(2) advisorio sobre un archivo del directorio de datos. Cada
+    # adquisicion abre su propio descriptor: flock se comparte por
+    # descriptor, y varios hilos lectores del mismo proceso no deben
+    # liberarse el lock entre ellos.
+    def __init__(self, path):
+        self.path = path
+
+    @contextmanager
+    def hold(self, shared=False):
+        if fcntl is None:
+            yield
+            return
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+
+class GenerationFile:
+    # {coleccion: n}: cada save incrementa el numero de su coleccion. Un
+    # proceso compara el numero con el de su ultima lectura y solo relee las
+    # colecciones que otro proceso modifico. El archivo se vuelve a parsear
+    # solo cuando cambia su firma en disco.
+    def __init__(self, path):
+        self.path = path
+        self._cache = LoadCache()
+        self._values = {}
+
+    def read(self):
+        fresh, signature = self._cache.check(self.path)
+        if not fresh:
+            try:
+                with open(self.path, 'r') as f:
+                    self._values = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                self._values = {}
+            self._cache.record(self.path, signature=signature)
+        return self._values
+
+    def get(self, collection):
+        return self.read().get(collection, 0)
+
+    def bump(self, collection):
+        # Debe llamarse con el lock exclusivo tomado.
+        values = dict(self.read())
+        values[collection] = values.get(collection, 0) + 1
+        atomic_write_json(self.path, values)
+        self._values = values
+        self._cache.record(self.path)
+        return values[collection]
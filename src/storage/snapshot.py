@@ -0,0 +1,93 @@
+"""Convierte las colecciones entre los archivos JSON y snapshots binarios.
+
+Uso (desde la raiz del repo):
+    python -m src.storage.snapshot to-snapshot --data-dir src/data
+    python -m src.storage.snapshot to-json --data-dir src/data
+    EF_IS_STORAGE=snapshot python src/controller.py
+"""
+import argparse
+import marshal
+
+from .journal import atomic_write_bytes
+from .json_backend import JsonBackend
+from .migrate import migrate
+
+try:
+    from ..utils.gc_pause import paused_gc
+except ImportError:
+    from utils.gc_pause import paused_gc
+
+MAGIC = b'EFIS'
+FORMAT_VERSION = 1
+# Version 4 de marshal: los objetos repetidos se escriben una vez y luego
+# como referencia.
+MARSHAL_VERSION = 4
+
+
+def encode(items):
+    # Las cadenas iguales (claves, status, finalAddress...) se reemplazan por un
+    # mismo objeto: marshal guarda la primera aparicion y despues solo una
+    # referencia, asi el archivo lleva su propia tabla de cadenas y al cargar
+    # los registros comparten esas cadenas en memoria.
+    strings = {}
+
+    def share(value):
+        if isinstance(value, str):
+            return strings.setdefault(value, value)
+        if isinstance(value, list):
+            return [share(v) for v in value]
+        if isinstance(value, dict):
+            return {share(k): share(v) for k, v in value.items()}
+        return value
+
+    return MAGIC + bytes([FORMAT_VERSION]) + marshal.dumps(share(items), MARSHAL_VERSION)
+
+
+def decode(data):
+    # marshal no es seguro con datos no confiables: solo se leen snapshots
+    # escritos por este mismo backend en el directorio de datos.
+    header = len(MAGIC) + 1
+    if len(data) < header or data[:len(MAGIC)] != MAGIC or data[len(MAGIC)] != FORMAT_VERSION:
+        raise ValueError("Not an EF_IS snapshot")
+    with paused_gc():
+        return marshal.loads(memoryview(data)[header:])
+
+
+class SnapshotBackend(JsonBackend):
+    # Mismo comportamiento que JsonBackend (cache de carga, journal,
+    # multiproceso) pero cada coleccion vive en <nombre>.snap.
+    FILES = {name: file.rsplit('.', 1)[0] + '.snap' for name, file in JsonBackend.FILES.items()}
+
+    def _read(self, path):
+        try:
+            with open(path, 'rb') as f:
+                return decode(f.read())
+        except FileNotFoundError:
+            return []
+
+    def _write(self, path, items):
+        data = encode(items)
+        atomic_write_bytes(path, data, self.fsync)
+        return len(data)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('direction', choices=('to-snapshot', 'to-json'))
+    parser.add_argument('--data-dir', default='src/data')
+    parser.add_argument('--persistence', default='json', choices=JsonBackend.PERSISTENCE_MODES,
+                        help="'journal' aplica tambien los logs del origen")
+    args = parser.parse_args(argv)
+
+    json_backend = JsonBackend(args.data_dir, args.persistence)
+    snapshot_backend = SnapshotBackend(args.data_dir, args.persistence)
+    if args.direction == 'to-snapshot':
+        counts = migrate(json_backend, snapshot_backend)
+    else:
+        counts = migrate(snapshot_backend, json_backend)
+    for collection, count in counts.items():
+        print(f"{collection}: {count}")
+
+
+if __name__ == '__main__':
+    main()
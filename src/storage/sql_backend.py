@@ -0,0 +1,170 @@
+import json
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, Text, create_engine, event, select
+from sqlalchemy.pool import QueuePool
+
+from .base import COLLECTIONS, StorageBackend, materialize
+
+# SQLite limita la cantidad de parametros por sentencia.
+SQL_CHUNK = 500
+
+metadata = MetaData()
+
+users_table = Table(
+    'users', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('alias', String, nullable=False, unique=True, index=True),
+    Column('name', String, nullable=False),
+    Column('carPlate', String, nullable=False),
+    Column('rides', Text, nullable=False, default='[]'),
+)
+
+rides_table = Table(
+    'rides', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('rideDateAndTime', String, nullable=False, index=True),
+    Column('finalAddress', String, nullable=False),
+    Column('allowedSpaces', Integer, nullable=False),
+    Column('rideDriver', Integer, nullable=False, index=True),
+    Column('status', String, nullable=False),
+    Column('participants', Text, nullable=False, default='[]'),
+)
+
+ride_participations_table = Table(
+    'ride_participations', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('confirmation', String),
+    Column('destination', String),
+    Column('occupiedSpaces', Integer),
+    Column('status', String, index=True),
+    Column('rideId', Integer, nullable=False, index=True),
+)
+
+user_stats_table = Table(
+    'user_stats', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('counts', Text, nullable=False, default='{}'),
+)
+
+# Version por coleccion: cada save la incrementa en la misma transaccion, asi
+# load() detecta con una sola consulta si otro proceso escribio.
+versions_table = Table(
+    'collection_versions', metadata,
+    Column('name', String, primary_key=True),
+    Column('version', Integer, nullable=False),
+)
+
+TABLES = {
+    'users': users_table,
+    'rides': rides_table,
+    'ride_participations': ride_participations_table,
+    'user_stats': user_stats_table,
+}
+# Columnas que en los registros son listas/dicts y en SQLite se guardan como
+# JSON, con el tipo del valor vacio.
+JSON_COLUMNS = {
+    'users': {'rides': list},
+    'rides': {'participants': list},
+    'ride_participations': {},
+    'user_stats': {'counts': dict},
+}
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
+
+
+class SqlBackend(StorageBackend):
+    supports_queries = True
+
+    def __init__(self, url='sqlite:///src/data/ef_is.db', pool_size=5):
+        self.url = url
+        options = {}
+        if url.startswith('sqlite'):
+            options = {
+                'poolclass': QueuePool,
+                'pool_size': pool_size,
+                'connect_args': {'check_same_thread': False},
+            }
+        self.engine = create_engine(url, future=True, **options)
+        if url.startswith('sqlite'):
+            event.listen(self.engine, 'connect', _set_sqlite_pragmas)
+        metadata.create_all(self.engine)
+        with self.engine.begin() as conn:
+            existing = {row.name for row in conn.execute(select(versions_table.c.name))}
+            for name in COLLECTIONS:
+                if name not in existing:
+                    conn.execute(versions_table.insert().values(name=name, version=0))
+        self._seen = {}
+
+    def _version(self, conn, collection):
+        return conn.execute(
+            select(versions_table.c.version).where(versions_table.c.name == collection)
+        ).scalar_one()
+
+    def _to_row(self, collection, item):
+        row = {column.name: item.get(column.name) for column in TABLES[collection].columns}
+        for column, empty in JSON_COLUMNS[collection].items():
+            row[column] = json.dumps(row[column] or empty())
+        return row
+
+    def _to_item(self, collection, row):
+        item = dict(row._mapping)
+        for column, empty in JSON_COLUMNS[collection].items():
+            item[column] = json.loads(item[column]) if item[column] else empty()
+        return item
+
+    def load(self, collection):
+        table = TABLES[collection]
+        with self.engine.connect() as conn:
+            version = self._version(conn, collection)
+            if self._seen.get(collection) == version:
+                return None
+            rows = conn.execute(select(table).order_by(table.c.id))
+            items = [self._to_item(collection, row) for row in rows]
+        self._seen[collection] = version
+        return items
+
+    def save(self, collection, items, changes, rewrite):
+        table = TABLES[collection]
+        with self.engine.begin() as conn:
+            if rewrite:
+                items = materialize(items)
+                conn.execute(table.delete())
+                if items:
+                    conn.execute(table.insert(), [self._to_row(collection, item) for item in items])
+            else:
+                # Upsert portable (INSERT OR REPLACE es solo de SQLite): se
+                # borran todos los ids cambiados y se insertan los que siguen
+                # vivos, en la misma transaccion.
+                changed = list(changes)
+                upserts = [self._to_row(collection, record) for record in changes.values() if record is not None]
+                for start in range(0, len(changed), SQL_CHUNK):
+                    conn.execute(table.delete().where(table.c.id.in_(changed[start:start + SQL_CHUNK])))
+                if upserts:
+                    conn.execute(table.insert(), upserts)
+            conn.execute(
+                versions_table.update()
+                .where(versions_table.c.name == collection)
+                .values(version=versions_table.c.version + 1)
+            )
+            self._seen[collection] = self._version(conn, collection)
+
+    def invalidate(self, collection=None):
+        if collection is None:
+            self._seen.clear()
+        else:
+            self._seen.pop(collection, None)
+
+    def close(self):
+        self.engine.dispose()
+
+    def participations_of_ride(self, ride_id):
+        table = ride_participations_table
+        with self.engine.connect() as conn:
+            rows = conn.execute(select(table).where(table.c.rideId == ride_id).order_by(table.c.id))
+            return [self._to_item('ride_participations', row) for row in rows]
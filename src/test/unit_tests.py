@@ -1,15 +1,121 @@
 import unittest
+import gc
+import gzip
 import json
+import multiprocessing
 import os
+import pstats
+import shutil
+import sys
 import tempfile
+import threading
+import time
+import zlib
 from unittest.mock import patch, mock_open
+from sqlalchemy import event
+from benchmarks import bench_load, datagen, results as bench_results
+from src import controller
+from src.bulk import main as bulk_main
 from src.data_handler import DataHandler
+from src.storage import JsonBackend
+from src.storage.archive import Archive, archive_backend
+from src.storage.journal import atomic_write_json
+from src.storage.migrate import migrate
+from src.storage.snapshot import SnapshotBackend, main as snapshot_main
+from src.storage.sql_backend import SqlBackend
+from src.utils.admission import AdmissionController, Limiter, Overloaded
+from src.utils.bulk import to_line
+from src.utils.columnar import ColumnarTable, participation_table
+from src.utils.events import EventHub
+from src.utils.fields import RIDE_DETAIL_FIELDS, parse_fields
+from src.utils.flusher import Flusher
+from src.utils.gc_pause import paused_gc
+from src.utils.lru import LRUCache
+from src.utils.metrics import Counter, Histogram
+from src.utils.profiler import RequestProfiler
+from src.utils.ride_search import RideSearch
 
-class TestDataHandler(unittest.TestCase):
+
+class DataDirTestCase(unittest.TestCase):
+    # Directorios temporales (datos, journals, snapshots, bases sqlite,
+    # segmentos de archivo) que se borran al terminar cada test.
+
+    def make_temp_dir(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path, True)
+        return path
+
+    def write_data_dir(self, users=(), rides=(), participations=()):
+        data_dir = self.make_temp_dir()
+        for name, items in (('users.json', users), ('rides.json', rides),
+                            ('rideParticipations.json', participations)):
+            with open(os.path.join(data_dir, name), 'w') as f:
+                json.dump(list(items), f)
+        return data_dir
+
+
+# Datos de prueba comunes: un conductor, dos pasajeros y un ride del conductor.
+USERS = {
+    'driver': {"id": 1, "alias": "driver", "name": "Driver", "carPlate": "AAA-111"},
+    'ana': {"id": 2, "alias": "ana", "name": "Ana", "carPlate": "BBB-222"},
+    'luis': {"id": 3, "alias": "luis", "name": "Luis", "carPlate": "CCC-333"},
+}
+
+
+def user(alias, /, **fields):
+    # Copia de USERS[alias] sin rides, con los campos cambiados.
+    record = dict(USERS[alias], rides=[])
+    record.update(fields)
+    return record
+
+
+def passengers(count, first=2, plate="P-%d"):
+    # `count` usuarios user<id> con ids desde `first`.
+    return [{"id": i, "alias": "user%d" % i, "name": "User %d" % i, "carPlate": plate % i, "rides": []}
+            for i in range(first, first + count)]
+
+
+def ride(ride_id=1, when="2025-07-20 08:00", address="UTEC", spaces=3, driver=1):
+    return {"id": ride_id, "rideDateAndTime": when, "finalAddress": address,
+            "allowedSpaces": spaces, "rideDriver": driver, "status": "Ready", "participants": []}
+
+
+# Participacion rechazada de ana en un ride que ya no existe (rides=[5]).
+REJECTED_PARTICIPATION = {"id": 5, "confirmation": "15-07-25", "destination": "UTEC",
+                          "occupiedSpaces": 1, "status": "Rechazada", "rideId": 9}
+
+
+class ControllerTestCase(DataDirTestCase):
+    # Tests de endpoints: un DataHandler sobre SEED_USERS/SEED_RIDES y el
+    # controller apuntando a el. Cada clase cambia la semilla y agrega lo
+    # suyo en setUp despues de super().setUp().
+    SEED_USERS = [user('driver'), user('ana')]
+    SEED_RIDES = [ride()]
+
+    def setUp(self):
+        self.data_dir = self.write_data_dir(users=self.SEED_USERS, rides=self.SEED_RIDES)
+        self.data_handler = DataHandler(data_dir=self.data_dir)
+        self.patch_controller('data_handler', self.data_handler)
+        self.client = controller.app.test_client()
+
+    def patch_controller(self, name, value):
+        p = patch.object(controller, name, value)
+        p.start()
+        self.addCleanup(p.stop)
+
+
+def join_rides_in_worker(data_dir, aliases):
+    data_handler = DataHandler(data_dir=data_dir, multiprocess=True)
+    for alias in aliases:
+        if not data_handler.request_to_join_ride('driver', 1, alias):
+            os._exit(1)
+
+
+class TestDataHandler(DataDirTestCase):
     
     def setUp(self):
-        self.test_dir = tempfile.mkdtemp()
-        self.data_handler = DataHandler()
+        self.test_dir = self.make_temp_dir()
+        self.data_handler = DataHandler(data_dir=self.test_dir)
         
         # Datos de prueba
         self.test_users = [
@@ -142,5 +248,1567 @@ class TestDataHandler(unittest.TestCase):
         result = self.data_handler.generate_new_id(test_data)
         self.assertEqual(result, 4)
 
+class TestDataHandlerIndexes(DataDirTestCase):
+
+    def setUp(self):
+        self.data_handler = DataHandler()
+        self.data_handler.users = [user('driver'), user('ana', rides=[10]), user('luis', rides=[11])]
+        self.data_handler.rides = [dict(ride(), participants=[2, 3])]
+        self.data_handler.ride_participations = [
+            {"id": 10, "confirmation": "15-07-25", "destination": "UTEC", "occupiedSpaces": 1,
+             "status": "Aceptada", "rideId": 1},
+            {"id": 11, "confirmation": "15-07-25", "destination": "UTEC", "occupiedSpaces": 2,
+             "status": "Pendiente", "rideId": 1}
+        ]
+        for name in ('load_users', 'load_rides', 'load_ride_participations', 'load_user_stats',
+                     'save_users', 'save_rides', 'save_ride_participations', 'save_user_stats'):
+            p = patch.object(self.data_handler, name)
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_lookup_uses_index_after_assignment(self):
+        """Caso de éxito: Reasignar la colección reconstruye los índices"""
+        self.assertEqual(self.data_handler.get_user_by_attribute('alias', 'luis')['id'], 3)
+        self.assertEqual(self.data_handler.get_ride_participation_by_attribute('rideId', 1)['id'], 10)
+        self.assertEqual(self.data_handler.get_user_by_attribute('name', 'Ana')['id'], 2)
+
+    def test_request_to_join_updates_indexes(self):
+        """Caso de éxito: La nueva participación es visible por id y por rideId"""
+        self.data_handler.users.append(
+            {"id": 4, "alias": "eva", "name": "Eva", "carPlate": "DDD-444", "rides": []})
+        self.data_handler.users = self.data_handler.users
+
+        result = self.data_handler.request_to_join_ride('driver', 1, 'eva')
+
+        self.assertIs(self.data_handler.get_ride_participation_by_attribute('id', result['id']), result)
+        self.assertIn(result, self.data_handler._participations_of_ride(1))
+
+    def test_unload_participant_updates_indexes(self):
+        """Caso de éxito: Descargar un participante lo elimina de los índices"""
+        result = self.data_handler.unload_participant('luis', 1)
+
+        self.assertIsNotNone(result)
+        self.assertIsNone(self.data_handler.get_ride_participation_by_attribute('id', 11))
+        self.assertEqual([p['id'] for p in self.data_handler._participations_of_ride(1)], [10])
+
+    def test_ride_details_uses_each_participant_participation(self):
+        """Caso de éxito: Cada participante muestra su propia participación"""
+        details = self.data_handler.get_ride_details('driver', 1)
+
+        statuses = {p['participant']['alias']: p['status'] for p in details['participants']}
+        self.assertEqual(statuses, {'ana': 'Aceptada', 'luis': 'Pendiente'})
+
+
+class TestLoadCache(DataDirTestCase):
+
+    def setUp(self):
+        self.data_dir = self.write_data_dir(users=[user('driver')], rides=[ride()])
+        self.data_handler = DataHandler(data_dir=self.data_dir)
+
+    def test_unchanged_file_is_not_reparsed(self):
+        """Caso de éxito: Cargar un archivo sin cambios es un hit del cache"""
+        users = self.data_handler.users
+        before = self.data_handler.load_cache_stats()
+
+        self.data_handler.get_user_by_attribute('alias', 'driver')
+        self.data_handler.get_all_users()
+
+        after = self.data_handler.load_cache_stats()
+        self.assertEqual(after['hits'] - before['hits'], 2)
+        self.assertEqual(after['misses'], before['misses'])
+        self.assertIs(self.data_handler.users, users)
+
+    def test_external_change_is_reloaded(self):
+        """Caso de éxito: Un archivo modificado en disco se vuelve a leer"""
+        with open(os.path.join(self.data_dir, 'users.json'), 'w') as f:
+            json.dump([{"id": 7, "alias": "nuevo", "name": "Nuevo", "carPlate": "ZZZ-999", "rides": []}], f)
+
+        result = self.data_handler.get_user_by_attribute('alias', 'nuevo')
+
+        self.assertIsNotNone(result)
+        self.assertIsNone(self.data_handler.get_user_by_attribute('alias', 'driver'))
+
+    def test_own_save_does_not_invalidate(self):
+        """Caso de éxito: Guardar no obliga a releer lo que acabamos de escribir"""
+        self.data_handler.start_ride('driver', 1)
+        rides = self.data_handler.rides
+        misses = self.data_handler.load_cache_stats()['misses']
+
+        self.data_handler.get_ride_by_attribute('id', 1)
+
+        self.assertEqual(self.data_handler.load_cache_stats()['misses'], misses)
+        self.assertIs(self.data_handler.rides, rides)
+        with open(os.path.join(self.data_dir, 'rides.json')) as f:
+            self.assertEqual(json.load(f)[0]['status'], 'En Progreso')
+
+
+class TestJournalPersistence(DataDirTestCase):
+
+    def setUp(self):
+        self.data_dir = self.write_data_dir(users=[user('driver'), user('ana')], rides=[ride()])
+
+    def read(self, name):
+        with open(os.path.join(self.data_dir, name)) as f:
+            return f.read()
+
+    def test_mutation_appends_to_log_only(self):
+        """Caso de éxito: Una mutación solo agrega registros al log"""
+        data_handler = DataHandler(data_dir=self.data_dir, persistence='journal')
+        snapshot = self.read('rides.json')
+
+        data_handler.request_to_join_ride('driver', 1, 'ana')
+
+        self.assertEqual(self.read('rides.json'), snapshot)
+        log = [json.loads(line) for line in self.read('rides.json.log').splitlines()]
+        self.assertEqual(log, [{"op": "put", "record": data_handler.rides[0]}])
+
+    def test_restart_replays_snapshot_and_log(self):
+        """Caso de éxito: Al iniciar se reaplica el log sobre el snapshot"""
+        data_handler = DataHandler(data_dir=self.data_dir, persistence='journal')
+        data_handler.request_to_join_ride('driver', 1, 'ana')
+        data_handler.unload_participant('ana', 1)
+        data_handler.request_to_join_ride('driver', 1, 'ana')
+
+        restarted = DataHandler(data_dir=self.data_dir, persistence='journal')
+
+        self.assertEqual(restarted.users, data_handler.users)
+        self.assertEqual(restarted.rides, data_handler.rides)
+        self.assertEqual(restarted.ride_participations, data_handler.ride_participations)
+
+    def test_compaction_writes_snapshot_and_truncates_log(self):
+        """Caso de éxito: La compactación vuelca el log en un snapshot nuevo"""
+        data_handler = DataHandler(data_dir=self.data_dir, persistence='journal', compact_every=2)
+        data_handler.start_ride('driver', 1)
+        data_handler.end_ride('driver', 1)
+
+        self.assertEqual(self.read('rides.json.log'), '')
+        self.assertEqual(json.loads(self.read('rides.json'))[0]['status'], 'Finalizada')
+
+    def test_torn_last_line_is_ignored(self):
+        """Caso de error: Una línea incompleta al final del log se descarta"""
+        data_handler = DataHandler(data_dir=self.data_dir, persistence='journal')
+        data_handler.start_ride('driver', 1)
+        with open(os.path.join(self.data_dir, 'rides.json.log'), 'a') as f:
+            f.write('{"op": "put", "rec')
+
+        restarted = DataHandler(data_dir=self.data_dir, persistence='journal')
+
+        self.assertEqual(restarted.rides[0]['status'], 'En Progreso')
+
+    def test_rewrite_keeps_file_permissions(self):
+        """Caso de éxito: Reescribir un archivo conserva sus permisos y los nuevos siguen la umask"""
+        path = os.path.join(self.data_dir, 'rides.json')
+        os.chmod(path, 0o644)
+        data_handler = DataHandler(data_dir=self.data_dir)
+        data_handler.start_ride('driver', 1)
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o644)
+
+        umask = os.umask(0)
+        os.umask(umask)
+        new_path = os.path.join(self.data_dir, 'nuevo.json')
+        atomic_write_json(new_path, [])
+        mode = os.stat(new_path).st_mode & 0o777
+        self.assertEqual(mode, 0o666 & ~umask)
+
+    def test_fsync_from_environment(self):
+        """Caso de éxito: EF_IS_FSYNC activa fsync en el snapshot y en el log"""
+        with patch.dict(os.environ, {'EF_IS_FSYNC': '1'}):
+            data_handler = DataHandler(data_dir=self.data_dir, persistence='journal')
+        self.assertTrue(data_handler.backend.fsync)
+        with patch('os.fsync') as fsync:
+            data_handler.start_ride('driver', 1)
+        self.assertTrue(fsync.called)
+        with patch.dict(os.environ, {'EF_IS_FSYNC': '0'}):
+            self.assertFalse(DataHandler(data_dir=self.data_dir).backend.fsync)
+
+
+class TestUserStats(DataDirTestCase):
+
+    def setUp(self):
+        self.data_dir = self.write_data_dir(
+            users=[user('driver'), user('ana', rides=[5])],
+            rides=[ride(), ride(2, "2025-07-21 08:00")],
+            participations=[REJECTED_PARTICIPATION])
+
+    def counts(self, data_handler, alias):
+        details = data_handler.get_ride_details('driver', 1)
+        for participant in details['participants']:
+            if participant['participant']['alias'] == alias:
+                return participant['participant']
+
+    def test_existing_data_is_rebuilt(self):
+        """Caso de éxito: Sin userStats.json la proyección se reconstruye"""
+        data_handler = DataHandler(data_dir=self.data_dir)
+        data_handler.request_to_join_ride('driver', 1, 'ana')
+
+        stats = self.counts(data_handler, 'ana')
+        self.assertEqual(stats['previousRidesTotal'], 1)
+        self.assertEqual(stats['previousRidesRejected'], 1)
+
+    def test_transitions_update_counters(self):
+        """Caso de éxito: Cada transición de estado ajusta los contadores"""
+        data_handler = DataHandler(data_dir=self.data_dir)
+        data_handler.request_to_join_ride('driver', 1, 'ana')
+        data_handler.request_to_join_ride('driver', 2, 'ana')
+        data_handler.accept_ride_request('driver', 1, 'ana')
+        data_handler.reject_ride_request('driver', 2, 'ana')
+        data_handler.unload_participant('ana', 2)
+
+        self.assertEqual(data_handler.get_user_by_attribute('alias', 'ana')['rides'], [5, 6])
+        self.assertEqual(data_handler._status_counts(2), {'Aceptada': 1, 'Rechazada': 1})
+
+    def test_counters_are_persisted_and_match_rebuild(self):
+        """Caso de éxito: Los contadores persistidos coinciden con una reconstrucción"""
+        data_handler = DataHandler(data_dir=self.data_dir)
+        data_handler.request_to_join_ride('driver', 1, 'ana')
+        data_handler.accept_ride_request('driver', 1, 'ana')
+
+        restarted = DataHandler(data_dir=self.data_dir)
+        persisted = [dict(stats, counts=dict(stats['counts'])) for stats in restarted.user_stats]
+        restarted.rebuild_user_stats()
+
+        self.assertEqual(persisted, restarted.user_stats)
+        self.assertEqual(restarted._status_counts(2), {'Aceptada': 1, 'Rechazada': 1})
+
+    def test_reloaded_participations_refresh_counters(self):
+        """Caso de éxito: Si otro escritor cambia las participaciones, los contadores se recalculan al recargarlas"""
+        data_handler = DataHandler(data_dir=self.data_dir)
+        data_handler.request_to_join_ride('driver', 1, 'ana')
+        self.assertEqual(self.counts(data_handler, 'ana')['previousRidesCompleted'], 0)
+
+        path = os.path.join(self.data_dir, 'rideParticipations.json')
+        with open(path) as f:
+            participations = json.load(f)
+        participations[-1]['status'] = 'Aceptada'
+        with open(path, 'w') as f:
+            json.dump(participations, f)
+
+        stats = self.counts(data_handler, 'ana')
+        self.assertEqual(stats['previousRidesCompleted'], 1)
+        self.assertEqual(stats['previousRidesTotal'], 0)
+
+
+class TestSqlBackend(DataDirTestCase):
+
+    def setUp(self):
+        self.data_dir = self.write_data_dir(users=[user('driver'), user('ana', rides=[5])], rides=[ride()],
+                                            participations=[REJECTED_PARTICIPATION])
+        self.url = 'sqlite:///' + os.path.join(self.data_dir, 'ef_is.db')
+        self.backend = SqlBackend(self.url)
+        migrate(JsonBackend(self.data_dir), self.backend)
+
+    def tearDown(self):
+        self.backend.close()
+
+    def test_migration_imports_json_files(self):
+        """Caso de éxito: La migración copia las tres colecciones"""
+        data_handler = DataHandler(backend=self.backend)
+
+        self.assertEqual(data_handler.get_user_by_attribute('alias', 'ana')['rides'], [5])
+        self.assertEqual(data_handler.get_ride_by_attribute('id', 1)['finalAddress'], 'UTEC')
+        self.assertEqual(len(data_handler.ride_participations), 1)
+
+    def test_mutations_are_visible_to_other_handlers(self):
+        """Caso de éxito: Otro DataHandler sobre la misma base ve los cambios"""
+        writer = DataHandler(backend=self.backend)
+        other_backend = SqlBackend(self.url)
+        reader = DataHandler(backend=other_backend)
+
+        writer.request_to_join_ride('driver', 1, 'ana')
+        writer.accept_ride_request('driver', 1, 'ana')
+        details = reader.get_ride_details('driver', 1)
+        other_backend.close()
+
+        participant = details['participants'][0]
+        self.assertEqual(participant['status'], 'Aceptada')
+        self.assertEqual(participant['participant']['previousRidesCompleted'], 1)
+        self.assertEqual(participant['participant']['previousRidesRejected'], 1)
+
+    def test_changes_use_portable_upsert(self):
+        """Caso de éxito: Guardar cambios actualiza, agrega y borra sin SQL propio de SQLite"""
+        statements = []
+        event.listen(self.backend.engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+        self.backend.invalidate()
+        driver, ana = self.backend.load('users')
+        changes = {1: dict(driver, alias='ana'), 2: None, 3: user('luis', rides=[5])}
+        self.backend.save('users', [changes[1], changes[3]], changes, rewrite=False)
+
+        self.backend.invalidate()
+        self.assertEqual([(u['id'], u['alias']) for u in self.backend.load('users')], [(1, 'ana'), (3, 'luis')])
+        self.assertFalse([statement for statement in statements if 'OR REPLACE' in statement.upper()])
+
+    def test_deferred_durability_reads_unflushed_participations(self):
+        """Caso de éxito: Con durabilidad group el detalle ve al pasajero antes del flush"""
+        data_handler = DataHandler(backend=self.backend, durability='group', flush_interval=60,
+                                   flush_every=10 ** 6)
+        joiner = threading.Thread(target=data_handler.request_to_join_ride, args=('driver', 1, 'ana'))
+        joiner.start()
+        # El join ya se aplico en memoria y espera el flush, que todavia no corrio.
+        deadline = time.monotonic() + 5
+        while not data_handler._dirty and time.monotonic() < deadline:
+            time.sleep(0.001)
+        details = data_handler.get_ride_details('driver', 1)
+        data_handler.close()
+        joiner.join()
+
+        participant = details['participants'][0]
+        self.assertEqual(participant['status'], 'Pendiente')
+        self.assertIsNotNone(participant['confirmation'])
+        self.assertEqual(data_handler.get_ride_details('driver', 1), details)
+
+
+class TestConcurrentRequests(ControllerTestCase):
+    PASSENGERS = 40
+    THREADS = 8
+
+    SEED_USERS = [user('driver')] + passengers(PASSENGERS)
+    SEED_RIDES = [ride(spaces=PASSENGERS)]
+
+    def hammer(self, worker):
+        errors = []
+
+        def run(thread_index):
+            client = controller.app.test_client()
+            try:
+                for i in range(2 + thread_index, self.PASSENGERS + 2, self.THREADS):
+                    worker(client, 'user%d' % i)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(t,)) for t in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_concurrent_joins_are_not_lost(self):
+        """Caso de éxito: Solicitudes concurrentes no pisan los cambios de otras"""
+        def join_and_read(client, alias):
+            response = client.post('/usuarios/driver/rides/1/requestToJoin/' + alias)
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(client.get('/usuarios/driver/rides/1').status_code, 200)
+
+        self.hammer(join_and_read)
+        self.hammer(lambda client, alias: client.post('/usuarios/driver/rides/1/accept/' + alias))
+
+        restarted = DataHandler(data_dir=self.data_dir)
+        ride = restarted.get_ride_by_attribute('id', 1)
+        participation_ids = [p['id'] for p in restarted.ride_participations]
+        self.assertEqual(len(ride['participants']), self.PASSENGERS)
+        self.assertEqual(sorted(participation_ids), list(range(1, self.PASSENGERS + 1)))
+        self.assertTrue(all(p['status'] == 'Aceptada' for p in restarted.ride_participations))
+        self.assertEqual(sum(len(user['rides']) for user in restarted.users), self.PASSENGERS)
+        self.assertEqual(sum(s['counts'].get('Aceptada', 0) for s in restarted.user_stats),
+                         self.PASSENGERS)
+
+
+class TestMultiprocess(DataDirTestCase):
+    PASSENGERS = 24
+    WORKERS = 4
+
+    def setUp(self):
+        self.data_dir = self.write_data_dir(users=[user('driver')] + passengers(self.PASSENGERS),
+                                            rides=[ride(spaces=self.PASSENGERS)])
+
+    @unittest.skipUnless('fork' in multiprocessing.get_all_start_methods(), "requiere fork")
+    def test_workers_do_not_overwrite_each_other(self):
+        """Caso de éxito: Varios procesos escribiendo no pierden cambios"""
+        context = multiprocessing.get_context('fork')
+        aliases = ['user%d' % i for i in range(2, self.PASSENGERS + 2)]
+        workers = [context.Process(target=join_rides_in_worker,
+                                   args=(self.data_dir, aliases[w::self.WORKERS]))
+                   for w in range(self.WORKERS)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual([worker.exitcode for worker in workers], [0] * self.WORKERS)
+        restarted = DataHandler(data_dir=self.data_dir, multiprocess=True)
+        self.assertEqual(len(restarted.get_ride_by_attribute('id', 1)['participants']), self.PASSENGERS)
+        self.assertEqual(sorted(p['id'] for p in restarted.ride_participations),
+                         list(range(1, self.PASSENGERS + 1)))
+
+    def test_only_changed_collections_are_reloaded(self):
+        """Caso de éxito: Un proceso relee solo lo que otro modificó"""
+        reader = DataHandler(data_dir=self.data_dir, multiprocess=True)
+        writer = DataHandler(data_dir=self.data_dir, multiprocess=True)
+        users = reader.users
+
+        writer.start_ride('driver', 1)
+        misses = reader.load_cache_stats()['misses']
+        details = reader.get_ride_details('driver', 1)
+
+        self.assertEqual(details['status'], 'En Progreso')
+        self.assertEqual(reader.load_cache_stats()['misses'] - misses, 1)
+        self.assertIs(reader.users, users)
+
+
+class TestPagination(ControllerTestCase):
+
+    # user1..user7 guardados en orden inverso; user7 con rides desordenados.
+    SEED_USERS = [dict(passengers(1, first=7)[0], rides=[3, 1, 2])] + passengers(6, first=1)[::-1]
+    SEED_RIDES = []
+
+    def test_cursor_walks_users_in_id_order(self):
+        """Caso de éxito: ?limit=&after= recorre los usuarios por id"""
+        ids, cursor = [], None
+        while True:
+            query = '?limit=3' + ('&after=%d' % cursor if cursor else '')
+            body = self.client.get('/usuarios' + query).get_json()
+            ids += [user['id'] for user in body['users']]
+            cursor = body['next']
+            if cursor is None:
+                break
+
+        self.assertEqual(ids, list(range(1, 8)))
+
+    def test_unpaginated_users_are_streamed(self):
+        """Caso de éxito: Sin parámetros la lista se envía por bloques"""
+        with patch.object(controller, 'STREAM_PAGE_SIZE', 2):
+            response = self.client.get('/usuarios')
+
+        self.assertTrue(response.is_streamed)
+        self.assertEqual([user['id'] for user in response.get_json()], list(range(1, 8)))
+
+    def test_rides_of_user_pages(self):
+        """Caso de éxito: Las participaciones de un usuario también se paginan"""
+        first = self.client.get('/usuarios/user7/rides?limit=2').get_json()
+        second = self.client.get('/usuarios/user7/rides?limit=2&after=%d' % first['next']).get_json()
+
+        self.assertEqual(first, {"rides": [1, 2], "next": 2})
+        self.assertEqual(second, {"rides": [3], "next": None})
+        self.assertEqual(self.client.get('/usuarios/user7/rides').get_json(), [1, 2, 3])
+        self.assertEqual(self.client.get('/usuarios/user1/rides').status_code, 404)
+
+    def test_invalid_pagination_parameters(self):
+        """Caso de error: limit o after inválidos"""
+        self.assertEqual(self.client.get('/usuarios?limit=0').status_code, 400)
+        self.assertEqual(self.client.get('/usuarios?after=abc').status_code, 400)
+
+
+class TestConditionalGet(ControllerTestCase):
+
+    SEED_USERS = [user('driver'), user('ana'), user('luis')]
+    SEED_RIDES = [ride(), ride(2, "2025-07-21 08:00")]
+
+    def setUp(self):
+        super().setUp()
+        self.data_handler.request_to_join_ride('driver', 1, 'ana')
+
+    def revalidate(self, url):
+        etag = self.client.get(url).headers['ETag']
+        return self.client.get(url, headers={'If-None-Match': etag})
+
+    def test_unchanged_ride_returns_304_without_details(self):
+        """Caso de éxito: Un ride sin cambios responde 304 sin calcular el detalle"""
+        url = '/usuarios/driver/rides/1'
+        etag = self.client.get(url).headers['ETag']
+
+        with patch.object(self.data_handler, 'get_ride_details') as details:
+            response = self.client.get(url, headers={'If-None-Match': etag})
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['ETag'], etag)
+        details.assert_not_called()
+
+    def test_changes_that_affect_the_ride_change_its_etag(self):
+        """Caso de éxito: Cambios en el ride o en sus participantes invalidan el ETag"""
+        url = '/usuarios/driver/rides/1'
+        for mutate in (lambda: self.data_handler.accept_ride_request('driver', 1, 'ana'),
+                       lambda: self.data_handler.request_to_join_ride('driver', 2, 'ana'),
+                       lambda: self.data_handler.start_ride('driver', 1)):
+            etag = self.client.get(url).headers['ETag']
+            mutate()
+            response = self.client.get(url, headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 200)
+
+    def test_unrelated_changes_keep_the_etag(self):
+        """Caso de éxito: Cambios en otro ride no invalidan el ETag"""
+        url = '/usuarios/driver/rides/1'
+        etag = self.client.get(url).headers['ETag']
+
+        self.data_handler.request_to_join_ride('driver', 2, 'luis')
+
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_user_etag(self):
+        """Caso de éxito: GET /usuarios/<alias> también admite If-None-Match"""
+        self.assertEqual(self.revalidate('/usuarios/luis').status_code, 304)
+        self.assertEqual(self.client.get('/usuarios/nadie').status_code, 404)
+
+
+class TestFieldsAndCompression(ControllerTestCase):
+
+    SEED_USERS = [user('driver')] + passengers(39, plate="P-%03d")
+
+    def setUp(self):
+        super().setUp()
+        self.data_handler.request_to_join_ride('driver', 1, 'user2')
+        self.data_handler.request_to_join_ride('driver', 1, 'user3')
+
+    def test_parse_fields(self):
+        """Caso de éxito: Las rutas se combinan en un árbol y un campo completo gana"""
+        self.assertEqual(parse_fields('status,participants.participant.alias,participants.status',
+                                      RIDE_DETAIL_FIELDS),
+                         {'status': None, 'participants': {'participant': {'alias': None}, 'status': None}})
+        self.assertEqual(parse_fields('participants.status,participants', RIDE_DETAIL_FIELDS),
+                         {'participants': None})
+        for spec in ('', 'nope', 'status.x', 'participants.participant.name'):
+            with self.assertRaises(ValueError):
+                parse_fields(spec, RIDE_DETAIL_FIELDS)
+
+    def test_ride_fields_skip_participant_counters(self):
+        """Caso de éxito: ?fields= en el detalle no calcula los contadores que no se piden"""
+        full = self.client.get('/usuarios/driver/rides/1').get_json()['ride']
+        self.data_handler._detail_cache.invalidate()
+
+        with patch.object(self.data_handler, '_status_counts') as counts:
+            response = self.client.get('/usuarios/driver/rides/1?fields=status,participants.participant.alias')
+        counts.assert_not_called()
+        self.assertEqual(response.get_json()['ride'], {
+            'status': 'Ready',
+            'participants': [{'participant': {'alias': 'user2'}}, {'participant': {'alias': 'user3'}}]})
+
+        # Con la respuesta completa en cache, la proyeccion sale de ella.
+        self.client.get('/usuarios/driver/rides/1')
+        response = self.client.get('/usuarios/driver/rides/1?fields=participants.participant')
+        self.assertEqual(response.get_json()['ride']['participants'][0]['participant'],
+                         full['participants'][0]['participant'])
+        self.assertEqual(self.client.get('/usuarios/driver/rides/1?fields=driver.alias').status_code, 400)
+
+    def test_user_fields(self):
+        """Caso de éxito: ?fields= en /usuarios proyecta cada usuario, paginado o en streaming"""
+        page = self.client.get('/usuarios?fields=alias&limit=2').get_json()
+        self.assertEqual(page['users'], [{'alias': 'driver'}, {'alias': 'user2'}])
+        streamed = self.client.get('/usuarios?fields=id,rides', headers={'Accept-Encoding': 'identity'})
+        self.assertEqual(json.loads(streamed.get_data())[1], {'id': 2, 'rides': [1]})
+        self.assertEqual(self.client.get('/usuarios/user3?fields=name').get_json(), {'name': 'User 3'})
+        self.assertEqual(self.client.get('/usuarios?fields=password').status_code, 400)
+
+    def test_negotiated_compression(self):
+        """Caso de éxito: Las respuestas grandes salen comprimidas según Accept-Encoding"""
+        plain = self.client.get('/usuarios?limit=100')
+        self.assertIsNone(plain.headers.get('Content-Encoding'))
+        self.assertEqual(plain.headers['Vary'], 'Accept-Encoding')
+
+        gzipped = self.client.get('/usuarios?limit=100', headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(gzipped.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(gzipped.get_data()), plain.get_data())
+        self.assertLess(len(gzipped.get_data()), len(plain.get_data()) / 2)
+
+        deflated = self.client.get('/usuarios', headers={'Accept-Encoding': 'gzip;q=0, deflate'})
+        self.assertEqual(deflated.headers['Content-Encoding'], 'deflate')
+        self.assertEqual(len(json.loads(zlib.decompress(deflated.get_data()))), 40)
+
+        # Por debajo del umbral no se comprime.
+        small = self.client.get('/usuarios/user3', headers={'Accept-Encoding': 'gzip'})
+        self.assertIsNone(small.headers.get('Content-Encoding'))
+
+    def test_compressed_etag_is_weak_and_revalidates(self):
+        """Caso de éxito: Una respuesta comprimida lleva ETag débil y sigue admitiendo 304"""
+        with patch.object(controller.compressor, 'min_size', 0):
+            response = self.client.get('/usuarios/driver/rides/1', headers={'Accept-Encoding': 'gzip'})
+            etag = response.headers['ETag']
+            self.assertTrue(etag.startswith('W/'))
+            revalidated = self.client.get('/usuarios/driver/rides/1',
+                                          headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+        self.assertEqual(revalidated.status_code, 304)
+
+
+class TestDetailCache(DataDirTestCase):
+
+    def setUp(self):
+        self.data_dir = self.write_data_dir(
+            users=[user('driver'), user('ana'), user('luis')],
+            rides=[ride(), ride(2, "2025-07-21 08:00"), ride(3, "2025-07-22 08:00")])
+        self.data_handler = DataHandler(data_dir=self.data_dir, detail_cache=2)
+        self.data_handler.request_to_join_ride('driver', 1, 'ana')
+
+    def details(self, ride_id):
+        return self.data_handler.get_ride_details('driver', ride_id)
+
+    def test_repeated_details_are_served_from_cache(self):
+        """Caso de éxito: El mismo ride sin cambios sale de la cache"""
+        first = self.details(1)
+        self.assertIs(self.details(1), first)
+        self.assertEqual(self.data_handler.detail_cache_stats()['hits'], 1)
+
+        # Un cambio en otro ride no invalida este.
+        self.data_handler.request_to_join_ride('driver', 2, 'luis')
+        self.assertIs(self.details(1), first)
+
+    def test_mutations_invalidate_the_ride(self):
+        """Caso de éxito: Aceptar, unirse, iniciar o descargar refrescan el detalle"""
+        self.details(1)
+        self.data_handler.accept_ride_request('driver', 1, 'ana')
+        self.assertEqual(self.details(1)['participants'][0]['status'], 'Aceptada')
+
+        self.data_handler.request_to_join_ride('driver', 1, 'luis')
+        self.assertEqual(len(self.details(1)['participants']), 2)
+
+        self.data_handler.start_ride('driver', 1)
+        self.assertEqual(self.details(1)['status'], 'En Progreso')
+
+        self.data_handler.unload_participant('luis', 1)
+        self.assertEqual([p['participant']['alias'] for p in self.details(1)['participants']], ['ana'])
+        self.assertEqual(self.data_handler.detail_cache_stats()['stale'], 4)
+
+    def test_participant_history_invalidates_other_rides(self):
+        """Caso de éxito: Un cambio en el historial de un participante refresca sus otros rides"""
+        self.data_handler.request_to_join_ride('driver', 2, 'ana')
+        self.assertEqual(self.details(1)['participants'][0]['participant']['previousRidesCompleted'], 0)
+
+        self.data_handler.accept_ride_request('driver', 2, 'ana')
+        self.assertEqual(self.details(1)['participants'][0]['participant']['previousRidesCompleted'], 1)
+
+    def test_size_ttl_and_switch(self):
+        """Caso de éxito: La cache respeta tamaño, TTL y se puede desactivar"""
+        now = [0.0]
+        cache = LRUCache(maxsize=2, ttl=10, clock=lambda: now[0])
+        cache.put('a', 1, 'A')
+        cache.put('b', 1, 'B')
+        cache.get('a', 1)
+        cache.put('c', 1, 'C')
+        self.assertIsNone(cache.get('b', 1))
+        self.assertEqual(cache.get('a', 1), 'A')
+        now[0] = 11
+        self.assertIsNone(cache.get('a', 1))
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(cache.stats()['expired'], 1)
+
+        handler = DataHandler(data_dir=self.data_dir, detail_cache=0)
+        self.assertIsNone(handler.detail_cache_stats())
+        self.assertIsNot(handler.get_ride_details('driver', 1), handler.get_ride_details('driver', 1))
+
+
+class TestBatchDecisions(ControllerTestCase):
+
+    SEED_USERS = [user('driver')] + passengers(5)
+    SEED_RIDES = [ride(spaces=4)]
+
+    def setUp(self):
+        super().setUp()
+        for i in range(2, 6):
+            self.data_handler.request_to_join_ride('driver', 1, 'user%d' % i)
+
+    def test_decisions_are_applied_with_one_save(self):
+        """Caso de éxito: Varias decisiones se aplican y se guardan una sola vez"""
+        decisions = [{"alias": "user2", "decision": "accept"}, {"alias": "user3", "decision": "reject"},
+                     {"alias": "user4", "decision": "accept"}, {"alias": "user5", "decision": "accept"}]
+
+        with patch.object(self.data_handler.backend, 'save',
+                          wraps=self.data_handler.backend.save) as save:
+            response = self.client.post('/usuarios/driver/rides/1/decisions', json={"decisions": decisions})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['status'] for r in response.get_json()['results']],
+                         ['Aceptada', 'Rechazada', 'Aceptada', 'Aceptada'])
+        self.assertEqual(sorted(call.args[0] for call in save.call_args_list),
+                         ['ride_participations', 'user_stats'])
+        restarted = DataHandler(data_dir=self.data_dir)
+        self.assertEqual(restarted._status_counts(3), {'Rechazada': 1})
+
+    def test_invalid_items_are_reported(self):
+        """Caso de error: Un pasajero ajeno al ride se informa sin frenar las demás"""
+        decisions = [{"alias": "user6", "decision": "accept"}, {"alias": "user3", "decision": "reject"}]
+
+        results = self.data_handler.decide_ride_requests('driver', 1, decisions)
+
+        self.assertEqual([r.get('error') for r in results], ['Passenger not in ride', None])
+        self.assertEqual(results[1]['status'], 'Rechazada')
+
+    def test_malformed_item_rejects_the_whole_batch(self):
+        """Caso de error: Un elemento mal formado responde 400 sin aplicar los anteriores"""
+        url = '/usuarios/driver/rides/1/decisions'
+        for malformed in ({"alias": "user3", "decision": ["x"]}, {"alias": "user3", "decision": "maybe"},
+                          {"alias": ["user3"], "decision": "accept"}, "user3"):
+            decisions = [{"alias": "user2", "decision": "accept"}, malformed]
+            with patch.object(self.data_handler.events, 'publish') as publish:
+                response = self.client.post(url, json={"decisions": decisions})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.get_json()['error'], 'Invalid decision at position 1')
+            publish.assert_not_called()
+            self.assertIsNone(self.data_handler.decide_ride_requests('driver', 1, decisions))
+
+        self.assertEqual({p['status'] for p in self.data_handler.ride_participations}, {'Pendiente'})
+        self.assertEqual(self.data_handler._status_counts(2), {'Pendiente': 1})
+
+    def test_only_the_driver_can_decide(self):
+        """Caso de error: Un pasajero no puede decidir ni enviar un cuerpo inválido"""
+        decisions = {"decisions": [{"alias": "user3", "decision": "accept"}]}
+        self.assertEqual(self.client.post('/usuarios/user2/rides/1/decisions', json=decisions).status_code, 400)
+        self.assertEqual(self.client.post('/usuarios/driver/rides/1/decisions', json={}).status_code, 400)
+
+
+class TestSnapshot(DataDirTestCase):
+
+    def setUp(self):
+        self.data_dir = self.write_data_dir(users=[user('driver'), user('ana', rides=[5])], rides=[ride()],
+                                            participations=[REJECTED_PARTICIPATION])
+        with patch('sys.stdout'):
+            snapshot_main(['to-snapshot', '--data-dir', self.data_dir])
+
+    def test_snapshot_round_trip(self):
+        """Caso de éxito: JSON -> snapshot -> JSON conserva los datos"""
+        original = DataHandler(data_dir=self.data_dir)
+        from_snapshot = DataHandler(backend=SnapshotBackend(self.data_dir))
+        from_snapshot.start_ride('driver', 1)
+        with patch('sys.stdout'):
+            snapshot_main(['to-json', '--data-dir', self.data_dir])
+        converted = DataHandler(data_dir=self.data_dir)
+
+        self.assertEqual(from_snapshot.users, original.users)
+        self.assertEqual(converted.ride_participations, original.ride_participations)
+        self.assertEqual(converted.rides[0]['status'], 'En Progreso')
+
+    def test_lazy_load_reads_collections_on_first_use(self):
+        """Caso de éxito: Con lazy=True cada colección se lee al usarla"""
+        backend = SnapshotBackend(self.data_dir)
+        data_handler = DataHandler(backend=backend, lazy=True)
+        self.assertEqual(backend.stats()['misses'], 0)
+
+        self.assertEqual(data_handler.get_user_by_attribute('alias', 'ana')['id'], 2)
+        self.assertEqual(backend.stats()['misses'], 1)
+        self.assertEqual(len(data_handler.ride_participations), 1)
+
+    def test_corrupt_snapshot_is_rejected(self):
+        """Caso de error: Un archivo que no es snapshot no se carga como vacío"""
+        with open(os.path.join(self.data_dir, 'users.snap'), 'wb') as f:
+            f.write(b'{}')
+
+        with self.assertRaises(ValueError):
+            DataHandler(backend=SnapshotBackend(self.data_dir))
+
+
+class TestRideSearch(ControllerTestCase):
+
+    SEED_RIDES = [ride(1, address="Universidad Central - Campus Norte", spaces=1),
+                  ride(2, "2025-07-20 18:30", "Miraflores"),
+                  ride(3, "2025-07-19 07:45", "Campus Norte", spaces=2)]
+
+    def search(self, query):
+        response = self.client.get('/rides' + query)
+        self.assertEqual(response.status_code, 200)
+        return [ride['id'] for ride in response.get_json()['rides']]
+
+    def test_time_window_and_destination(self):
+        """Caso de éxito: Búsqueda por rango horario y tokens del destino"""
+        self.assertEqual(self.search(''), [3, 1, 2])
+        self.assertEqual(self.search('?from=2025-07-20T00:00&to=2025-07-20T12:00'), [1])
+        self.assertEqual(self.search('?destination=campus%20NORTE'), [3, 1])
+        self.assertEqual(self.search('?destination=universidad&from=2025-07-20T09:00'), [])
+
+    def test_free_seats_follow_accepted_participations(self):
+        """Caso de éxito: Los asientos libres se actualizan al aceptar y descargar"""
+        self.data_handler.request_to_join_ride('driver', 1, 'ana')
+        self.assertEqual(self.search('?minSeats=1'), [3, 1, 2])
+
+        self.data_handler.accept_ride_request('driver', 1, 'ana')
+        self.assertEqual(self.search('?minSeats=1'), [3, 2])
+
+        self.data_handler.unload_participant('ana', 1)
+        self.assertEqual(self.search('?minSeats=1'), [3, 1, 2])
+
+    def test_reassigned_rides_are_reindexed(self):
+        """Caso de éxito: Reemplazar la colección reconstruye los índices"""
+        rides = [dict(ride) for ride in self.data_handler.rides]
+        rides[1]['finalAddress'] = 'Campus Sur'
+        with patch.object(self.data_handler, 'load_rides'):
+            self.data_handler.rides = rides
+            self.assertEqual(self.search('?destination=campus&limit=2'), [3, 1])
+            self.assertEqual(self.search('?destination=sur'), [2])
+
+    def test_reload_during_search(self):
+        """Caso de éxito: Una búsqueda concurrente con una recarga ve los índices viejos o los nuevos, nunca a medias"""
+        def dataset(first):
+            rides = [{"id": i, "rideDateAndTime": "2025-07-20 %02d:%02d" % (i % 24, i % 60),
+                      "finalAddress": "Campus Norte", "allowedSpaces": 1} for i in range(first, first + 300)]
+            participations = [{"id": i, "rideId": i, "status": "Aceptada"} for i in range(first, first + 300)]
+            return rides, participations
+        datasets = [dataset(1), dataset(1001)]
+        search = RideSearch()
+        search.rebuild_rides(datasets[0][0])
+        search.rebuild_participations(datasets[0][1])
+        errors = []
+        done = threading.Event()
+
+        def reload():
+            for i in range(200):
+                rides, participations = datasets[i % 2]
+                search.rebuild_rides(rides)
+                search.rebuild_participations(participations)
+            done.set()
+
+        def query():
+            while not done.is_set():
+                try:
+                    found = {ride['id'] // 1000 for ride in search.search(destination='campus')}
+                    if len(found) != 1:
+                        errors.append(found)
+                except Exception as e:
+                    errors.append(e)
+
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        self.addCleanup(sys.setswitchinterval, interval)
+        threads = [threading.Thread(target=reload), threading.Thread(target=query)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+
+    def test_invalid_parameters(self):
+        """Caso de error: Fechas o números inválidos"""
+        self.assertEqual(self.client.get('/rides?from=ayer').status_code, 400)
+        self.assertEqual(self.client.get('/rides?from=2025-07-20T08:00:00%2B00:00').status_code, 400)
+        self.assertEqual(self.client.get('/rides?to=2025-07-20T08:00Z').status_code, 400)
+        self.assertEqual(self.client.get('/rides?minSeats=x').status_code, 400)
+
+
+class TestUserRides(ControllerTestCase):
+
+    SEED_USERS = [user('driver'), user('ana'), user('luis', alias="other", name="Other")]
+    SEED_RIDES = [ride(1, address="Campus Norte", spaces=2),
+                  ride(2, "2025-07-21 18:30", "Miraflores", driver=3)]
+
+    def my_rides(self, query='?expand=1'):
+        response = self.client.get('/usuarios/ana/rides' + query)
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def test_entries_join_ride_and_participation(self):
+        """Caso de éxito: Cada entrada trae el estado y los datos del ride"""
+        self.data_handler.request_to_join_ride('driver', 1, 'ana')
+
+        rides = self.my_rides()
+        self.assertEqual(len(rides), 1)
+        self.assertEqual(rides[0]['rideId'], 1)
+        self.assertEqual(rides[0]['driver'], 'driver')
+        self.assertEqual(rides[0]['rideDateAndTime'], '2025-07-20 08:00')
+        self.assertEqual(rides[0]['finalAddress'], 'Campus Norte')
+        self.assertEqual(rides[0]['rideStatus'], 'Ready')
+        self.assertEqual(rides[0]['status'], 'Pendiente')
+        # Sin expand se mantiene la lista de ids.
+        self.assertEqual(self.client.get('/usuarios/ana/rides').get_json(), [rides[0]['participationId']])
+
+    def test_projection_follows_mutations(self):
+        """Caso de éxito: La proyección ya armada se actualiza con cada cambio"""
+        self.data_handler.request_to_join_ride('driver', 1, 'ana')
+        self.assertEqual(len(self.my_rides()), 1)
+
+        self.data_handler.request_to_join_ride('other', 2, 'ana')
+        self.data_handler.accept_ride_request('driver', 1, 'ana')
+        self.data_handler.start_ride('other', 2)
+        rides = {entry['rideId']: entry for entry in self.my_rides()}
+        self.assertEqual(rides[1]['status'], 'Aceptada')
+        self.assertEqual(rides[2]['rideStatus'], 'En Progreso')
+        self.assertEqual(rides[2]['driver'], 'other')
+
+        self.data_handler.unload_participant('ana', 1)
+        self.assertEqual([entry['rideId'] for entry in self.my_rides()], [2])
+
+    def test_status_and_date_filters(self):
+        """Caso de éxito: Filtros por estado de la participación y fecha del ride"""
+        self.data_handler.request_to_join_ride('driver', 1, 'ana')
+        self.data_handler.request_to_join_ride('other', 2, 'ana')
+        self.data_handler.accept_ride_request('driver', 1, 'ana')
+
+        self.assertEqual([e['rideId'] for e in self.my_rides('?status=Aceptada')], [1])
+        self.assertEqual([e['rideId'] for e in self.my_rides('?status=Aceptada,Pendiente')], [1, 2])
+        self.assertEqual([e['rideId'] for e in self.my_rides('?from=2025-07-21T00:00')], [2])
+        self.assertEqual(self.my_rides('?status=Missing&limit=5'), {"rides": [], "next": None})
+        page = self.my_rides('?expand=1&limit=1')
+        self.assertEqual([e['rideId'] for e in page['rides']], [1])
+        self.assertEqual(page['next'], page['rides'][0]['participationId'])
+
+    def test_reloaded_collections_rebuild_projection(self):
+        """Caso de éxito: Reemplazar una colección descarta la proyección"""
+        self.data_handler.request_to_join_ride('driver', 1, 'ana')
+        self.assertEqual(self.my_rides()[0]['finalAddress'], 'Campus Norte')
+
+        rides = [dict(ride) for ride in self.data_handler.rides]
+        rides[0]['finalAddress'] = 'Campus Sur'
+        with patch.object(self.data_handler, 'load_rides'):
+            self.data_handler.rides = rides
+            self.assertEqual(self.my_rides()[0]['finalAddress'], 'Campus Sur')
+
+    def test_invalid_filters(self):
+        """Caso de error: Fecha inválida o usuario inexistente"""
+        self.assertEqual(self.client.get('/usuarios/ana/rides?from=ayer').status_code, 400)
+        self.assertEqual(self.client.get('/usuarios/ana/rides?expand=1&from=2025-07-20T08:00:00%2B00:00').status_code,
+                         400)
+        self.assertEqual(self.client.get('/usuarios/nadie/rides?expand=1').status_code, 404)
+
+
+class TestArchive(DataDirTestCase):
+
+    def setUp(self):
+        self.data_dir = self.write_data_dir(
+            users=[user('driver'), user('ana'), user('luis')],
+            rides=[ride(1, "2025-06-10 08:00", spaces=2), ride(2, spaces=2),
+                   ride(3, "2025-08-01 08:00", spaces=2)])
+        self.data_handler = DataHandler(data_dir=self.data_dir)
+        # Participaciones 1 (ride 3), 2 (ride 1) y 3 (ride 2).
+        for ride_id in (3, 1, 2):
+            self.data_handler.request_to_join_ride('driver', ride_id, 'ana')
+        self.data_handler.accept_ride_request('driver', 1, 'ana')
+        self.data_handler.end_ride('driver', 1)
+        self.data_handler.end_ride('driver', 2)
+
+    def read_json(self, name):
+        with open(os.path.join(self.data_dir, name)) as f:
+            return json.load(f)
+
+    def test_finished_rides_move_to_monthly_segments(self):
+        """Caso de éxito: Los rides finalizados salen de los archivos calientes por mes"""
+        details = self.data_handler.get_ride_details('driver', 1)
+
+        result = self.data_handler.archive_finished_rides()
+
+        self.assertEqual(result, {'rides': 2, 'ride_participations': 2})
+        self.assertEqual([ride['id'] for ride in self.read_json('rides.json')], [3])
+        self.assertEqual([p['rideId'] for p in self.read_json('rideParticipations.json')], [3])
+        self.assertEqual([entry['name'] for entry in self.read_json('archive/manifest.json')['segments']],
+                         ['2025-06-0001', '2025-07-0001'])
+        self.assertEqual(self.data_handler.get_ride_details('driver', 1), details)
+        self.assertEqual(self.data_handler.archive_finished_rides(), {'rides': 0, 'ride_participations': 0})
+
+    def test_cold_segments_load_only_when_needed(self):
+        """Caso de éxito: Un proceso nuevo lee los segmentos recién al pedir historia"""
+        self.data_handler.archive_finished_rides()
+        restarted = DataHandler(data_dir=self.data_dir)
+        restarted.get_ride_details('driver', 3)
+        self.assertEqual(restarted.archive_stats()['segmentLoads'], 0)
+
+        self.assertEqual(restarted.get_ride_by_attribute('id', 2)['status'], 'Finalizada')
+        self.assertEqual(restarted.archive_stats()['segmentLoads'], 1)
+        statuses = {entry['rideId']: entry['status'] for entry in
+                    restarted.get_ride_summaries_of_user_page('ana')[0]}
+        self.assertEqual(statuses, {1: 'Aceptada', 2: 'Pendiente', 3: 'Pendiente'})
+
+    def test_history_and_ids_survive_archival(self):
+        """Caso de éxito: Los contadores y los ids nuevos tienen en cuenta lo archivado"""
+        self.data_handler.archive_finished_rides()
+        self.data_handler.rebuild_user_stats()
+        counts = self.data_handler.get_ride_details('driver', 3)['participants'][0]['participant']
+        self.assertEqual(counts['previousRidesCompleted'], 1)
+        self.assertEqual(counts['previousRidesTotal'], 2)
+
+        created = self.data_handler.request_to_join_ride('driver', 3, 'luis')
+        self.assertEqual(created['id'], 4)
+
+    def test_offline_archival(self):
+        """Caso de éxito: El archivado también corre sobre el backend, sin DataHandler"""
+        backend = JsonBackend(self.data_dir)
+        archive = Archive(os.path.join(self.data_dir, 'archive'))
+        self.assertEqual(archive_backend(backend, archive), (2, 2))
+
+        self.assertEqual(archive.get('rides', 1)['status'], 'Finalizada')
+        self.assertEqual([p['rideId'] for p in archive.participations_of_ride(2)], [2])
+        self.assertIsNone(archive.get('rides', 3))
+        self.assertEqual(archive.max_id('ride_participations'), 3)
+
+
+class TestBulkImportExport(DataDirTestCase):
+
+    def setUp(self):
+        self.data_dir = self.write_data_dir(users=[user('driver')])
+        self.data_handler = DataHandler(data_dir=self.data_dir)
+
+    def campus_lines(self):
+        return [
+            to_line('users', {"alias": "ana", "name": "Ana", "carPlate": "BBB-222", "rides": [7]}),
+            to_line('users', {"alias": "luis", "name": "Luis", "carPlate": "CCC-333"}),
+            to_line('rides', {"id": 5, "rideDateAndTime": "2025-07-20 08:00", "finalAddress": "UTEC",
+                              "allowedSpaces": 2, "rideDriver": 1, "status": "Ready",
+                              "participants": [2]}),
+            to_line('ride_participations', {"id": 7, "confirmation": "15-07-25", "destination": "UTEC",
+                                            "occupiedSpaces": 1, "status": "Aceptada", "rideId": 5}),
+        ]
+
+    def test_import_allocates_ids_and_commits_per_batch(self):
+        """Caso de éxito: El import asigna ids nuevos y guarda una vez por lote"""
+        saves = []
+        original = self.data_handler.backend.save
+        def save(collection, *args):
+            saves.append(collection)
+            return original(collection, *args)
+
+        with patch.object(self.data_handler.backend, 'save', side_effect=save):
+            result = self.data_handler.bulk_import(self.campus_lines(), batch_size=2)
+
+        self.assertEqual(result, {'imported': {'users': 2, 'rides': 1, 'ride_participations': 1},
+                                  'failed': 0, 'errors': []})
+        self.assertEqual(saves, ['users', 'rides', 'ride_participations', 'user_stats'])
+        restarted = DataHandler(data_dir=self.data_dir)
+        self.assertEqual([user['id'] for user in restarted.get_all_users()], [1, 2, 3])
+        counts = restarted.get_ride_details('driver', 5)['participants'][0]['participant']
+        self.assertEqual(counts['alias'], 'ana')
+        self.assertEqual(counts['previousRidesCompleted'], 1)
+
+    def test_invalid_lines_are_reported_and_skipped(self):
+        """Caso de error: Las líneas inválidas se informan por número y el resto se importa"""
+        lines = ['{"collection": "users"',
+                 to_line('cars', {}),
+                 to_line('users', {"alias": "ana", "name": "Ana"}),
+                 to_line('users', {"alias": "driver", "name": "Otro", "carPlate": "X"}),
+                 '',
+                 to_line('rides', {"rideDateAndTime": "2025-07-20 08:00", "finalAddress": "UTEC",
+                                   "allowedSpaces": 2, "rideDriver": 9, "status": "Ready"}),
+                 to_line('ride_participations', {"confirmation": "15-07-25", "destination": "UTEC",
+                                                 "occupiedSpaces": 1, "status": "Pendiente", "rideId": 4}),
+                 to_line('users', {"id": 1, "alias": "luis", "name": "Luis", "carPlate": "C"}),
+                 to_line('users', {"alias": "luis", "name": "Luis", "carPlate": "C"})]
+
+        result = self.data_handler.bulk_import(lines)
+
+        self.assertEqual(result['imported']['users'], 1)
+        self.assertEqual(result['failed'], 7)
+        self.assertEqual([(error['line'], error['error']) for error in result['errors']], [
+            (1, 'Invalid JSON'),
+            (2, 'Unknown collection: cars'),
+            (3, 'carPlate: Field required'),
+            (4, 'Duplicate alias: driver'),
+            (6, 'Unknown user: 9'),
+            (7, 'Unknown ride: 4'),
+            (8, 'Duplicate id: 1'),
+        ])
+        self.assertEqual(self.data_handler.get_user_by_attribute('alias', 'luis')['id'], 2)
+
+    def test_export_round_trips_through_endpoints(self):
+        """Caso de éxito: Lo exportado por /bulk/export se importa igual en otro directorio"""
+        self.data_handler.bulk_import(self.campus_lines())
+        self.data_handler.end_ride('driver', 5)
+        self.data_handler.archive_finished_rides()
+
+        with patch.object(controller, 'data_handler', self.data_handler):
+            exported = controller.app.test_client().get('/bulk/export')
+            body = exported.get_data()
+        self.assertEqual(exported.mimetype, 'application/x-ndjson')
+        lines = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual([line['collection'] for line in lines],
+                         ['users', 'users', 'users', 'rides', 'ride_participations'])
+
+        target = DataHandler(data_dir=self.write_data_dir())
+        with patch.object(controller, 'data_handler', target):
+            client = controller.app.test_client()
+            response = client.post('/bulk/import?batchSize=2', data=body)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_json()['failed'], 0)
+            self.assertEqual(client.post('/bulk/import?batchSize=0', data=body).status_code, 400)
+            self.assertEqual(client.get('/bulk/export?collections=cars').status_code, 400)
+            users_only = client.get('/bulk/export?collections=users').get_data().decode()
+        self.assertEqual(len(users_only.splitlines()), 3)
+        self.assertEqual(target.get_ride_details('driver', 5),
+                         self.data_handler.get_ride_details('driver', 5))
+
+    def test_cli_import_and_export(self):
+        """Caso de éxito: python -m src.bulk importa y exporta archivos NDJSON"""
+        path = os.path.join(self.data_dir, 'campus.ndjson')
+        with open(path, 'w') as f:
+            f.writelines(self.campus_lines())
+        with patch('sys.stdout'):
+            self.assertEqual(bulk_main(['import', '--data-dir', self.data_dir, '--file', path]), 0)
+            self.assertEqual(bulk_main(['export', '--data-dir', self.data_dir, '--file', path,
+                                        '--collections', 'rides,users']), 0)
+        with open(path) as f:
+            exported = [json.loads(line) for line in f]
+        self.assertEqual([(line['collection'], line['record']['id']) for line in exported],
+                         [('users', 1), ('users', 2), ('users', 3), ('rides', 5)])
+
+
+class TestRideEvents(ControllerTestCase):
+
+    SEED_RIDES = [ride(spaces=2), ride(2, "2025-07-21 08:00", spaces=2)]
+
+    def read_events(self, url, n, headers=None):
+        # Los primeros n eventos del stream (sin el 'retry' inicial).
+        response = self.client.get(url, headers=headers or {}, buffered=False)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        chunks = iter(response.response)
+        try:
+            next(chunks)
+            return [next(chunks).decode() for _ in range(n)]
+        finally:
+            response.close()
+
+    def test_mutations_are_published_per_ride(self):
+        """Caso de éxito: Unirse, aceptar, iniciar y descargar publican eventos del ride"""
+        subscription = self.data_handler.events.subscribe(1)
+        self.data_handler.request_to_join_ride('driver', 1, 'ana')
+        self.data_handler.request_to_join_ride('driver', 2, 'ana')
+        self.data_handler.accept_ride_request('driver', 1, 'ana')
+        self.data_handler.start_ride('driver', 1)
+        self.data_handler.unload_participant('ana', 1)
+
+        events = [subscription.get(0) for _ in range(4)]
+        self.assertEqual([event.type for event in events], ['join', 'accept', 'start', 'unload'])
+        self.assertEqual(events[1].data, {'rideId': 1, 'rideStatus': 'Ready',
+                                          'participant': 'ana', 'status': 'Aceptada'})
+        self.assertIsNone(subscription.get(0))
+
+    def test_stream_resumes_from_last_event_id(self):
+        """Caso de éxito: El stream reenvía lo publicado después de Last-Event-ID"""
+        self.data_handler.request_to_join_ride('driver', 1, 'ana')
+        self.data_handler.accept_ride_request('driver', 1, 'ana')
+
+        events = self.read_events('/usuarios/driver/rides/1/events', 2, {'Last-Event-ID': '0'})
+        self.assertTrue(events[0].startswith('id: 1\nevent: join\n'))
+        self.assertTrue(events[1].startswith('id: 2\nevent: accept\n'))
+        self.assertEqual(json.loads(events[1].split('data: ')[1])['status'], 'Aceptada')
+
+        resumed = self.read_events('/usuarios/driver/rides/1/events', 1, {'Last-Event-ID': '1'})
+        self.assertTrue(resumed[0].startswith('id: 2\n'))
+        self.assertEqual(self.data_handler.events.stats()['subscribers'], 0)
+
+    def test_slow_consumers_are_dropped_and_gaps_reset(self):
+        """Caso de éxito: Una cola llena se descarta y un id viejo pide releer el detalle"""
+        hub = EventHub(replay=3, queue_size=2)
+        slow = hub.subscribe(1)
+        for n in range(4):
+            hub.publish(1, 'start', {'n': n})
+        self.assertTrue(slow.dropped)
+        self.assertEqual([slow.get(0).data['n'], slow.get(0).data['n']], [0, 1])
+        self.assertTrue(slow.done)
+        self.assertEqual(hub.stats()['dropped'], 1)
+
+        self.assertTrue(hub.subscribe(1, last_event_id=0).gap)
+        self.assertFalse(hub.subscribe(1, last_event_id=2).gap)
+        self.assertTrue(hub.subscribe(1, last_event_id=99).gap)
+
+        with patch.object(self.data_handler, 'events', hub):
+            events = self.read_events('/usuarios/driver/rides/1/events', 1, {'Last-Event-ID': '0'})
+        self.assertEqual(events[0], 'id: 4\nevent: reset\ndata: {}\n\n')
+
+    def test_invalid_streams(self):
+        """Caso de error: Ride inexistente o Last-Event-ID inválido"""
+        self.assertEqual(self.client.get('/usuarios/driver/rides/9/events').status_code, 404)
+        self.assertEqual(self.client.get('/usuarios/driver/rides/1/events',
+                                         headers={'Last-Event-ID': 'x'}).status_code, 400)
+
+
+class TestAdmissionControl(ControllerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admission = AdmissionController({
+            'read': Limiter('read', 4, 4), 'write': Limiter('write', 1, 0), 'stream': Limiter('stream', 1, 0)})
+        self.patch_controller('admission', self.admission)
+
+    def queue_behind(self, limiter):
+        # Lanza un acquire que queda en la cola; devuelve el hilo y su resultado.
+        result = []
+        thread = threading.Thread(target=lambda: result.append(limiter.acquire()))
+        thread.start()
+        while limiter.waiting == 0:
+            time.sleep(0.001)
+        return thread, result
+
+    def test_full_queue_is_shed_with_retry_after(self):
+        """Caso de error: Con la cola llena se rechaza sin esperar"""
+        limiter = Limiter('write', concurrency=1, queue_size=1)
+        first = limiter.acquire()
+        thread, result = self.queue_behind(limiter)
+        with self.assertRaises(Overloaded) as shed:
+            limiter.acquire()
+        self.assertGreaterEqual(shed.exception.retry_after, 1)
+
+        limiter.release(first[0])
+        thread.join()
+        self.assertGreater(result[0][1], 0)
+        self.assertEqual((limiter.stats()['admitted'], limiter.stats()['shed']), (2, 1))
+
+    def test_standing_queue_sheds_until_it_drains(self):
+        """Caso de éxito: La sobrecarga se detecta por el tiempo en cola, no por la cantidad"""
+        limiter = Limiter('write', concurrency=1, queue_size=10, target=1e-9, interval=0)
+        admitted = limiter.acquire()
+        for _ in range(2):
+            thread, result = self.queue_behind(limiter)
+            limiter.release(admitted[0])
+            thread.join()
+            admitted = result[0]
+        self.assertTrue(limiter.overloaded)
+        # Hay lugar en la cola, pero la espera ya no sirve.
+        self.assertRaises(Overloaded, limiter.acquire)
+
+        limiter.release(admitted[0])
+        limiter.release(limiter.acquire()[0])
+        self.assertFalse(limiter.overloaded)
+
+    def test_overloaded_routes_answer_503(self):
+        """Caso de error: Sin lugar para mutaciones se responde 503; las consultas siguen"""
+        writes = self.admission.limiters['write']
+        held = writes.acquire()
+        response = self.client.post('/usuarios/driver/rides/1/requestToJoin/ana')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response.headers)
+        self.assertEqual(self.client.get('/usuarios/ana').status_code, 200)
+
+        body = self.client.get('/metrics').get_data(as_text=True)
+        self.assertIn('ef_is_admission_shed_total{class="write"} 1', body)
+        self.assertIn('ef_is_admission_in_flight{class="write"} 1', body)
+
+        writes.release(held[0])
+        self.assertEqual(self.client.post('/usuarios/driver/rides/1/requestToJoin/ana').status_code, 201)
+        self.assertEqual(self.admission.stats()['write']['active'], 0)
+        self.assertEqual(self.admission.stats()['read']['active'], 0)
+
+    def test_streams_hold_their_slot_until_closed(self):
+        """Caso de éxito: Un stream SSE ocupa su lugar hasta que se cierra"""
+        stream = self.client.get('/usuarios/driver/rides/1/events', buffered=False)
+        self.assertEqual(self.client.get('/usuarios/driver/rides/1/events').status_code, 503)
+        stream.close()
+        self.assertEqual(self.admission.stats()['stream']['active'], 0)
+
+    def test_load_driver_releases_streamed_reads(self):
+        """Caso de éxito: bench_load cierra cada respuesta y no agota los lugares de lectura"""
+        dataset = datagen.generate(50, seed=1)
+        data_dir = self.make_temp_dir()
+        datagen.write_dataset(data_dir, dataset)
+        reads = self.admission.limiters['read']
+        # Mas listados en streaming que lugares de lectura (4).
+        requests = [('GET /usuarios/<alias>/rides', 'GET', '/usuarios/%s/rides' % user['alias'])
+                    for user in dataset['users'][:3 * reads.concurrency]]
+
+        results = bench_load.run(DataHandler(data_dir=data_dir), requests, threads=2)
+
+        self.assertEqual(results['GET /usuarios/<alias>/rides']['errors'], 0)
+        self.assertEqual(reads.stats()['shed'], 0)
+        self.assertEqual(reads.stats()['active'], 0)
+
+
+class TestGroupCommit(DataDirTestCase):
+    PASSENGERS = 30
+
+    def setUp(self):
+        self.data_dir = self.write_data_dir(users=[user('driver')] + passengers(self.PASSENGERS),
+                                            rides=[ride(spaces=self.PASSENGERS)])
+
+    def join_all(self, data_handler):
+        threads = [threading.Thread(target=data_handler.request_to_join_ride, args=('driver', 1, 'user%d' % i))
+                   for i in range(2, self.PASSENGERS + 2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_group_mode_batches_writes_and_acknowledges_after_flush(self):
+        """Caso de éxito: En modo group cada respuesta llega tras el flush de su lote"""
+        data_handler = DataHandler(data_dir=self.data_dir, durability='group', flush_interval=0.02)
+        self.addCleanup(data_handler.close)
+        with patch.object(data_handler.backend, 'save', wraps=data_handler.backend.save) as save:
+            self.join_all(data_handler)
+
+            on_disk = DataHandler(data_dir=self.data_dir)
+            self.assertEqual(len(on_disk.ride_participations), self.PASSENGERS)
+            self.assertLess(save.call_count, 4 * self.PASSENGERS)
+
+    def test_async_mode_flushes_on_close(self):
+        """Caso de éxito: En modo async close() escribe lo pendiente"""
+        data_handler = DataHandler(data_dir=self.data_dir, durability='async', flush_interval=60,
+                                   flush_every=10 ** 6)
+        data_handler.request_to_join_ride('driver', 1, 'user2')
+        data_handler.accept_ride_request('driver', 1, 'user2')
+        self.assertEqual(DataHandler(data_dir=self.data_dir).ride_participations, [])
+
+        data_handler.close()
+
+        on_disk = DataHandler(data_dir=self.data_dir)
+        self.assertEqual(on_disk.ride_participations[0]['status'], 'Aceptada')
+        self.assertEqual(on_disk.get_ride_by_attribute('id', 1)['participants'], [2])
+
+    def test_failed_flush_waits_interval_before_retrying(self):
+        """Caso de error: Un flush que falla se reintenta una vez por intervalo, sin busy loop"""
+        calls = []
+
+        def flush():
+            calls.append(time.monotonic())
+            raise OSError("disk full")
+
+        flusher = Flusher(flush, interval=0.05, every=1)
+        for _ in range(5):
+            seq = flusher.queue()
+        with self.assertRaises(OSError):
+            flusher.wait(seq)
+        time.sleep(0.3)
+        with self.assertRaises(OSError):
+            flusher.close()
+
+        # ~0.3 s / 0.05 s de reintentos, mas el primero y el de close().
+        self.assertGreaterEqual(len(calls), 2)
+        self.assertLessEqual(len(calls), 10)
+
+    def test_invalid_durability(self):
+        """Caso de error: Modo de durabilidad desconocido o incompatible"""
+        with self.assertRaises(ValueError):
+            DataHandler(data_dir=self.data_dir, durability='eventual')
+        with self.assertRaises(ValueError):
+            DataHandler(data_dir=self.data_dir, durability='group', multiprocess=True)
+
+
+class TestColumnarParticipations(DataDirTestCase):
+    RECORDS = [
+        {"id": 1, "confirmation": "15-07-25", "destination": "UTEC", "occupiedSpaces": 1,
+         "status": "Pendiente", "rideId": 1},
+        {"id": 2, "confirmation": "15-07-25", "destination": "UTEC", "occupiedSpaces": 2,
+         "status": "Aceptada", "rideId": 1},
+        {"id": 3, "confirmation": "16-07-25", "destination": "Jockey Plaza", "occupiedSpaces": 1,
+         "status": "Aceptada", "rideId": 2},
+    ]
+
+    def test_round_trip_and_shared_strings(self):
+        """Caso de éxito: La tabla devuelve los mismos registros y comparte las cadenas"""
+        table = participation_table(json.loads(json.dumps(self.RECORDS)))
+        self.assertEqual(table.to_dicts(), self.RECORDS)
+        self.assertEqual(table, self.RECORDS)
+        self.assertEqual(len(table), 3)
+        self.assertEqual(table[1]['status'], 'Aceptada')
+        self.assertEqual(dict(table[-1]), self.RECORDS[-1])
+        self.assertIs(table[0]['destination'], table[1]['destination'])
+
+    def test_paused_gc_restores_after_outermost_block(self):
+        """Caso de éxito: El GC sigue pausado hasta que termina el último bloque y vuelve a su estado"""
+        self.assertTrue(gc.isenabled())
+        with paused_gc():
+            with paused_gc():
+                self.assertFalse(gc.isenabled())
+            self.assertFalse(gc.isenabled())
+        self.assertTrue(gc.isenabled())
+        with self.assertRaises(ValueError), paused_gc():
+            raise ValueError("carga fallida")
+        self.assertTrue(gc.isenabled())
+
+    def test_irregular_records_keep_their_shape(self):
+        """Caso de éxito: Claves ausentes, extra o de otro tipo se conservan"""
+        records = [dict(self.RECORDS[0], note="ventana"), dict(self.RECORDS[1], occupiedSpaces="2"),
+                   {k: v for k, v in self.RECORDS[2].items() if k != 'confirmation'}]
+        table = participation_table(records)
+        self.assertEqual(table.to_dicts(), records)
+        self.assertEqual(table[2].get('confirmation', 'ausente'), 'ausente')
+        with self.assertRaises(KeyError):
+            table[2]['confirmation']
+
+        table[1]['occupiedSpaces'] = 3
+        table[0]['status'] = 'Rechazada'
+        self.assertEqual(table[1]['occupiedSpaces'], 3)
+        self.assertEqual(table[0]['status'], 'Rechazada')
+
+    def test_remove_compacts_and_keeps_removed_views_readable(self):
+        """Caso de éxito: Borrar compacta la tabla sin romper vistas ni orden"""
+        table = participation_table(self.RECORDS)
+        first, second, third = list(table)
+        table.remove(second)
+        table.remove(first)
+
+        self.assertEqual(len(table), 1)
+        self.assertIs(table[0], third)
+        self.assertEqual(third['id'], 3)
+        self.assertEqual(first['status'], 'Pendiente')
+        self.assertEqual(table.max_value('id'), 3)
+        with self.assertRaises(ValueError):
+            table.remove(first)
+
+    def test_value_counts(self):
+        """Caso de éxito: Conteo de estados por columna"""
+        table = participation_table(self.RECORDS)
+        self.assertEqual(table.value_counts('status', list(table)), {'Pendiente': 1, 'Aceptada': 2})
+        self.assertEqual(table.value_counts('status', [table[0]]), {'Pendiente': 1})
+
+    def test_data_handler_keeps_participations_columnar(self):
+        """Caso de éxito: DataHandler guarda la colección por columnas y escribe dicts"""
+        data_dir = self.write_data_dir(users=[user('driver'), user('ana', rides=[1])],
+                                       rides=[dict(ride(), participants=[2])], participations=self.RECORDS[:1])
+        data_handler = DataHandler(data_dir=data_dir)
+        self.assertIsInstance(data_handler.ride_participations, ColumnarTable)
+
+        data_handler.accept_ride_request('driver', 1, 'ana')
+
+        with open(os.path.join(data_dir, 'rideParticipations.json')) as f:
+            self.assertEqual(json.load(f), [dict(self.RECORDS[0], status='Aceptada')])
+        self.assertEqual(data_handler.get_ride_details('driver', 1)['participants'][0]['participant']
+                         ['previousRidesCompleted'], 1)
+
+
+class TestMetrics(ControllerTestCase):
+
+    def test_metrics_endpoint(self):
+        """Caso de éxito: /metrics expone rutas, operaciones de storage, bytes y búsquedas"""
+        self.client.get('/usuarios/ana')
+        self.client.post('/usuarios/driver/rides/1/requestToJoin/ana')
+        self.data_handler.get_user_by_attribute('name', 'Ana')
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        body = response.get_data(as_text=True)
+        self.assertIn('# TYPE ef_is_http_request_seconds histogram', body)
+        self.assertIn('ef_is_http_request_seconds_count{method="GET",route="/usuarios/<alias>",status="200"}', body)
+        self.assertIn('route="/usuarios/<alias>/rides/<ride_id>/requestToJoin/<alias2>",status="201"', body)
+        self.assertIn('ef_is_storage_operation_seconds_count{collection="rides",operation="save"}', body)
+        self.assertIn('ef_is_storage_bytes_total{collection="users",direction="read"}', body)
+        self.assertIn('ef_is_storage_bytes_total{collection="rides",direction="written"}', body)
+        self.assertIn('ef_is_lookups_total{collection="users",attribute="name",method="scan"}', body)
+        self.assertIn('ef_is_lookup_scanned_items_total{collection="users",attribute="name"}', body)
+
+    def test_storage_bytes_match_files(self):
+        """Caso de éxito: Los bytes escritos son los del archivo reescrito"""
+        self.data_handler.start_ride('driver', 1)
+        written = self.data_handler.backend.io_stats()[('rides', 'written')]
+        self.assertEqual(written, os.path.getsize(os.path.join(self.data_dir, 'rides.json')))
+
+    def test_counter_and_histogram_across_threads(self):
+        """Caso de éxito: Los contadores por hilo suman exacto y el histograma es acumulativo"""
+        counter = Counter('hits_total', 'Hits', ('route',))
+        histogram = Histogram('latency_seconds', 'Latency', ('route',), buckets=(0.1, 1.0))
+
+        def work():
+            for _ in range(1000):
+                counter.inc(('/a',))
+                histogram.observe(0.5, ('/a',))
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        histogram.observe(0.05, ('/a',))
+
+        self.assertEqual(counter.value(('/a',)), 4000)
+        self.assertEqual(counter.render(), ['hits_total{route="/a"} 4000'])
+        self.assertEqual(histogram.render(), [
+            'latency_seconds_bucket{route="/a",le="0.1"} 1',
+            'latency_seconds_bucket{route="/a",le="1"} 4001',
+            'latency_seconds_bucket{route="/a",le="+Inf"} 4001',
+            'latency_seconds_sum{route="/a"} 2000.05',
+            'latency_seconds_count{route="/a"} 4001',
+        ])
+
+    def test_finished_threads_release_their_shards(self):
+        """Caso de éxito: Un hilo por request no deja un dict por hilo en cada métrica"""
+        counter = Counter('hits_total', 'Hits', ('route',))
+        histogram = Histogram('latency_seconds', 'Latency', ('route',), buckets=(0.1, 1.0))
+
+        def work():
+            counter.inc(('/a',))
+            histogram.observe(0.5, ('/a',))
+        for _ in range(200):
+            thread = threading.Thread(target=work)
+            thread.start()
+            thread.join()
+        del thread
+
+        self.assertEqual(counter.value(('/a',)), 200)
+        self.assertEqual(histogram.count(('/a',)), 200)
+        self.assertIn('latency_seconds_bucket{route="/a",le="1"} 200', histogram.render())
+        self.assertLessEqual(len(counter._shards._all), 2)
+        self.assertLessEqual(len(histogram._shards._all), 2)
+
+
+class TestProfiler(ControllerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.profile_dir = self.make_temp_dir()
+
+    def use_profiler(self, **kwargs):
+        self.patch_controller('profiler', RequestProfiler(self.profile_dir, **kwargs))
+
+    def saved(self, suffix):
+        return sorted(name for name in os.listdir(self.profile_dir) if name.endswith(suffix))
+
+    def test_header_with_token_keeps_profile(self):
+        """Caso de éxito: Con el header y el token se guarda el perfil aunque sea rápido"""
+        self.use_profiler(threshold_ms=10 ** 6, token='secreto')
+        self.client.post('/usuarios/driver/rides/1/requestToJoin/ana')
+
+        response = self.client.get('/usuarios/driver/rides/1?x=1', headers={'X-EF-IS-Profile': 'secreto'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.saved('.pstats'), [response.headers['X-EF-IS-Profile-File']])
+        with open(os.path.join(self.profile_dir, self.saved('.json')[0])) as f:
+            tags = json.load(f)
+        self.assertEqual(tags['route'], '/usuarios/<alias>/rides/<ride_id>')
+        self.assertEqual(tags['viewArgs'], {'alias': 'driver', 'ride_id': '1'})
+        self.assertEqual(tags['args'], {'x': ['1']})
+        stats = pstats.Stats(os.path.join(self.profile_dir, self.saved('.pstats')[0]))
+        self.assertIn('get_ride_details', {func[2] for func in stats.stats})
+
+    def test_only_slow_requests_are_kept_in_a_bounded_ring(self):
+        """Caso de éxito: Se guardan los lentos y solo los últimos `keep`"""
+        self.use_profiler(threshold_ms=20, keep=3, always=True)
+        self.client.get('/usuarios/ana')
+        self.assertEqual(self.saved('.pstats'), [])
+
+        def slow_user(attribute, value):
+            time.sleep(0.03)
+            return None
+        with patch.object(self.data_handler, 'get_user_by_attribute', side_effect=slow_user):
+            for _ in range(5):
+                self.client.get('/usuarios/ana')
+
+        self.assertEqual(len(self.saved('.pstats')), 3)
+        self.assertEqual(len(self.saved('.json')), 3)
+
+    def test_wrong_token_and_sampling_mode(self):
+        """Caso de éxito: Un token incorrecto (aun fuera de ASCII) no perfila; el modo sampling guarda pilas folded"""
+        self.use_profiler(threshold_ms=0, token='secreto', mode='sampling')
+        self.client.get('/usuarios/ana', headers={'X-EF-IS-Profile': 'otro'})
+        self.assertEqual(os.listdir(self.profile_dir), [])
+        response = self.client.get('/usuarios/ana', headers={'X-EF-IS-Profile': 'ñ'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(os.listdir(self.profile_dir), [])
+
+        def slow_details(alias, ride_id, fields=None):
+            time.sleep(0.05)
+            return None
+        with patch.object(self.data_handler, 'get_ride_details', side_effect=slow_details):
+            self.client.get('/usuarios/driver/rides/1', headers={'X-EF-IS-Profile': 'secreto'})
+
+        with open(os.path.join(self.profile_dir, self.saved('.folded')[0])) as f:
+            self.assertIn('slow_details', f.read())
+
+    def test_disabled_without_environment(self):
+        """Caso de éxito: Sin variables de entorno no hay profiler"""
+        self.assertIsNone(RequestProfiler.from_env({}))
+        self.assertEqual(RequestProfiler.from_env({'EF_IS_PROFILE_TOKEN': 't'}).token, 't')
+        with self.assertRaises(ValueError):
+            RequestProfiler(mode='perf')
+
+
+class TestBenchmarks(DataDirTestCase):
+    def test_datagen_is_seeded_and_consistent(self):
+        """Caso de éxito: Misma semilla, mismos datos, y referencias coherentes"""
+        dataset = datagen.generate(300, seed=7)
+        self.assertEqual(dataset, datagen.generate(300, seed=7))
+        self.assertNotEqual(dataset, datagen.generate(300, seed=8))
+
+        data_dir = self.make_temp_dir()
+        datagen.write_dataset(data_dir, dataset)
+        data_handler = DataHandler(data_dir=data_dir)
+        for user in data_handler.users:
+            for participation_id in user['rides']:
+                participation = data_handler.get_ride_participation_by_attribute('id', participation_id)
+                ride = data_handler.get_ride_by_attribute('id', participation['rideId'])
+                self.assertIn(user['id'], ride['participants'])
+                self.assertNotEqual(ride['rideDriver'], user['id'])
+        self.assertEqual(sum(len(r['participants']) for r in dataset['rides']),
+                         len(dataset['ride_participations']))
+
+    def test_compare_flags_regressions(self):
+        """Caso de éxito: Solo se marca lo que empeoró más que la tolerancia"""
+        baseline = {'methods': {'a': {'p50_us': 10.0}, 'b': {'p50_us': 10.0}},
+                    'routes': {'GET /x': {'p50_us': 100.0}, 'GET /gone': {'p50_us': 1.0}}}
+        current = {'methods': {'a': {'p50_us': 12.0}, 'b': {'p50_us': 14.0}},
+                   'routes': {'GET /x': {'p50_us': 90.0}}}
+        self.assertEqual(bench_results.compare(current, baseline, tolerance=0.25),
+                         [('methods', 'b', 10.0, 14.0)])
+        self.assertEqual(bench_results.summarize([0.001, 0.002, 0.003, 0.004])['p50_us'], 2000.0)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
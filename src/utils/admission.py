@@ -0,0 +1,131 @@
+import math
+import os
+import threading
+import time
+
+# Clases de rutas: consultas, mutaciones y streams (SSE, conexiones largas).
+ROUTE_CLASSES = ('read', 'write', 'stream')
+
+
+class Overloaded(Exception):
+    # El request se rechaza (503); retry_after en segundos enteros.
+    def __init__(self, route_class, retry_after):
+        super().__init__(f"{route_class} requests overloaded")
+        self.route_class = route_class
+        self.retry_after = retry_after
+
+
+class Limiter:
+    # Limite de requests en curso para una clase de rutas, con una cola
+    # corta delante. Se rechaza sin esperar cuando la cola esta llena o
+    # cuando hay sobrecarga, que se decide por el tiempo medido en la cola
+    # (como CoDel): si durante `interval` segundos ningun request entro con
+    # menos de `target` segundos de espera, la cola no se esta vaciando y
+    # esperar solo agrega latencia. Nadie espera mas de `max_wait`.
+    def __init__(self, name, concurrency, queue_size=64, target=0.005, interval=0.1, max_wait=1.0,
+                 clock=time.monotonic):
+        if concurrency < 1:
+            raise ValueError("concurrency must be positive")
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.target = target
+        self.interval = interval
+        self.max_wait = max_wait
+        self._clock = clock
+        self._cond = threading.Condition(threading.Lock())
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = 0
+        self.overloaded = False
+        self._first_above = None
+        # Promedio movil de la duracion de cada request, para Retry-After.
+        self._service = 0.01
+
+    def acquire(self):
+        # Devuelve (instante de admision, segundos en la cola) o lanza
+        # Overloaded. Cada acquire exitoso lleva su release.
+        start = self._clock()
+        with self._cond:
+            if self.active < self.concurrency and not self.waiting:
+                self.active += 1
+                self.admitted += 1
+                self._observe(0.0, start)
+                return start, 0.0
+            if self.waiting >= self.queue_size or self.overloaded:
+                raise self._reject()
+            self.waiting += 1
+            try:
+                deadline = start + self.max_wait
+                while self.active >= self.concurrency:
+                    remaining = deadline - self._clock()
+                    if remaining <= 0:
+                        raise self._reject()
+                    self._cond.wait(remaining)
+            finally:
+                self.waiting -= 1
+            self.active += 1
+            self.admitted += 1
+            now = self._clock()
+            self._observe(now - start, now)
+            return now, now - start
+
+    def release(self, admitted_at):
+        now = self._clock()
+        with self._cond:
+            self.active -= 1
+            self._service += 0.2 * ((now - admitted_at) - self._service)
+            self._cond.notify()
+
+    def _observe(self, waited, now):
+        if waited < self.target:
+            self._first_above = None
+            self.overloaded = False
+        elif self._first_above is None:
+            self._first_above = now + self.interval
+        elif now >= self._first_above:
+            self.overloaded = True
+
+    def _reject(self):
+        # Retry-After: lo que tardaria en vaciarse la cola actual.
+        self.shed += 1
+        drain = (self.waiting + 1) * self._service / self.concurrency
+        return Overloaded(self.name, max(1, math.ceil(drain)))
+
+    def stats(self):
+        with self._cond:
+            return {
+                'concurrency': self.concurrency,
+                'active': self.active,
+                'waiting': self.waiting,
+                'admitted': self.admitted,
+                'shed': self.shed,
+                'overloaded': self.overloaded,
+            }
+
+
+class AdmissionController:
+    def __init__(self, limiters):
+        self.limiters = limiters
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        # Limites de EF_IS_MAX_* y cola de EF_IS_ADMISSION_*; None con
+        # EF_IS_ADMISSION=0.
+        if environ.get('EF_IS_ADMISSION', '1') in ('', '0'):
+            return None
+        queue_size = int(environ.get('EF_IS_ADMISSION_QUEUE', 64))
+        options = {
+            'target': float(environ.get('EF_IS_ADMISSION_TARGET_MS', 5)) / 1e3,
+            'max_wait': float(environ.get('EF_IS_ADMISSION_MAX_WAIT_MS', 1000)) / 1e3,
+        }
+        return cls({
+            'read': Limiter('read', int(environ.get('EF_IS_MAX_READS', 64)), queue_size, **options),
+            'write': Limiter('write', int(environ.get('EF_IS_MAX_WRITES', 4)), queue_size, **options),
+            # Un stream ocupa su lugar mientras dura: no tiene sentido que espere.
+            'stream': Limiter('stream', int(environ.get('EF_IS_MAX_STREAMS', 256)), 0, **options),
+        })
+
+    def stats(self):
+        return {name: limiter.stats() for name, limiter in self.limiters.items()}
@@ -0,0 +1,113 @@
+import json
+
+from pydantic import TypeAdapter, ValidationError
+
+try:
+    from ..models import Ride, RideParticipation, User
+except ImportError:
+    from models import Ride, RideParticipation, User
+
+# Colecciones que se importan y exportan, en este orden: cada una solo
+# referencia a las anteriores (los rides a su conductor y pasajeros, las
+# participaciones a su ride). user_stats no viaja: se reconstruye al importar.
+BULK_COLLECTIONS = ('users', 'rides', 'ride_participations')
+MODELS = {'users': User, 'rides': Ride, 'ride_participations': RideParticipation}
+
+BATCH_SIZE = 1000
+MAX_BATCH_SIZE = 10000
+# Errores que se devuelven con el resultado; del resto solo se cuenta.
+MAX_ERRORS = 100
+
+# Un TypeAdapter por coleccion: un lote se valida con una sola llamada.
+_ADAPTERS = {collection: TypeAdapter(list[model]) for collection, model in MODELS.items()}
+
+
+def to_line(collection, record):
+    # Una linea NDJSON: {"collection": "users", "record": {...}}.
+    return json.dumps({'collection': collection, 'record': record}) + '\n'
+
+
+def parse_line(line):
+    # (coleccion, registro) de una linea, o ValueError con el motivo.
+    try:
+        item = json.loads(line)
+    except ValueError:
+        raise ValueError("Invalid JSON") from None
+    if not isinstance(item, dict):
+        raise ValueError("Expected an object")
+    collection = item.get('collection')
+    if collection not in MODELS:
+        raise ValueError(f"Unknown collection: {collection}")
+    if 'record' not in item:
+        raise ValueError("Missing record")
+    return collection, item['record']
+
+
+class ImportResult:
+    def __init__(self):
+        self.imported = {collection: 0 for collection in BULK_COLLECTIONS}
+        self.failed = 0
+        self.errors = []
+
+    def added(self, collection):
+        self.imported[collection] += 1
+
+    def error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    def to_dict(self):
+        return {'imported': dict(self.imported), 'failed': self.failed, 'errors': list(self.errors)}
+
+
+def read_batches(lines, size, result):
+    # Lotes de hasta `size` entradas (numero de linea, coleccion, registro)
+    # leidos a medida que llegan las lineas: solo un lote esta en memoria.
+    # Las lineas mal formadas se anotan en result y no entran al lote.
+    batch = []
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            collection, record = parse_line(line)
+        except ValueError as e:
+            result.error(number, str(e))
+            continue
+        batch.append((number, collection, record))
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _describe(error):
+    field = '.'.join(str(part) for part in error['loc'][1:])
+    return f"{field}: {error['msg']}" if field else error['msg']
+
+
+def validate_batch(batch, result):
+    # Valida el lote con una llamada por coleccion contra los modelos de
+    # models.py. Devuelve las entradas validas, en el orden de llegada, con
+    # el registro normalizado (model_dump: id None si no vino); las demas se
+    # anotan en result. Solo si hubo errores se valida de nuevo el resto.
+    positions = {}
+    for position, (_, collection, _) in enumerate(batch):
+        positions.setdefault(collection, []).append(position)
+    valid = [None] * len(batch)
+    for collection, members in positions.items():
+        adapter = _ADAPTERS[collection]
+        try:
+            models = adapter.validate_python([batch[position][2] for position in members])
+        except ValidationError as e:
+            invalid = {}
+            for error in e.errors():
+                invalid.setdefault(error['loc'][0], error)
+            for i, error in sorted(invalid.items()):
+                result.error(batch[members[i]][0], _describe(error))
+            members = [position for i, position in enumerate(members) if i not in invalid]
+            models = adapter.validate_python([batch[position][2] for position in members])
+        for position, model in zip(members, models):
+            valid[position] = (batch[position][0], collection, model.model_dump())
+    return [entry for entry in valid if entry is not None]
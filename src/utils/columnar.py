@@ -0,0 +1,424 @@
+import operator
+import sys
+from array import array
+from itertools import repeat
+
+from .gc_pause import paused_gc
+
+# Marca de "clave ausente" en las columnas: el registro no la tenia.
+MISSING = object()
+INT_MIN, INT_MAX = -2 ** 63, 2 ** 63 - 1
+
+# Estados de models.RideParticipation y los que usa DataHandler: ocupan los
+# primeros codigos; cualquier otro valor se agrega al pool al aparecer.
+PARTICIPATION_STATUSES = ('Pendiente', 'Aceptada', 'Rechazada', 'Missing', 'NotMarked',
+                          'Waiting', 'Rejected', 'Confirmed', 'In Progress', 'Done')
+
+# Esquema: campo -> (typecode del array, valores iniciales del pool o None).
+# Los campos con pool guardan un codigo; los demas, el entero.
+PARTICIPATION_SCHEMA = {
+    'id': ('q', None),
+    'confirmation': ('I', ()),
+    'destination': ('I', ()),
+    'occupiedSpaces': ('q', None),
+    'status': ('H', PARTICIPATION_STATUSES),
+    'rideId': ('q', None),
+}
+
+
+class StringPool:
+    # Valor <-> codigo. Las cadenas se internan: todos los registros con el
+    # mismo destino comparten un solo objeto.
+    def __init__(self, initial=()):
+        self.values = []
+        self.codes = {}
+        self.code(MISSING)
+        for value in initial:
+            self.code(value)
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            if isinstance(value, str):
+                value = sys.intern(value)
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class RecordView:
+    # Registro de una ColumnarTable con la interfaz de un dict (get, [],
+    # keys, items...). Cada fila tiene una sola vista, asi los indices y
+    # los `is` de DataHandler siguen funcionando como con dicts.
+    __slots__ = ('_table', '_row')
+    __hash__ = None
+
+    def __init__(self, table, row):
+        self._table = table
+        self._row = row
+
+    # __getitem__ y get leen la columna directamente (sin _get) cuando la
+    # tabla no tiene valores fuera de columna: es el camino de cada acceso.
+
+    def __getitem__(self, key):
+        table = self._table
+        reader = table._readers.get(key)
+        if reader is None or table._extra:
+            return table._get(self._row, key)
+        column, values = reader
+        value = column[self._row] if values is None else values[column[self._row]]
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        table = self._table
+        reader = table._readers.get(key)
+        if reader is None or table._extra:
+            try:
+                return table._get(self._row, key)
+            except KeyError:
+                return default
+        column, values = reader
+        value = column[self._row] if values is None else values[column[self._row]]
+        return default if value is MISSING else value
+
+    def __setitem__(self, key, value):
+        self._table._set(self._row, key, value)
+
+    def keys(self):
+        return self._table._keys(self._row)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __len__(self):
+        return len(self.keys())
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def to_dict(self):
+        return {key: self[key] for key in self.keys()}
+
+    def __eq__(self, other):
+        if isinstance(other, RecordView):
+            other = other.to_dict()
+        if not isinstance(other, dict):
+            return NotImplemented
+        return self.to_dict() == other
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
+class ColumnarTable:
+    # Coleccion de registros guardada por columnas: un array por campo
+    # entero y un array de codigos + StringPool por campo de texto. Lo que
+    # no entra en su columna (otro tipo, claves extra) va a _extra por fila.
+    # Se comporta como la lista de dicts que reemplaza: len, iteracion,
+    # indices, append y remove. Los borrados dejan la fila muerta y se
+    # compactan cuando son mas de la mitad.
+    def __init__(self, schema, records=()):
+        self.schema = schema
+        self._fields = tuple(schema)
+        self._columns = {field: array(typecode) for field, (typecode, _) in schema.items()}
+        self._pools = {field: StringPool(initial) for field, (_, initial) in schema.items()
+                       if initial is not None}
+        self._extra = {}
+        self._readers = {}
+        self._update_readers()
+        self._views = []
+        self._alive = bytearray()
+        self._dead = 0
+        self._positions = None
+        self.extend(records)
+
+    def _update_readers(self):
+        # campo -> (columna, valores del pool o None), para las vistas.
+        self._readers = {field: (column, self._pools[field].values if field in self._pools else None)
+                         for field, column in self._columns.items()}
+
+    # Celdas
+
+    def _get(self, row, key):
+        extra = self._extra.get(row) if self._extra else None
+        if extra is not None and key in extra:
+            value = extra[key]
+        else:
+            column = self._columns.get(key)
+            if column is None:
+                raise KeyError(key)
+            value = column[row]
+            pool = self._pools.get(key)
+            if pool is not None:
+                value = pool.values[value]
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def _set(self, row, key, value):
+        column = self._columns.get(key)
+        extra = self._extra.get(row)
+        if column is not None:
+            pool = self._pools.get(key)
+            if pool is not None:
+                try:
+                    column[row] = pool.code(value)
+                    stored = True
+                except TypeError:
+                    stored = False
+            else:
+                stored = type(value) is int and INT_MIN <= value <= INT_MAX
+                if stored:
+                    column[row] = value
+            if stored:
+                if extra is not None and key in extra:
+                    del extra[key]
+                    if not extra:
+                        del self._extra[row]
+                return
+            if extra is None:
+                extra = self._extra[row] = {}
+            extra[key] = value
+            return
+        if extra is None:
+            extra = self._extra[row] = {}
+        extra[key] = value
+
+    def _keys(self, row):
+        extra = self._extra.get(row) if self._extra else None
+        keys = []
+        for field in self._fields:
+            try:
+                self._get(row, field)
+            except KeyError:
+                continue
+            keys.append(field)
+        if extra:
+            keys.extend(key for key, value in extra.items()
+                        if key not in self._columns and value is not MISSING)
+        return keys
+
+    # Filas
+
+    def append(self, record):
+        row = len(self._views)
+        for field in self._fields:
+            column = self._columns[field]
+            pool = self._pools.get(field)
+            column.append(pool.code(MISSING) if pool is not None else 0)
+            value = record.get(field, MISSING)
+            if value is MISSING:
+                if pool is None:
+                    self._extra.setdefault(row, {})[field] = MISSING
+            else:
+                self._set(row, field, value)
+        for key, value in record.items():
+            if key not in self._columns:
+                self._set(row, key, value)
+        self._views.append(RecordView(self, row))
+        self._alive.append(1)
+        if self._positions is not None:
+            self._positions.append(row)
+
+    def extend(self, records):
+        # Carga masiva por columnas: cada columna se arma de una vez con map.
+        # Si algun registro no encaja en el esquema (no es dict, claves de
+        # mas o de menos, tipos), todo va registro por registro para conservar
+        # el orden.
+        records = list(records)
+        with paused_gc():
+            if not self._extend_columns(records):
+                for record in records:
+                    self.append(record)
+
+    def _extend_columns(self, records):
+        fields = set(self._fields)
+        try:
+            if not all(map(operator.eq, map(dict.keys, records), repeat(fields))):
+                return False
+        except TypeError:
+            return False
+        columns = {}
+        for field in self._fields:
+            values = list(map(operator.itemgetter(field), records))
+            pool = self._pools.get(field)
+            if pool is not None:
+                try:
+                    codes = list(map(pool.codes.get, values))
+                    if None in codes:
+                        for value in set(values):
+                            pool.code(value)
+                        codes = list(map(pool.codes.get, values))
+                except TypeError:
+                    return False
+                values = codes
+            elif set(map(type, values)) - {int}:
+                return False
+            columns[field] = values
+        first = len(self._views)
+        try:
+            for field, values in columns.items():
+                self._columns[field].extend(values)
+        except OverflowError:
+            for column in self._columns.values():
+                del column[first:]
+            return False
+        self._views.extend(map(RecordView, repeat(self), range(first, first + len(records))))
+        self._alive.extend(b'\x01' * len(records))
+        if self._positions is not None:
+            self._positions.extend(range(first, first + len(records)))
+        return True
+
+    def remove(self, view):
+        row = view._row
+        if view._table is not self or not self._alive[row]:
+            raise ValueError("record not in table")
+        self._alive[row] = 0
+        self._dead += 1
+        self._positions = None
+        if self._dead * 2 > len(self._views):
+            self._compact()
+
+    def _compact(self):
+        # Reescribe las columnas sin las filas muertas y renumera las vistas.
+        # Las vistas borradas pasan a una tabla propia de una fila: quien
+        # todavia las tenga sigue leyendo sus valores.
+        for row, alive in enumerate(self._alive):
+            if not alive:
+                view = self._views[row]
+                detached = ColumnarTable(self.schema, [view.to_dict()])
+                view._table, view._row = detached, 0
+        live = [row for row, alive in enumerate(self._alive) if alive]
+        for field, column in self._columns.items():
+            self._columns[field] = array(column.typecode, (column[row] for row in live))
+        self._update_readers()
+        self._extra = {new: self._extra[old] for new, old in enumerate(live) if old in self._extra}
+        views = []
+        for new, old in enumerate(live):
+            view = self._views[old]
+            view._row = new
+            views.append(view)
+        self._views = views
+        self._alive = bytearray(b'\x01' * len(views))
+        self._dead = 0
+        self._positions = None
+
+    def _live_rows(self):
+        if not self._dead:
+            return range(len(self._views))
+        if self._positions is None:
+            self._positions = array('q', (row for row, alive in enumerate(self._alive) if alive))
+        return self._positions
+
+    def __len__(self):
+        return len(self._views) - self._dead
+
+    def __iter__(self):
+        views = self._views
+        if not self._dead:
+            return iter(views)
+        return (views[row] for row in self._live_rows())
+
+    def __getitem__(self, position):
+        rows = self._live_rows()
+        if isinstance(position, slice):
+            return [self._views[row] for row in rows[position]]
+        return self._views[rows[position]]
+
+    def __eq__(self, other):
+        if isinstance(other, ColumnarTable):
+            other = other.to_dicts()
+        if not isinstance(other, list):
+            return NotImplemented
+        return self.to_dicts() == [dict(item) for item in other]
+
+    def __repr__(self):
+        return 'ColumnarTable(%r)' % self.to_dicts()
+
+    # Operaciones por columna
+
+    def to_dicts(self):
+        # Se decodifica columna por columna y se arman los dicts con zip; solo
+        # las filas con claves ausentes o en _extra pasan por su vista.
+        rows = self._live_rows()
+        columns = []
+        missing = set(self._extra)
+        for field in self._fields:
+            column = self._columns[field]
+            if self._dead:
+                column = [column[row] for row in rows]
+            pool = self._pools.get(field)
+            if pool is not None:
+                if 0 in column:
+                    missing.update(rows[i] for i, code in enumerate(column) if code == 0)
+                values = pool.values
+                column = [values[code] for code in column]
+            columns.append(column)
+        records = [dict(zip(self._fields, cells)) for cells in zip(*columns)]
+        if missing:
+            for i, row in enumerate(rows):
+                if row in missing:
+                    records[i] = self._views[row].to_dict()
+        return records
+
+    def max_value(self, field):
+        # Maximo de una columna entera sobre las filas vivas (None si no hay).
+        rows = self._live_rows()
+        column = self._columns[field]
+        if any(field in extra for extra in self._extra.values()):
+            values = (self._views[row].get(field) for row in rows)
+            values = [value for value in values if type(value) is int]
+        elif self._dead:
+            values = (column[row] for row in rows)
+        else:
+            values = column
+        return max(values, default=None)
+
+    def value_counts(self, field, views, default=None):
+        # {valor: cantidad} de un campo con pool sobre las filas de `views`:
+        # se cuentan codigos enteros y se traducen una vez al final. Las filas
+        # sin el campo cuentan como `default` (o no cuentan si es None).
+        column = self._columns[field]
+        pool = self._pools[field]
+        counts = [0] * len(pool.values)
+        overridden = {}
+        for view in views:
+            row = view._row
+            extra = self._extra.get(row) if self._extra else None
+            if extra is not None and field in extra:
+                value = extra[field]
+                overridden[value] = overridden.get(value, 0) + 1
+                continue
+            counts[column[row]] += 1
+        result = {}
+        for value, n in zip(pool.values, counts):
+            if n:
+                result[value] = n
+        for value, n in overridden.items():
+            result[value] = result.get(value, 0) + n
+        absent = result.pop(MISSING, 0)
+        if absent and default is not None:
+            result[default] = result.get(default, 0) + absent
+        return result
+
+    def memory_bytes(self):
+        # Bytes de las columnas, los pools y las vistas (sin los indices).
+        total = sum(column.buffer_info()[1] * column.itemsize for column in self._columns.values())
+        total += sum(sys.getsizeof(pool.values) + sys.getsizeof(pool.codes)
+                     + sum(sys.getsizeof(v) for v in pool.values if isinstance(v, str))
+                     for pool in self._pools.values())
+        total += sys.getsizeof(self._views) + sum(sys.getsizeof(view) for view in self._views)
+        total += len(self._alive)
+        return total
+
+
+def participation_table(records=()):
+    return ColumnarTable(PARTICIPATION_SCHEMA, records)
@@ -0,0 +1,126 @@
+import collections
+import itertools
+import json
+import queue
+import threading
+
+
+class Event:
+    __slots__ = ('id', 'topic', 'type', 'data')
+
+    def __init__(self, id, topic, type, data):
+        self.id = id
+        self.topic = topic
+        self.type = type
+        self.data = data
+
+    def to_sse(self):
+        # Formato text/event-stream: id, tipo y una linea de datos JSON.
+        return 'id: %d\nevent: %s\ndata: %s\n\n' % (self.id, self.type, json.dumps(self.data))
+
+
+class Subscription:
+    # Cola acotada de eventos de un topic para un suscriptor. Si se llena
+    # (el cliente no lee a tiempo) el hub la marca como descartada: get
+    # devuelve lo que quedaba y despues el stream se cierra, y el cliente se
+    # reconecta con Last-Event-ID.
+    def __init__(self, hub, topic, size):
+        self.hub = hub
+        self.topic = topic
+        self.dropped = False
+        # True si el Last-Event-ID pedido ya no esta en el buffer de replay;
+        # last_id es el ultimo evento publicado al suscribirse.
+        self.gap = False
+        self.last_id = 0
+        self._queue = queue.Queue(size)
+
+    def _offer(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped = True
+            return False
+        return True
+
+    def get(self, timeout=None):
+        # Proximo evento, o None si no llego ninguno en `timeout` segundos.
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    @property
+    def done(self):
+        # Descartada y sin eventos pendientes: el stream debe cerrarse.
+        return self.dropped and self._queue.empty()
+
+    def close(self):
+        self.hub._unsubscribe(self)
+
+
+class EventHub:
+    # Pub/sub en memoria del proceso. Cada evento lleva un id creciente y se
+    # guarda en un buffer de los ultimos `replay` eventos para retomar un
+    # stream desde un Last-Event-ID. Publicar nunca espera a un suscriptor:
+    # el que tiene la cola llena (queue_size) se descarta.
+    def __init__(self, replay=1000, queue_size=100):
+        self.queue_size = queue_size
+        self._ids = itertools.count(1)
+        self._buffer = collections.deque(maxlen=replay)
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self.published = 0
+        self.dropped = 0
+
+    def publish(self, topic, type, data):
+        with self._lock:
+            event = Event(next(self._ids), topic, type, data)
+            self._buffer.append(event)
+            self.published += 1
+            for subscription in list(self._subscribers.get(topic, ())):
+                if not subscription._offer(event):
+                    self.dropped += 1
+                    self._remove(subscription)
+        return event
+
+    def subscribe(self, topic, last_event_id=None):
+        # Con last_event_id la cola arranca con los eventos del topic
+        # posteriores a ese id que sigan en el buffer.
+        subscription = Subscription(self, topic, self.queue_size)
+        with self._lock:
+            newest = self._buffer[-1].id if self._buffer else 0
+            subscription.last_id = newest
+            if last_event_id is not None:
+                # Hay hueco si faltan eventos que ya salieron del buffer, o si
+                # el id es de antes de reiniciar el proceso.
+                oldest = self._buffer[0].id if self._buffer else None
+                missed = [event for event in self._buffer
+                          if event.id > last_event_id and event.topic == topic]
+                if (oldest is not None and last_event_id < oldest - 1) or last_event_id > newest \
+                        or len(missed) > self.queue_size:
+                    subscription.gap = True
+                else:
+                    for event in missed:
+                        subscription._offer(event)
+            self._subscribers.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def _remove(self, subscription):
+        subscribers = self._subscribers.get(subscription.topic)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.topic]
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            self._remove(subscription)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'published': self.published,
+                'dropped': self.dropped,
+                'subscribers': sum(len(s) for s in self._subscribers.values()),
+                'buffered': len(self._buffer),
+            }
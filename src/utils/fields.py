@@ -0,0 +1,77 @@
+# Proyecciones ?fields=: una lista de rutas separadas por comas, con puntos
+# para entrar en objetos y listas de objetos (participants.participant.alias).
+# Se representan como arbol {campo: subarbol}; None es "el campo completo".
+
+USER_FIELDS = dict.fromkeys(('id', 'alias', 'name', 'carPlate', 'rides'))
+
+# Contadores de cada participante en get_ride_details y el estado que cuenta
+# cada uno, en el orden en que se muestran.
+PARTICIPANT_COUNTERS = {
+    'previousRidesTotal': 'Pendiente',
+    'previousRidesCompleted': 'Aceptada',
+    'previousRidesMissing': 'Missing',
+    'previousRidesNotMarked': 'NotMarked',
+    'previousRidesRejected': 'Rechazada',
+}
+
+RIDE_DETAIL_FIELDS = {
+    'id': None,
+    'rideDateAndTime': None,
+    'finalAddress': None,
+    'driver': None,
+    'status': None,
+    'participants': {
+        'confirmation': None,
+        'participant': dict.fromkeys(('alias',) + tuple(PARTICIPANT_COUNTERS)),
+        'destination': None,
+        'occupiedSpaces': None,
+        'status': None,
+    },
+}
+
+
+def parse_fields(spec, schema):
+    # Arbol de `spec` validado contra `schema`, o None si no se pidio
+    # proyeccion. ValueError si alguna ruta no existe. Pedir un campo
+    # completo y tambien algo dentro de el deja el campo completo.
+    if spec is None:
+        return None
+    tree = {}
+    for path in spec.split(','):
+        names = path.strip().split('.')
+        node, allowed = tree, schema
+        for depth, name in enumerate(names):
+            if allowed is None or name not in allowed:
+                raise ValueError(f"Unknown field: {path.strip()}")
+            allowed = allowed[name]
+            if depth == len(names) - 1:
+                node[name] = None
+            elif node.setdefault(name, {}) is None:
+                break
+            else:
+                node = node[name]
+    return tree
+
+
+def includes(fields, *path):
+    # True si la proyeccion pide `path` o algo dentro de el.
+    node = fields
+    for name in path:
+        if node is None:
+            return True
+        if name not in node:
+            return False
+        node = node[name]
+    return True
+
+
+def project(value, fields):
+    # Copia de value con solo los campos del arbol, en su orden original.
+    # Las listas se proyectan elemento por elemento.
+    if fields is None:
+        return value
+    if isinstance(value, list):
+        return [project(item, fields) for item in value]
+    if not isinstance(value, dict):
+        return value
+    return {key: project(item, fields[key]) for key, item in value.items() if key in fields}
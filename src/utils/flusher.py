@@ -0,0 +1,85 @@
+import threading
+import time
+
+
+class Flusher:
+    # Hilo que llama a flush() cada `interval` segundos, o antes si se
+    # encolaron `every` cambios desde el ultimo flush. queue() devuelve un
+    # numero de secuencia y wait(seq) bloquea hasta que un flush lo cubra.
+    def __init__(self, flush, interval=0.05, every=100):
+        self._flush = flush
+        self.interval = interval
+        self.every = every
+        self._cond = threading.Condition()
+        self._queued = 0
+        self._flushed = 0
+        self._error = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='data-flusher', daemon=True)
+        self._thread.start()
+
+    def queue(self):
+        with self._cond:
+            self._queued += 1
+            if self._queued - self._flushed >= self.every:
+                self._cond.notify_all()
+            return self._queued
+
+    def wait(self, seq):
+        with self._cond:
+            while self._flushed < seq:
+                if self._error is not None:
+                    raise self._error
+                if not self._thread.is_alive():
+                    raise RuntimeError("Flusher is closed")
+                self._cond.wait()
+
+    def pending(self):
+        with self._cond:
+            return self._queued - self._flushed
+
+    def _run(self):
+        backoff = False
+        while True:
+            with self._cond:
+                if backoff:
+                    # Tras un flush fallido se espera el intervalo completo
+                    # aunque haya `every` cambios encolados: solo close()
+                    # lo corta.
+                    deadline = time.monotonic() + self.interval
+                    while not self._closed and time.monotonic() < deadline:
+                        self._cond.wait(deadline - time.monotonic())
+                elif not self._closed and self._queued - self._flushed < self.every:
+                    self._cond.wait(self.interval)
+                target = self._queued
+                closed = self._closed
+            if target > self._flushed:
+                try:
+                    self._flush()
+                except Exception as e:
+                    # Se reintenta en el proximo intervalo; quien espera ve el error.
+                    with self._cond:
+                        self._error = e
+                        self._cond.notify_all()
+                    if closed:
+                        return
+                    backoff = True
+                    continue
+                backoff = False
+                with self._cond:
+                    self._flushed = target
+                    self._error = None
+                    self._cond.notify_all()
+            if closed:
+                return
+
+    def close(self):
+        # Escribe lo pendiente y termina el hilo.
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        with self._cond:
+            self._cond.notify_all()
+        if self._error is not None:
+            raise self._error
@@ -0,0 +1,28 @@
+import gc
+import threading
+from contextlib import contextmanager
+
+_lock = threading.Lock()
+_depth = 0
+_was_enabled = False
+
+
+@contextmanager
+def paused_gc():
+    # Crear cientos de miles de objetos (dicts de una carga, vistas de una
+    # tabla) dispara colecciones del GC que no pueden liberar nada: se pausa
+    # mientras dura el bloque. Con bloques en varios hilos a la vez, el GC
+    # vuelve a su estado cuando termina el ultimo.
+    global _depth, _was_enabled
+    with _lock:
+        if _depth == 0:
+            _was_enabled = gc.isenabled()
+            gc.disable()
+        _depth += 1
+    try:
+        yield
+    finally:
+        with _lock:
+            _depth -= 1
+            if _depth == 0 and _was_enabled:
+                gc.enable()
@@ -0,0 +1,84 @@
+import bisect
+
+
+class Index:
+    # Mapa en memoria atributo -> registro (unique) o atributo -> [registros].
+    def __init__(self, attribute, unique=True):
+        self.attribute = attribute
+        self.unique = unique
+        self._map = {}
+        self._sorted = None
+
+    def rebuild(self, items):
+        attribute = self.attribute
+        if self.unique:
+            # Recorrido inverso: ante claves repetidas gana el primer registro,
+            # igual que en _insert.
+            mapping = {item.get(attribute): item for item in reversed(items)}
+        else:
+            mapping = {}
+            for item in items:
+                key = item.get(attribute)
+                bucket = mapping.get(key)
+                if bucket is None:
+                    mapping[key] = [item]
+                else:
+                    bucket.append(item)
+        self._map = mapping
+        self._sorted = None
+
+    def _insert(self, mapping, item):
+        key = item.get(self.attribute)
+        if self.unique:
+            mapping.setdefault(key, item)
+        else:
+            mapping.setdefault(key, []).append(item)
+
+    def add(self, item):
+        self._insert(self._map, item)
+        self._sorted = None
+
+    def remove(self, item):
+        key = item.get(self.attribute)
+        self._sorted = None
+        if self.unique:
+            if self._map.get(key) is item:
+                del self._map[key]
+            return
+        bucket = self._map.get(key)
+        if not bucket:
+            return
+        for i, current in enumerate(bucket):
+            if current is item:
+                del bucket[i]
+                break
+        if not bucket:
+            del self._map[key]
+
+    def get(self, value):
+        if self.unique:
+            return self._map.get(value)
+        return self._map.get(value, [])
+
+    def first(self, value):
+        if self.unique:
+            return self._map.get(value)
+        bucket = self._map.get(value)
+        return bucket[0] if bucket else None
+
+    def page(self, limit, after=None):
+        # Registros (unique) en orden de clave a partir de la siguiente a
+        # after, y la clave a usar como proximo cursor (None si no hay mas).
+        # Las claves ordenadas se calculan una vez por cada cambio del indice.
+        if self._sorted is None:
+            self._sorted = sorted(self._map)
+        start = 0 if after is None else bisect.bisect_right(self._sorted, after)
+        keys = self._sorted[start:start + limit]
+        cursor = keys[-1] if keys and start + limit < len(self._sorted) else None
+        return [self._map[key] for key in keys], cursor
+
+    def keys(self):
+        return self._map.keys()
+
+    def __len__(self):
+        return len(self._map)
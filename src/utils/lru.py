@@ -0,0 +1,73 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    # Cache LRU acotada por cantidad (maxsize) y antiguedad (ttl, segundos;
+    # None = sin limite). Cada valor se guarda con la version de lo que lo
+    # produjo: get con otra version lo descarta (stale). El lock cubre el
+    # reordenamiento, porque las lecturas del handler corren en paralelo.
+    def __init__(self, maxsize=1024, ttl=None, clock=time.monotonic):
+        if maxsize < 1:
+            raise ValueError("maxsize must be positive")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def get(self, key, version):
+        # Valor guardado para key con esta version, o None.
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_version, stored_at, value = entry
+            if stored_version != version:
+                self.stale += 1
+            elif self.ttl is not None and self._clock() - stored_at > self.ttl:
+                self.expired += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, version, value):
+        with self._lock:
+            self._entries[key] = (version, self._clock(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale': self.stale,
+            'expired': self.expired,
+            'evictions': self.evictions,
+            'size': len(self._entries),
+            'hitRate': self.hits / total if total else 0.0,
+        }
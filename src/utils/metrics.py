@@ -0,0 +1,221 @@
+import bisect
+import math
+import threading
+import weakref
+
+# Limites (en segundos) de los histogramas de latencia: de 50us a 10s.
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('%s="%s"' % (name, _escape(value)) for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Shards:
+    # Un dict por hilo: cada hilo escribe solo el suyo, sin locks, y quien
+    # exporta suma copias de todos (dict.copy es atomico con el GIL). Cuando
+    # un hilo termina, su dict se suma a `retired` y se descarta: con un hilo
+    # por request (app.run) la cantidad de dicts no crece sin limite.
+    # `merge(into, shard)` suma un dict sobre otro.
+    def __init__(self, merge):
+        self.local = threading.local()
+        self.merge = merge
+        self._all = {}
+        self._dead = []
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def mine(self):
+        # Solo la primera vez en cada hilo; despues se lee local.values.
+        values = self.local.values = {}
+        # El finalizer corre en cualquier hilo (incluso dentro del lock):
+        # solo anota el dict, lo suma el proximo mine() o totals().
+        weakref.finalize(threading.current_thread(), self._dead.append, id(values))
+        with self._lock:
+            self._reap()
+            self._all[id(values)] = values
+        return values
+
+    def _reap(self):
+        while self._dead:
+            self.merge(self._retired, self._all.pop(self._dead.pop()))
+
+    def totals(self):
+        with self._lock:
+            self._reap()
+            shards = [self._retired] + list(self._all.values())
+            copies = [shard.copy() for shard in shards]
+        totals = {}
+        for shard in copies:
+            self.merge(totals, shard)
+        return totals
+
+
+class Counter:
+    # Contador por combinacion de etiquetas (tupla de valores en el orden de
+    # `labels`). Registrar es una suma en el dict del hilo; el texto se arma
+    # solo cuando alguien lee /metrics.
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._shards = _Shards(self._merge)
+        self._local = self._shards.local
+
+    def inc(self, labels=(), amount=1):
+        try:
+            values = self._local.values
+        except AttributeError:
+            values = self._shards.mine()
+        values[labels] = values.get(labels, 0) + amount
+
+    @staticmethod
+    def _merge(totals, shard):
+        for key, value in shard.items():
+            totals[key] = totals.get(key, 0) + value
+
+    def _totals(self):
+        return self._shards.totals()
+
+    def value(self, labels=()):
+        return self._totals().get(labels, 0)
+
+    def render(self):
+        values = sorted(self._totals().items())
+        return ['%s%s %s' % (self.name, _format_labels(self.labels, key), _format_value(value))
+                for key, value in values]
+
+
+class Gauge:
+    # Valor actual por combinacion de etiquetas (largo de una cola, requests
+    # en curso). Se arma al exportar, no se actualiza en cada request.
+    kind = 'gauge'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+
+    def set(self, labels=(), value=0):
+        self._values[labels] = value
+
+    def value(self, labels=()):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        return ['%s%s %s' % (self.name, _format_labels(self.labels, key), _format_value(value))
+                for key, value in sorted(self._values.items())]
+
+
+class Histogram:
+    # Histograma acumulativo al estilo Prometheus: por combinacion de
+    # etiquetas guarda el conteo de cada bucket, la suma y el total.
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._shards = _Shards(self._merge)
+        self._local = self._shards.local
+
+    def observe(self, value, labels=()):
+        try:
+            values = self._local.values
+        except AttributeError:
+            values = self._shards.mine()
+        series = values.get(labels)
+        if series is None:
+            series = values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @staticmethod
+    def _merge(totals, shard):
+        # Una lectura concurrente con un observe puede ver el bucket ya
+        # sumado y el total todavia no; el proximo scrape lo corrige.
+        for key, (counts, total, count) in shard.items():
+            merged = totals.get(key)
+            if merged is None:
+                totals[key] = [list(counts), total, count]
+                continue
+            merged[0] = [a + b for a, b in zip(merged[0], counts)]
+            merged[1] += total
+            merged[2] += count
+
+    def _totals(self):
+        return self._shards.totals()
+
+    def count(self, labels=()):
+        series = self._totals().get(labels)
+        return series[2] if series else 0
+
+    def render(self):
+        series = sorted(self._totals().items())
+        lines = []
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                lines.append('%s_bucket%s %d' % (
+                    self.name, _format_labels(self.labels, key, [('le', _format_value(float(bound)))]),
+                    cumulative))
+            lines.append('%s_sum%s %s' % (self.name, _format_labels(self.labels, key), repr(total)))
+            lines.append('%s_count%s %d' % (self.name, _format_labels(self.labels, key), count))
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric already registered: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def render(self, extra=()):
+        # Formato de texto de Prometheus (version 0.0.4). `extra` son metricas
+        # armadas al momento de leer (p. ej. contadores que lleva el backend).
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in sorted(metrics + list(extra), key=lambda m: m.name):
+            lines.append('# HELP %s %s' % (metric.name, metric.help))
+            lines.append('# TYPE %s %s' % (metric.name, metric.kind))
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# Registro del proceso: controller y DataHandler registran aqui sus metricas.
+REGISTRY = Registry()
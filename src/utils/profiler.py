@@ -0,0 +1,146 @@
+import cProfile
+import hmac
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+PROFILE_HEADER = 'X-EF-IS-Profile'
+MODES = ('cprofile', 'sampling')
+
+
+class StackSampler:
+    # Profiler por muestreo de un solo hilo: cada `interval` segundos otro
+    # hilo lee su pila con sys._current_frames() y cuenta las pilas iguales.
+    # El resultado es el formato "folded" (raiz;...;hoja N) que leen
+    # flamegraph.pl y speedscope. Cuesta poco al hilo medido; el costo lo paga
+    # el hilo que muestrea.
+    def __init__(self, thread_id, interval=0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename),
+                                             code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                key = ';'.join(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            for stack, count in sorted(self.counts.items()):
+                f.write('%s %d\n' % (stack, count))
+
+
+class RequestProfiler:
+    # Perfila requests completos y guarda en `directory` los que tardan mas
+    # de threshold_ms (o todos los pedidos con el header y el token), con un
+    # .json al lado con la ruta, los parametros y la duracion. Solo quedan
+    # los ultimos `keep` perfiles.
+    def __init__(self, directory='profiles', threshold_ms=100.0, keep=50, always=False,
+                 token=None, mode='cprofile'):
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiler mode: {mode}")
+        self.directory = directory
+        self.threshold_ms = threshold_ms
+        self.keep = keep
+        self.always = always
+        self.token = token
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._sequence = 0
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        # Activo con EF_IS_PROFILE=1 (todos los requests) o con
+        # EF_IS_PROFILE_TOKEN (solo los que traen el header); si no, None.
+        always = environ.get('EF_IS_PROFILE', '') not in ('', '0')
+        token = environ.get('EF_IS_PROFILE_TOKEN') or None
+        if not always and token is None:
+            return None
+        return cls(directory=environ.get('EF_IS_PROFILE_DIR', 'profiles'),
+                   threshold_ms=float(environ.get('EF_IS_PROFILE_THRESHOLD_MS', 100)),
+                   keep=int(environ.get('EF_IS_PROFILE_KEEP', 50)),
+                   always=always, token=token,
+                   mode=environ.get('EF_IS_PROFILE_MODE', 'cprofile'))
+
+    def wanted(self, header_value):
+        # (perfilar, guardar aunque sea rapido). El header solo cuenta si
+        # trae el token configurado. Se comparan bytes: compare_digest no
+        # acepta str con caracteres fuera de ASCII.
+        requested = (self.token is not None and header_value is not None
+                     and hmac.compare_digest(header_value.encode(), self.token.encode()))
+        return self.always or requested, requested
+
+    def start(self):
+        if self.mode == 'sampling':
+            profile = StackSampler(threading.get_ident())
+            profile.start()
+        else:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Ya hay otro profiler activo en este hilo.
+                return None
+        return profile, time.perf_counter()
+
+    def finish(self, started, tags, keep_anyway=False):
+        # Devuelve la ruta del perfil guardado, o None si fue rapido.
+        profile, start = started
+        if self.mode == 'sampling':
+            profile.stop()
+        else:
+            profile.disable()
+        duration_ms = (time.perf_counter() - start) * 1e3
+        if duration_ms < self.threshold_ms and not keep_anyway:
+            return None
+
+        with self._lock:
+            self._sequence += 1
+            slug = re.sub(r'[^A-Za-z0-9]+', '_', tags.get('route') or 'unmatched').strip('_')
+            base = os.path.join(self.directory, '%s-%06d-%s-%s-%dms' % (
+                time.strftime('%Y%m%dT%H%M%S'), self._sequence, tags.get('method', ''),
+                slug or 'root', duration_ms))
+            os.makedirs(self.directory, exist_ok=True)
+            if self.mode == 'sampling':
+                path = base + '.folded'
+                profile.dump(path)
+            else:
+                path = base + '.pstats'
+                profile.dump_stats(path)
+            with open(base + '.json', 'w') as f:
+                json.dump(dict(tags, durationMs=round(duration_ms, 3), mode=self.mode,
+                               profile=os.path.basename(path)), f, indent=2)
+            self._prune()
+        return path
+
+    def _prune(self):
+        # Los nombres empiezan con fecha y secuencia: el orden alfabetico es
+        # el de creacion.
+        bases = sorted({name.rsplit('.', 1)[0] for name in os.listdir(self.directory)
+                        if name.endswith(('.pstats', '.folded', '.json'))})
+        for base in bases[:max(0, len(bases) - self.keep)]:
+            for suffix in ('.pstats', '.folded', '.json'):
+                try:
+                    os.unlink(os.path.join(self.directory, base + suffix))
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,145 @@
+import bisect
+import re
+import unicodedata
+from datetime import datetime
+
+ACCEPTED = 'Aceptada'
+_TOKEN = re.compile(r'\w+')
+# Cuantos elementos de una interseccion de sets (en C) cuestan lo mismo que
+# revisar un ride del rango de tiempo en Python; medido con ~10^4-10^6 rides.
+SET_ELEMENTS_PER_SCAN_STEP = 10
+
+
+def parse_ride_time(value):
+    # rideDateAndTime es "YYYY-MM-DD HH:MM"; lo que no se puede leer queda al
+    # final del orden temporal.
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return datetime.max
+
+
+def tokenize(text):
+    # Minusculas y sin tildes: "Universidad Central - Campus Norte" ->
+    # {'universidad', 'central', 'campus', 'norte'}.
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return set(_TOKEN.findall(text.lower()))
+
+
+class RideSearch:
+    # Indices de busqueda de rides mantenidos de forma incremental:
+    # - orden temporal: claves de tiempo ordenadas (bisect) con sus ids;
+    # - indice invertido token de finalAddress -> ids de rides;
+    # - participaciones aceptadas por ride, para los asientos libres.
+    # Las recargas corren bajo el lock de lectura, junto a busquedas en curso:
+    # rebuild_* arma estructuras nuevas y las publica con una sola asignacion
+    # (_index guarda juntos rides, entradas, orden temporal y tokens). Los
+    # update_* modifican en su lugar, bajo el lock de escritura.
+    def __init__(self):
+        self._index = ({}, {}, [], [], {})
+        self._accepted = {}
+
+    def rebuild_rides(self, rides):
+        by_id, entries, tokens = {}, {}, {}
+        pairs = []
+        for ride in rides:
+            if ride['id'] in by_id:
+                continue
+            entry = (parse_ride_time(ride.get('rideDateAndTime')), tokenize(ride.get('finalAddress')))
+            by_id[ride['id']] = ride
+            entries[ride['id']] = entry
+            pairs.append((entry[0], ride['id']))
+            for token in entry[1]:
+                tokens.setdefault(token, set()).add(ride['id'])
+        pairs.sort()
+        self._index = (by_id, entries, [time for time, _ in pairs],
+                       [ride_id for _, ride_id in pairs], tokens)
+
+    def rebuild_participations(self, participations):
+        accepted = {}
+        for participation in participations:
+            if participation.get('status') == ACCEPTED:
+                accepted.setdefault(participation.get('rideId'), set()).add(participation['id'])
+        self._accepted = accepted
+
+    def update_ride(self, ride, removed=False):
+        by_id, entries, times, time_ids, tokens = self._index
+        ride_id = ride['id']
+        entry = (parse_ride_time(ride.get('rideDateAndTime')), tokenize(ride.get('finalAddress')))
+        if not removed and entries.get(ride_id) == entry:
+            # Cambio de status o participantes: los indices no se tocan.
+            by_id[ride_id] = ride
+            return
+        old = entries.pop(ride_id, None)
+        if old is not None:
+            position = bisect.bisect_left(times, old[0])
+            while time_ids[position] != ride_id:
+                position += 1
+            del times[position]
+            del time_ids[position]
+            for token in old[1]:
+                bucket = tokens[token]
+                bucket.discard(ride_id)
+                if not bucket:
+                    del tokens[token]
+        by_id.pop(ride_id, None)
+        if removed:
+            return
+        by_id[ride_id] = ride
+        entries[ride_id] = entry
+        position = bisect.bisect_right(times, entry[0])
+        times.insert(position, entry[0])
+        time_ids.insert(position, ride_id)
+        for token in entry[1]:
+            tokens.setdefault(token, set()).add(ride_id)
+
+    def update_participation(self, participation, removed=False):
+        accepted = self._accepted.setdefault(participation.get('rideId'), set())
+        if not removed and participation.get('status') == ACCEPTED:
+            accepted.add(participation['id'])
+        else:
+            accepted.discard(participation['id'])
+
+    def free_seats(self, ride):
+        return ride.get('allowedSpaces', 0) - len(self._accepted.get(ride['id'], ()))
+
+    def search(self, start=None, end=None, destination=None, min_seats=None, limit=None):
+        # Rides en orden temporal con start <= hora <= end, cuyo finalAddress
+        # contiene todos los tokens de destination y con al menos min_seats
+        # asientos libres. Se parte del conjunto de candidatos mas chico (rango
+        # de tiempo o el token menos frecuente) y se filtra por lo demas.
+        by_id, entries, times, time_ids, index = self._index
+        low = 0 if start is None else bisect.bisect_left(times, start)
+        high = len(times) if end is None else bisect.bisect_right(times, end)
+        tokens = tokenize(destination)
+        buckets = sorted((index.get(token, set()) for token in tokens), key=len)
+        # Recorrer el rango de tiempo cuesta high - low pasos, o menos si hay
+        # limit: se corta tras ~limit / selectividad de los tokens (suponiendo
+        # tokens independientes).
+        scan = high - low
+        if buckets and limit is not None and times:
+            selectivity = 1.0
+            for bucket in buckets:
+                selectivity *= len(bucket) / len(times)
+            if selectivity:
+                scan = min(scan, limit / selectivity)
+        if buckets and len(buckets[0]) < scan * SET_ELEMENTS_PER_SCAN_STEP:
+            matches = set.intersection(*buckets)
+            candidates = sorted((entries[ride_id][0], ride_id) for ride_id in matches)
+            candidates = [ride_id for time, ride_id in candidates
+                          if (start is None or time >= start) and (end is None or time <= end)]
+        else:
+            candidates = (time_ids[i] for i in range(low, high))
+            if buckets:
+                candidates = (ride_id for ride_id in candidates
+                              if all(ride_id in bucket for bucket in buckets))
+        results = []
+        for ride_id in candidates:
+            ride = by_id[ride_id]
+            if min_seats is not None and self.free_seats(ride) < min_seats:
+                continue
+            results.append(ride)
+            if limit is not None and len(results) >= limit:
+                break
+        return results
@@ -0,0 +1,80 @@
+import threading
+from contextlib import contextmanager
+
+
+class RWLock:
+    # Varios lectores a la vez o un solo escritor. Un escritor en espera
+    # bloquea a los lectores nuevos para no quedar postergado. Es reentrante
+    # por hilo: un lector puede volver a leer y un escritor puede leer o
+    # escribir de nuevo; pasar de lectura a escritura no esta permitido.
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._waiting_writers = 0
+        self._writer = None
+        self._writer_depth = 0
+        self._local = threading.local()
+
+    def acquire_read(self):
+        local = self._local
+        depth = getattr(local, 'depth', 0)
+        if depth or self._writer == threading.get_ident():
+            local.depth = depth + 1
+            return
+        with self._cond:
+            while self._writer is not None or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        local.depth = 1
+        local.reader = True
+
+    def release_read(self):
+        local = self._local
+        local.depth -= 1
+        if local.depth or not getattr(local, 'reader', False):
+            return
+        local.reader = False
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._writer_depth += 1
+                return
+            if getattr(self._local, 'depth', 0):
+                raise RuntimeError("Cannot upgrade a read lock to a write lock")
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = me
+            self._writer_depth = 1
+
+    def release_write(self):
+        with self._cond:
+            self._writer_depth -= 1
+            if not self._writer_depth:
+                self._writer = None
+                self._cond.notify_all()
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
@@ -0,0 +1,140 @@
+import bisect
+
+try:
+    from .ride_search import parse_ride_time
+except ImportError:
+    from utils.ride_search import parse_ride_time
+
+
+class UserRides:
+    # Proyeccion "mis rides": por usuario, una entrada por participacion con
+    # su estado y los datos del ride (fecha, destino, alias del conductor,
+    # estado del ride). Cada usuario se arma la primera vez que se pide y
+    # desde ahi se mantiene con cada cambio de rides, participaciones y
+    # usuarios; recargar cualquiera de esas colecciones la descarta.
+    #
+    # participation/ride/user resuelven un id al registro actual (o None).
+    def __init__(self, participation, ride, user):
+        self._participation = participation
+        self._ride = ride
+        self._user = user
+        self.clear()
+
+    def clear(self):
+        # Dicts nuevos, no .clear(): una consulta en curso sigue leyendo los
+        # anteriores sin ver la proyeccion a medio vaciar.
+        self._users = {}
+        self._owned = {}
+        self._owners = {}
+        self._meta = {}
+        self._by_ride = {}
+        self._by_driver = {}
+
+    def entries(self, user):
+        # {participation_id: entrada} del usuario, armandolo si hace falta.
+        # El dict se publica ya completo.
+        entries = self._users.get(user['id'])
+        if entries is None:
+            entries = {}
+            owned = set(user.get('rides', []))
+            for participation_id in owned:
+                self._owners[participation_id] = user['id']
+                self._refresh(participation_id, entries)
+            self._owned[user['id']] = owned
+            self._users[user['id']] = entries
+        return entries
+
+    def update(self, collection, item, removed=False):
+        if collection == 'ride_participations':
+            if item['id'] in self._owners:
+                self._refresh(item['id'], removed=removed)
+        elif collection == 'rides':
+            for participation_id in list(self._by_ride.get(item['id'], ())):
+                self._refresh(participation_id)
+        elif collection == 'users':
+            self._update_user(item, removed)
+
+    def _update_user(self, user, removed):
+        owned = self._owned.get(user['id'])
+        if owned is not None:
+            entries = self._users[user['id']]
+            current = set() if removed else set(user.get('rides', []))
+            for participation_id in owned - current:
+                del self._owners[participation_id]
+                self._drop(participation_id, entries)
+            for participation_id in current - owned:
+                self._owners[participation_id] = user['id']
+                self._refresh(participation_id, entries)
+            if removed:
+                del self._users[user['id']]
+                del self._owned[user['id']]
+            else:
+                self._owned[user['id']] = current
+        # Entradas donde el usuario es el conductor (cambio de alias).
+        for participation_id in list(self._by_driver.get(user['id'], ())):
+            self._refresh(participation_id)
+
+    def _refresh(self, participation_id, entries=None, removed=False):
+        # Recalcula la entrada desde los registros actuales. Una participacion
+        # que todavia no existe (o ya no) queda asignada al usuario sin entrada.
+        if entries is None:
+            entries = self._users[self._owners[participation_id]]
+        self._drop(participation_id, entries)
+        participation = None if removed else self._participation(participation_id)
+        if participation is None:
+            return
+        ride_id = participation.get('rideId')
+        ride = self._ride(ride_id)
+        driver_id = ride.get('rideDriver') if ride else None
+        driver = self._user(driver_id) if driver_id is not None else None
+        entries[participation_id] = {
+            "participationId": participation_id,
+            "rideId": ride_id,
+            "rideDateAndTime": ride.get('rideDateAndTime') if ride else None,
+            "finalAddress": ride.get('finalAddress') if ride else None,
+            "driver": driver['alias'] if driver else None,
+            "rideStatus": ride.get('status') if ride else None,
+            "status": participation.get('status'),
+            "confirmation": participation.get('confirmation'),
+            "destination": participation.get('destination'),
+            "occupiedSpaces": participation.get('occupiedSpaces'),
+        }
+        time = parse_ride_time(ride.get('rideDateAndTime')) if ride else None
+        self._meta[participation_id] = (ride_id, driver_id, time)
+        self._by_ride.setdefault(ride_id, set()).add(participation_id)
+        if driver_id is not None:
+            self._by_driver.setdefault(driver_id, set()).add(participation_id)
+
+    def _drop(self, participation_id, entries):
+        entries.pop(participation_id, None)
+        meta = self._meta.pop(participation_id, None)
+        if meta is None:
+            return
+        ride_id, driver_id, _ = meta
+        for groups, key in ((self._by_ride, ride_id), (self._by_driver, driver_id)):
+            group = groups.get(key)
+            if group is not None:
+                group.discard(participation_id)
+                if not group:
+                    del groups[key]
+
+    def page(self, entries, limit=None, after=None, statuses=None, start=None, end=None):
+        # (entradas, proximo cursor) en orden de id de participacion, con
+        # los filtros: estado de la participacion en `statuses` y
+        # start <= rideDateAndTime <= end.
+        ids = sorted(entries)
+        position = 0 if after is None else bisect.bisect_right(ids, after)
+        results = []
+        for participation_id in ids[position:]:
+            entry = entries[participation_id]
+            if statuses and entry['status'] not in statuses:
+                continue
+            if start is not None or end is not None:
+                time = self._meta[participation_id][2]
+                if time is None or (start is not None and time < start) \
+                        or (end is not None and time > end):
+                    continue
+            if limit is not None and len(results) == limit:
+                return results, results[-1]['participationId']
+            results.append(entry)
+        return results, None
@@ -0,0 +1,19 @@
+class VersionClock:
+    # Reloj monotono compartido por varias claves: cada cambio guarda en su
+    # clave el valor nuevo del reloj, asi el maximo sobre un conjunto de
+    # claves cambia siempre que cambie cualquiera de ellas.
+    def __init__(self):
+        self._clock = 0
+        self._versions = {}
+
+    def bump(self, *keys):
+        self._clock += 1
+        for key in keys:
+            self._versions[key] = self._clock
+        return self._clock
+
+    def get(self, key):
+        return self._versions.get(key, 0)
+
+    def latest(self, keys):
+        return max((self._versions.get(key, 0) for key in keys), default=0)